@@ -0,0 +1,365 @@
+#! /bin/env python3
+
+# Per-artist and per-collection aggregates of the output, updated with
+# every batch of rows written, so questions about the crawl are answered
+# from a few small tables instead of by grouping the whole output.
+#
+#   python3 aggregates.py aggregates.db ranking --metric views -n 10
+#   python3 aggregates.py aggregates.db summary URL
+#   python3 aggregates.py aggregates.db collections URL
+#   python3 aggregates.py aggregates.db top URL --metric likes
+#   python3 aggregates.py aggregates.db uploads URL
+#   python3 aggregates.py aggregates.db rebuild data.csv
+
+from pathlib import Path
+import threading as t
+import pandas as pd
+import argparse
+import sqlite3
+import time
+
+from database import CHUNK_SIZE, sql_value
+from output import ParquetOutput
+
+
+METRICS = ('views', 'downloads', 'likes')
+
+# Column of the output keying each level and the column naming it
+LEVELS = {
+    'artist': ('artist url', 'artist name'),
+    'collection': ('collection url', 'collection name'),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS groups (
+    level TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT,
+    artist TEXT,
+    items INTEGER NOT NULL,
+    scraped INTEGER NOT NULL,
+    views_sum INTEGER NOT NULL,
+    views_max INTEGER,
+    downloads_sum INTEGER NOT NULL,
+    downloads_max INTEGER,
+    likes_sum INTEGER NOT NULL,
+    likes_max INTEGER,
+    first_upload TEXT,
+    last_upload TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (level, key)
+);
+CREATE INDEX IF NOT EXISTS groups_artist ON groups (artist);
+CREATE TABLE IF NOT EXISTS top (
+    level TEXT NOT NULL,
+    key TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    content_url TEXT NOT NULL,
+    title TEXT,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (level, key, metric, content_url)
+);
+CREATE TABLE IF NOT EXISTS seen (
+    level TEXT NOT NULL,
+    key TEXT NOT NULL,
+    content_url TEXT NOT NULL,
+    scraped INTEGER NOT NULL,
+    PRIMARY KEY (level, key, content_url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS uploads (
+    level TEXT NOT NULL,
+    key TEXT NOT NULL,
+    month TEXT NOT NULL,
+    items INTEGER NOT NULL,
+    PRIMARY KEY (level, key, month)
+);
+'''
+
+GROUP_COLUMNS = ['items', 'scraped', 'views_sum', 'views_max',
+                 'downloads_sum', 'downloads_max', 'likes_sum', 'likes_max',
+                 'first_upload', 'last_upload']
+
+# Rows and columns of the groups table are merged with the stored ones
+UPSERT_GROUP = '''
+INSERT INTO groups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (level, key) DO UPDATE SET
+    name = COALESCE(excluded.name, name),
+    items = items + excluded.items,
+    scraped = scraped + excluded.scraped,
+    views_sum = views_sum + excluded.views_sum,
+    views_max = MAX(COALESCE(views_max, excluded.views_max),
+                    COALESCE(excluded.views_max, views_max)),
+    downloads_sum = downloads_sum + excluded.downloads_sum,
+    downloads_max = MAX(COALESCE(downloads_max, excluded.downloads_max),
+                        COALESCE(excluded.downloads_max, downloads_max)),
+    likes_sum = likes_sum + excluded.likes_sum,
+    likes_max = MAX(COALESCE(likes_max, excluded.likes_max),
+                    COALESCE(excluded.likes_max, likes_max)),
+    first_upload = MIN(COALESCE(first_upload, excluded.first_upload),
+                       COALESCE(excluded.first_upload, first_upload)),
+    last_upload = MAX(COALESCE(last_upload, excluded.last_upload),
+                      COALESCE(excluded.last_upload, last_upload)),
+    updated = excluded.updated
+'''
+
+PRUNE_TOP = '''
+DELETE FROM top WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY level, key, metric ORDER BY value DESC) AS rank
+        FROM top WHERE level = ? AND key IN ({placeholders}))
+    WHERE rank > ?)
+'''
+
+class AggregateStore:
+    '''Count, sum and max of the stats, a top `top_k` of the content for
+    every metric, and uploads per month, of every artist and collection
+    of the rows given to add().
+
+    A piece of content counts once per artist and per collection, however
+    many collections of the artist it belongs to and however many times
+    its rows are added, so writing rows again after a resume or merging
+    the outputs of several nodes does not inflate the totals. Content
+    first added with NaN stats gets its stats from the first row that
+    has them. Safe to share between threads.'''
+
+    def __init__(self, path, top_k=10):
+        self.path = str(path)
+        self.top_k = top_k
+        self.lock = t.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def clear(self):
+        with self.lock, self.connection:
+            for table in ('groups', 'top', 'seen', 'uploads'):
+                self.connection.execute(f'DELETE FROM {table}')
+
+    def add(self, df):
+        '''Add output rows, indexed by artist url, to the aggregates.'''
+        rows = df.reset_index()
+        if rows.columns[0] == 'index':
+            rows = rows.rename(columns={'index': 'artist url'})
+        if len(rows) == 0:
+            return
+        for metric in METRICS:
+            rows[metric] = pd.to_numeric(rows[metric], errors='coerce')
+        rows['upload date'] = rows['upload date'].astype('string')
+        now = time.time()
+        with self.lock, self.connection:
+            for level, (column, name) in LEVELS.items():
+                new_rows = self._unseen(level, column, rows)
+                if len(new_rows) == 0:
+                    continue
+                self._add_groups(level, column, name, new_rows, now)
+                self._add_top(level, column, new_rows)
+                self._add_uploads(level, column, new_rows)
+
+    def _unseen(self, level, column, rows):
+        '''Rows of content not aggregated yet under their artist or
+        collection, or only with NaN stats, in which case their `item`
+        is 0 so only their stats are added.'''
+        # Rows with stats first, they win over the NaN ones of the batch
+        rows = (rows.assign(scraped=rows['views'].notna())
+                .sort_values('scraped', ascending=False, kind='stable')
+                .drop_duplicates([column, 'content url']))
+        items = [self._see(level, key, url, scraped)
+                 for key, url, scraped in rows[
+                     [column, 'content url', 'scraped']].itertuples(
+                         index=False)]
+        rows = rows.assign(item=items)
+        return rows[rows['item'].notna()]
+
+    def _see(self, level, key, url, scraped):
+        '''1 for new content, 0 for content seen with NaN stats only and
+        scraped now, None for content already aggregated.'''
+        if self.connection.execute(
+                'INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?)',
+                (level, key, url, int(scraped))).rowcount == 1:
+            return 1
+        if scraped and self.connection.execute(
+                'UPDATE seen SET scraped = 1 WHERE level = ? AND key = ? '
+                'AND content_url = ? AND scraped = 0',
+                (level, key, url)).rowcount == 1:
+            return 0
+        return None
+
+    def _add_groups(self, level, column, name, rows, now):
+        grouped = rows.groupby(column, sort=False)
+        summary = grouped.agg(
+            name=(name, 'first'), artist=('artist url', 'first'),
+            items=('item', 'sum'), scraped=('views', 'count'),
+            views_sum=('views', 'sum'), views_max=('views', 'max'),
+            downloads_sum=('downloads', 'sum'),
+            downloads_max=('downloads', 'max'),
+            likes_sum=('likes', 'sum'), likes_max=('likes', 'max'),
+            first_upload=('upload date', 'min'),
+            last_upload=('upload date', 'max'))
+        self.connection.executemany(UPSERT_GROUP, [
+            (level, key, *map(sql_value, values), now)
+            for key, *values in summary[
+                ['name', 'artist', *GROUP_COLUMNS]].itertuples()])
+
+    def _add_top(self, level, column, rows):
+        for metric in METRICS:
+            top = (rows.dropna(subset=[metric])
+                   .sort_values(metric, ascending=False)
+                   .groupby(column, sort=False).head(self.top_k))
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO top VALUES (?, ?, ?, ?, ?, ?)',
+                [(level, key, metric, url, sql_value(title), int(value))
+                 for key, url, title, value
+                 in top[[column, 'content url', 'title', metric]]
+                 .itertuples(index=False)])
+        keys = list(rows[column].dropna().unique())
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i:i + CHUNK_SIZE]
+            self.connection.execute(
+                PRUNE_TOP.format(placeholders=','.join('?' * len(chunk))),
+                (level, *chunk, self.top_k))
+
+    def _add_uploads(self, level, column, rows):
+        months = rows['upload date'].str.slice(0, 7)
+        counts = rows.groupby([rows[column], months]).size()
+        self.connection.executemany(
+            'INSERT INTO uploads VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (level, key, month) DO UPDATE SET '
+            'items = items + excluded.items',
+            [(level, key, month, int(n))
+             for (key, month), n in counts.items()])
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            columns = [column for column, *_ in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+    def summary(self, key):
+        '''Aggregates of an artist or collection url, None when unknown.'''
+        df = self._query('SELECT * FROM groups WHERE key = ?', (key,))
+        return df.iloc[0].to_dict() if len(df) else None
+
+    def ranking(self, level='artist', metric='views', stat='sum', n=10):
+        '''The `n` artists or collections with the highest sum or max of
+        a metric.'''
+        if metric not in METRICS or stat not in ('sum', 'max'):
+            raise ValueError(f'Cannot rank by the {stat} of {metric}')
+        return self._query(
+            f'SELECT key, name, items, {metric}_{stat} FROM groups '
+            f'WHERE level = ? ORDER BY {metric}_{stat} DESC LIMIT ?',
+            (level, n)).set_index('key')
+
+    def collections(self, artist_url):
+        '''Aggregates of every collection of an artist.'''
+        return self._query(
+            "SELECT * FROM groups WHERE level = 'collection' AND artist = ? "
+            'ORDER BY views_sum DESC', (artist_url,)).set_index('key')
+
+    def top(self, key, metric='views', n=None):
+        '''Top content of an artist or collection by a metric.'''
+        return self._query(
+            'SELECT content_url, title, value AS ' + metric + ' FROM top '
+            'WHERE key = ? AND metric = ? ORDER BY value DESC LIMIT ?',
+            (key, metric, n or self.top_k)).drop_duplicates('content_url')
+
+    def uploads(self, key):
+        '''Number of items uploaded every month by an artist or in a
+        collection.'''
+        df = self._query(
+            'SELECT month, items FROM uploads WHERE key = ? ORDER BY month',
+            (key,))
+        return df.set_index('month')['items']
+
+
+class AggregatedOutput:
+    '''An output that also adds every batch it writes to an
+    AggregateStore.'''
+
+    def __init__(self, output, store):
+        self.output = output
+        self.store = store
+
+    def write(self, df):
+        self.output.write(df)
+        self.store.add(df)
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+
+def rebuild(store, path, output_format=None, chunksize=500000):
+    '''Recompute the aggregates of a whole output. Returns the number of
+    rows.'''
+    path = Path(path)
+    output_format = output_format or ('parquet' if path.is_dir() else 'csv')
+    if output_format == 'parquet':
+        chunks = (batch.to_pandas() for batch in
+                  ParquetOutput(path).dataset().to_batches(
+                      batch_size=chunksize))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunksize)
+    store.clear()
+    n_rows = 0
+    for chunk in chunks:
+        store.add(chunk.set_index('artist url'))
+        n_rows += len(chunk)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query the aggregates of the scraped data')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ranking = commands.add_parser('ranking', help='top artists/collections')
+    ranking.add_argument('--level', choices=list(LEVELS), default='artist')
+    ranking.add_argument('--metric', choices=METRICS, default='views')
+    ranking.add_argument('--stat', choices=['sum', 'max'], default='sum')
+    ranking.add_argument('-n', type=int, default=10)
+    for command, help in (('summary', 'aggregates of an artist/collection'),
+                          ('collections', 'collections of an artist'),
+                          ('uploads', 'items uploaded per month')):
+        commands.add_parser(command, help=help).add_argument('url')
+    top = commands.add_parser('top', help='top content of an '
+                              'artist/collection')
+    top.add_argument('url')
+    top.add_argument('--metric', choices=METRICS, default='views')
+    top.add_argument('-n', type=int)
+    rebuild_parser = commands.add_parser(
+        'rebuild', help='recompute the aggregates of an output')
+    rebuild_parser.add_argument('output_path')
+    rebuild_parser.add_argument('--output-format', choices=['csv', 'parquet'])
+    args = parser.parse_args()
+
+    store = AggregateStore(args.database)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', None)
+    if args.command == 'ranking':
+        print(store.ranking(args.level, args.metric, args.stat, args.n))
+    elif args.command == 'summary':
+        summary = store.summary(args.url)
+        if summary is None:
+            raise SystemExit(f'No aggregates for {args.url}')
+        for name, value in summary.items():
+            print(f'{name:>14}: {value}')
+    elif args.command == 'collections':
+        print(store.collections(args.url))
+    elif args.command == 'top':
+        print(store.top(args.url, args.metric, args.n))
+    elif args.command == 'uploads':
+        print(store.uploads(args.url))
+    else:
+        n_rows = rebuild(store, args.output_path, args.output_format)
+        print(f'Aggregated {n_rows} rows of "{args.output_path}"')
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
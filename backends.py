@@ -0,0 +1,165 @@
+#! /bin/env python3
+
+# Execution backends running a stage function over a list of URLs.
+#
+# A stage function takes (driver, logger, urls) and returns a list of
+# records per URL, like the vectorized functions of pexels_scraper2.py. Every
+# backend gets its drivers from a DriverPool, so recycling, spares and
+# the retries done inside the stage functions are the same whichever
+# runs them.
+
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import util
+from itertools import chain
+import multiprocessing as mp
+import asyncio
+
+from scheduler import Scheduler
+
+
+def _run_item(pool, function, item):
+    with pool.driver() as (driver, logger):
+        return function(driver, logger, [item])
+
+
+class ThreadBackend:
+    '''One thread per driver of `pool`, fed by a Scheduler.'''
+
+    name = 'threads'
+
+    def __init__(self, pool, speculate=True, straggler_factor=2.,
+                 logger=None):
+        self.pool = pool
+        self.speculate = speculate
+        self.straggler_factor = straggler_factor
+        self.logger = logger
+        self.n_speculative = 0
+
+    @property
+    def n_drivers(self):
+        return self.pool.n_drivers
+
+    def map_items(self, function, items, cost=None):
+        '''Results of every item, in the order of `items`.'''
+        scheduler = Scheduler(self.pool.n_drivers, cost=cost,
+                              speculate=self.speculate,
+                              straggler_factor=self.straggler_factor,
+                              logger=self.logger)
+        results = scheduler.map(
+            lambda item: _run_item(self.pool, function, item), items)
+        self.n_speculative += scheduler.n_speculative
+        return results
+
+    def map(self, function, items, cost=None):
+        '''Every record returned for `items`, in a single list.'''
+        return list(chain.from_iterable(chain.from_iterable(
+            self.map_items(function, items, cost))))
+
+    def stats(self):
+        return {'backend': self.name, **self.pool.stats(),
+                'speculative': self.n_speculative}
+
+    def close(self):
+        self.pool.close()
+
+
+class AsyncioBackend(ThreadBackend):
+    '''An event loop that awaits every item, the most expensive first,
+    with at most one item per driver in flight. Selenium calls block, so
+    each one runs on a thread of the loop's executor.'''
+
+    name = 'asyncio'
+
+    def map_items(self, function, items, cost=None):
+        return asyncio.run(self._map(function, list(items), cost))
+
+    async def _map(self, function, items, cost):
+        loop = asyncio.get_running_loop()
+        n_drivers = self.pool.n_drivers
+        executor = ThreadPoolExecutor(max_workers=n_drivers,
+                                      thread_name_prefix='asyncio-backend')
+        semaphore = asyncio.Semaphore(n_drivers)
+
+        async def run(item):
+            async with semaphore:
+                return await loop.run_in_executor(
+                    executor, _run_item, self.pool, function, item)
+        costs = [cost(item) if cost else 1 for item in items]
+        order = sorted(range(len(items)), key=lambda i: -costs[i])
+        try:
+            tasks = {i: asyncio.ensure_future(run(items[i])) for i in order}
+            await asyncio.gather(*tasks.values())
+        finally:
+            executor.shutdown(wait=True)
+        return [tasks[i].result() for i in range(len(items))]
+
+
+# Backend of a worker process of ProcessBackend
+_worker_backend = None
+
+
+def _init_worker(make_backend, args):
+    global _worker_backend
+    _worker_backend = make_backend(*args)
+    # Pool workers exit without running atexit handlers
+    util.Finalize(_worker_backend, _worker_backend.close, exitpriority=10)
+
+
+def _run_chunk(function, items, costs):
+    cost = dict(zip(items, costs)).get
+    return _worker_backend.map_items(function, items, cost)
+
+
+class ProcessBackend:
+    '''`n_processes` worker processes, each running its own backend from
+    `make_backend(*args)`, typically a ThreadBackend over a pool of
+    `threads_per_process` drivers (one for a plain process backend, more
+    for a hybrid of processes and threads).
+
+    Items are sent most expensive first in chunks of one item per thread
+    and a process takes the next chunk as soon as it is done with the
+    previous one.'''
+
+    def __init__(self, n_processes, make_backend, args=(),
+                 threads_per_process=1):
+        self.name = 'hybrid' if threads_per_process > 1 else 'processes'
+        self.n_processes = n_processes
+        self.threads_per_process = threads_per_process
+        self.chunks = 0
+        self.processes = mp.Pool(processes=n_processes,
+                                 initializer=_init_worker,
+                                 initargs=(make_backend, args))
+
+    @property
+    def n_drivers(self):
+        return self.n_processes * self.threads_per_process
+
+    def map_items(self, function, items, cost=None):
+        items = list(items)
+        costs = [cost(item) if cost else 1 for item in items]
+        order = sorted(range(len(items)), key=lambda i: -costs[i])
+        size = self.threads_per_process
+        chunks = [order[k:k + size] for k in range(0, len(order), size)]
+        tasks = [(function, [items[i] for i in chunk],
+                  [costs[i] for i in chunk]) for chunk in chunks]
+        results = [None] * len(items)
+        for chunk, chunk_results in zip(
+                chunks, self.processes.starmap(_run_chunk, tasks,
+                                               chunksize=1)):
+            for i, result in zip(chunk, chunk_results):
+                results[i] = result
+        self.chunks += len(chunks)
+        return results
+
+    def map(self, function, items, cost=None):
+        return list(chain.from_iterable(chain.from_iterable(
+            self.map_items(function, items, cost))))
+
+    def stats(self):
+        return {'backend': self.name, 'processes': self.n_processes,
+                'threads per process': self.threads_per_process,
+                'chunks': self.chunks}
+
+    def close(self):
+        self.processes.close()
+        self.processes.join()
@@ -0,0 +1,96 @@
+#! /bin/env python3
+
+# Compares the execution backends of pexels_scraper2.py end to end against
+# a mock_pexels.py server. Every VM size is emulated by pinning the scraper
+# and its browsers to that many CPUs and running --drivers-per-cpu drivers
+# per CPU.
+#
+#   python3 bench_backends.py --sizes 2,4,8 --latency 0.1 -- --scroll fixed
+#
+# Arguments after "--" are passed to pexels_scraper2.py.
+
+from pathlib import Path
+import argparse
+import tempfile
+import sys
+import os
+
+from mock_pexels import MockPexels
+from bench_e2e import run_scraper
+
+
+BACKENDS = ['threads', 'processes', 'asyncio', 'hybrid']
+
+
+def backend_args(backend, n_drivers, threads_per_process):
+    args = ['--backend', backend, '--drivers', str(n_drivers)]
+    if backend == 'hybrid':
+        args += ['--threads-per-process', str(threads_per_process)]
+    return args
+
+
+def print_table(results):
+    print(f'\n{"cpus":>4} {"backend":<10} {"drivers":>7} {"wall":>8} '
+          f'{"rows/s":>8} {"stats p/s":>9} {"peak RSS":>9}')
+    for (cpus, backend, n_drivers), result in results.items():
+        stats = result['stages'].get('stats', {})
+        print(f'{cpus:>4} {backend:<10} {n_drivers:>7} '
+              f'{result["wall time"]:>7.1f}s '
+              f'{result["rows"] / result["wall time"]:>8.1f} '
+              f'{stats.get("pages/s", 0):>9.2f} '
+              f'{result["peak rss"] / 2**20:>7.0f}MB')
+    print('\nFastest backend per size:')
+    for cpus in sorted({cpus for cpus, _, _ in results}):
+        runs = {key: result for key, result in results.items()
+                if key[0] == cpus}
+        (_, backend, _), result = min(
+            runs.items(), key=lambda run: run[1]['wall time'])
+        print(f'{cpus:>4} CPUs: {backend} ({result["wall time"]:.1f}s)')
+
+
+def main():
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        extra_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(
+        description='Compare the execution backends on a mock site')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--sizes', default=str(len(os.sched_getaffinity(0))),
+                        help='comma separated numbers of CPUs')
+    parser.add_argument('--drivers-per-cpu', type=float, default=1)
+    parser.add_argument('--threads-per-process', type=int, default=2)
+    parser.add_argument('--artists', type=int, default=5)
+    parser.add_argument('--max-collection-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    site = MockPexels(n_artists=args.artists,
+                      collection_size=(5, args.max_collection_size),
+                      latency=args.latency, jitter=args.jitter,
+                      seed=args.seed)
+    server = site.serve()
+    results = {}
+    try:
+        for cpus in map(int, args.sizes.split(',')):
+            n_drivers = max(int(cpus * args.drivers_per_cpu), 1)
+            for backend in args.backends.split(','):
+                scraper_args = extra_args + backend_args(
+                    backend, n_drivers, args.threads_per_process)
+                with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+                    result = run_scraper('pexels_scraper2.py', site, server,
+                                         Path(workdir), scraper_args,
+                                         cpus=cpus)
+                results[cpus, backend, n_drivers] = result
+                print(f'{cpus} CPUs, {backend}: {result["wall time"]:.1f}s',
+                      file=sys.stderr)
+    finally:
+        server.shutdown()
+    print_table(results)
+
+
+if __name__ == '__main__':
+    main()
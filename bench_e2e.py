@@ -0,0 +1,183 @@
+#! /bin/env python3
+
+# End-to-end throughput benchmark: runs the scrapers against a local
+# mock_pexels.py server and reports, per stage, pages fetched, pages/sec
+# and p50/p99 page latency, plus wall time and peak RSS of the scraper
+# and its browsers.
+#
+#   python3 bench_e2e.py --artists 10 --latency 0.1 -- --pipeline
+#
+# Arguments after "--" are passed to pexels_scraper2.py.
+
+from urllib.parse import urlsplit
+from functools import partial
+from pathlib import Path
+import numpy as np
+import subprocess
+import argparse
+import tempfile
+import psutil
+import time
+import sys
+import os
+import re
+
+from mock_pexels import MockPexels, base_url
+from output import ParquetOutput
+
+
+SCRAPERS = ['pexels_scraper.py', 'pexels_scraper2.py']
+
+STAGES = (
+    ('collections', re.compile(r'/@[\w-]+/collections/')),
+    ('content urls', re.compile(r'/collections/[\w-]+/')),
+    ('stats', re.compile(r'/(?:photo|video)/[\w-]+/')),
+)
+
+
+def stage_of(path):
+    for stage, pattern in STAGES:
+        if pattern.fullmatch(path):
+            return stage
+    return None
+
+
+def page_visits(log):
+    '''Time from the request of every page to the last request the page
+    made itself (scroll fetches, info button, images), by stage.'''
+    visits = {}
+    for start, end, path, referer, status in sorted(log):
+        stage = stage_of(path)
+        if stage is not None:
+            visits.setdefault(path, [stage, start, end])
+        elif referer is not None:
+            page = urlsplit(referer).path
+            if page in visits:
+                visits[page][2] = max(visits[page][2], end)
+    return visits.values()
+
+
+def stage_report(log):
+    report = {}
+    for stage, _ in STAGES:
+        visits = [(start, end) for s, start, end in page_visits(log)
+                  if s == stage]
+        if not visits:
+            continue
+        starts, ends = np.array(visits).T
+        latencies = ends - starts
+        span = ends.max() - starts.min()
+        report[stage] = {
+            'pages': len(visits),
+            'pages/s': len(visits) / span if span > 0 else float('inf'),
+            'p50': np.percentile(latencies, 50),
+            'p99': np.percentile(latencies, 99),
+        }
+    return report
+
+
+def run_scraper(scraper, site, server, workdir, extra_args, cpus=None,
+                first_cpu=0):
+    '''Run a scraper on the mock site, pinned to `cpus` CPUs from the
+    `first_cpu`th available one when given.'''
+    artists_file = workdir / 'artists_urls.csv'
+    artists_file.write_text(''.join(f'{base_url(server)}/@{slug}\n'
+                                    for slug in site.artist_slugs()))
+    output = workdir / 'data.csv'
+    command = [sys.executable, str(Path(__file__).parent / scraper),
+               str(artists_file), output.name]
+    if scraper == 'pexels_scraper2.py':
+        command += extra_args
+    env = {**os.environ, 'PEXELS_BASE_URL': base_url(server)}
+    site.log.clear()
+    stderr_path = workdir / 'stderr.log'
+    stderr = open(stderr_path, 'w')
+    start = time.monotonic()
+    preexec_fn = None
+    if cpus is not None:
+        available = sorted(os.sched_getaffinity(0))
+        preexec_fn = partial(os.sched_setaffinity, 0,
+                             available[first_cpu:first_cpu + cpus])
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=stderr,
+                               preexec_fn=preexec_fn)
+    peak_rss = 0
+    parent = psutil.Process(process.pid)
+    while process.poll() is None:
+        try:
+            processes = [parent, *parent.children(recursive=True)]
+            rss = 0
+            for p in processes:
+                try:
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    pass
+            peak_rss = max(peak_rss, rss)
+        except psutil.Error:
+            pass
+        time.sleep(0.5)
+    wall_time = time.monotonic() - start
+    stderr.close()
+    if process.returncode != 0:
+        print(stderr_path.read_text(), file=sys.stderr)
+        raise SystemExit(f'{scraper} exited with code {process.returncode}')
+    if output.is_dir():
+        rows = ParquetOutput(output).dataset().count_rows()
+    else:
+        rows = len(output.read_text().splitlines()) - 1 if output.exists() else 0
+    return {
+        'wall time': wall_time,
+        'peak rss': peak_rss,
+        'rows': rows,
+        'stages': stage_report(list(site.log))
+    }
+
+
+def print_report(scraper, result):
+    print(f'\n{scraper}: {result["rows"]} rows in '
+          f'{result["wall time"]:.1f}s, peak RSS '
+          f'{result["peak rss"] / 2**20:.0f} MB')
+    print(f'{"stage":<14} {"pages":>7} {"pages/s":>9} {"p50":>8} {"p99":>8}')
+    for stage, stats in result['stages'].items():
+        print(f'{stage:<14} {stats["pages"]:>7} {stats["pages/s"]:>9.2f} '
+              f'{stats["p50"]:>7.2f}s {stats["p99"]:>7.2f}s')
+
+
+def main():
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        extra_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(
+        description='Benchmark the scrapers end to end against a mock site')
+    parser.add_argument('--scraper', choices=SCRAPERS + ['both'],
+                        default='pexels_scraper2.py')
+    parser.add_argument('--artists', type=int, default=5)
+    parser.add_argument('--max-collections', type=int, default=4)
+    parser.add_argument('--max-collection-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    site = MockPexels(n_artists=args.artists,
+                      collections=(1, args.max_collections),
+                      collection_size=(5, args.max_collection_size),
+                      latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, seed=args.seed)
+    server = site.serve()
+    scrapers = SCRAPERS if args.scraper == 'both' else [args.scraper]
+    try:
+        for scraper in scrapers:
+            with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+                result = run_scraper(scraper, site, server, Path(workdir),
+                                     extra_args)
+            print_report(scraper, result)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#! /bin/env python3
+
+# Throughput of a crawl shared by 1, 2, 4... nodes through a lease queue,
+# against a mock_pexels.py server. Every node is a pexels_scraper2.py run
+# pinned to its own --cpus-per-node CPUs, with its own output, and the
+# outputs are merged once every node is done.
+#
+#   python3 bench_nodes.py --nodes 1,2,4 --latency 0.1 -- --drivers 2
+#
+# Arguments after "--" are passed to pexels_scraper2.py.
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import sys
+
+from mock_pexels import MockPexels
+from bench_e2e import run_scraper
+from coordinator import merge_outputs
+
+
+def run_nodes(n_nodes, site, server, workdir, extra_args, cpus_per_node):
+    queue = workdir / 'queue.db'
+    node_dirs = [workdir / f'node-{i}' for i in range(n_nodes)]
+    for node_dir in node_dirs:
+        node_dir.mkdir()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=n_nodes) as executor:
+        runs = [executor.submit(
+            run_scraper, 'pexels_scraper2.py', site, server, node_dir,
+            extra_args + ['--coordinator', str(queue),
+                          '--node', node_dir.name],
+            cpus=cpus_per_node, first_cpu=i * cpus_per_node)
+            for i, node_dir in enumerate(node_dirs)]
+        results = [run.result() for run in runs]
+    wall_time = time.monotonic() - start
+    rows = merge_outputs([node_dir / 'data.csv' for node_dir in node_dirs
+                          if (node_dir / 'data.csv').exists()],
+                         workdir / 'data.csv')
+    return {
+        'wall time': wall_time,
+        'rows': rows,
+        'rows per node': [result['rows'] for result in results],
+    }
+
+
+def main():
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        extra_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(
+        description='Compare crawls shared by several nodes on a mock site')
+    parser.add_argument('--nodes', default='1,2',
+                        help='comma separated numbers of nodes')
+    parser.add_argument('--cpus-per-node', type=int, default=1)
+    parser.add_argument('--artists', type=int, default=8)
+    parser.add_argument('--max-collection-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    site = MockPexels(n_artists=args.artists,
+                      collection_size=(5, args.max_collection_size),
+                      latency=args.latency, jitter=args.jitter,
+                      seed=args.seed)
+    server = site.serve()
+    print(f'{"nodes":>5} {"wall":>8} {"rows":>7} {"rows/s":>8}  rows per node')
+    try:
+        for n_nodes in map(int, args.nodes.split(',')):
+            with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+                result = run_nodes(n_nodes, site, server, Path(workdir),
+                                   extra_args, args.cpus_per_node)
+            print(f'{n_nodes:>5} {result["wall time"]:>7.1f}s '
+                  f'{result["rows"]:>7} '
+                  f'{result["rows"] / result["wall time"]:>8.1f}  '
+                  f'{result["rows per node"]}')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#! /bin/env python3
+
+# Time and peak memory of accumulating the rows of a stage as one
+# DataFrame per URL concatenated at the end, the way the stage functions
+# used to return them, against StatsRecords turned into a single
+# DataFrame by to_frame.
+#
+#   python3 bench_records.py --rows 10000,100000
+
+import argparse
+import tracemalloc
+import time
+
+import pandas as pd
+
+from records import StatsRecord, to_frame
+
+
+def url(i):
+    return f'https://www.pexels.com/photo/photo-{i}/'
+
+
+def one_frame_per_url(n_rows):
+    return pd.concat([
+        pd.DataFrame({'title': [f'title {i}'], 'views': [i],
+                      'downloads': [i // 2], 'likes': [i // 10],
+                      'upload date': ['2021-03-14']}, index=[url(i)])
+        for i in range(n_rows)])
+
+
+def records(n_rows):
+    return to_frame(StatsRecord, [
+        StatsRecord(url(i), f'title {i}', i, i // 2, i // 10, '2021-03-14')
+        for i in range(n_rows)])
+
+
+def measure(function, n_rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = function(n_rows)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(df) == n_rows
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare per-URL DataFrames and records')
+    parser.add_argument('--rows', default='1000,10000',
+                        help='comma separated numbers of rows')
+    args = parser.parse_args()
+    print(f'{"rows":>8} {"accumulation":<18} {"time":>9} {"peak memory":>12}')
+    for n_rows in map(int, args.rows.split(',')):
+        for function in (one_frame_per_url, records):
+            elapsed, peak = measure(function, n_rows)
+            print(f'{n_rows:>8} {function.__name__:<18} {elapsed:>8.3f}s '
+                  f'{peak / 2**20:>10.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#! /bin/env python3
+
+# Time until the first and the last web driver of a pool are ready when
+# they are launched one after another, concurrently, and concurrently from
+# a pre-built Chrome profile.
+#
+#   python3 bench_startup.py -n 8 --profile-dir chrome-profile
+
+from functools import partial
+import argparse
+import logging
+import time
+
+from driver_pool import DriverPool
+from pexels_scraper2 import create_driver, quit_driver, n_physical_cores
+
+
+def time_startup(n_drivers, concurrency, profile_template, logger):
+    create = partial(create_driver, profile_template=profile_template)
+    start = time.monotonic()
+    pool = DriverPool(n_drivers, create, [logger] * n_drivers, logger,
+                      quit=quit_driver, n_spares=0,
+                      startup_concurrency=concurrency)
+    n_ready = pool.wait_ready()
+    total = time.monotonic() - start
+    stats = pool.stats()
+    pool.close()
+    if n_ready < n_drivers:
+        raise SystemExit(f'Only {n_ready}/{n_drivers} web drivers started')
+    return stats['startup first ready'], total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the startup time of a pool of web drivers')
+    parser.add_argument('-n', '--drivers', type=int, default=n_physical_cores)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--profile-dir', metavar='PATH')
+    args = parser.parse_args()
+    logger = logging.getLogger('bench_startup')
+
+    scenarios = [('sequential', 1, None), ('parallel', None, None)]
+    if args.profile_dir:
+        scenarios.append(('parallel + profile', None, args.profile_dir))
+    print(f'{"scenario":<20} {"first ready":>12} {"all ready":>12}')
+    for name, concurrency, profile in scenarios:
+        runs = [time_startup(args.drivers, concurrency, profile, logger)
+                for _ in range(args.repeat)]
+        first = min(run[0] for run in runs)
+        total = min(run[1] for run in runs)
+        print(f'{name:<20} {first:>11.2f}s {total:>11.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import pytest
+import logging
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+fixtures_dir = Path(__file__).parent / 'fixtures'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger()
+
+
+@pytest.fixture(scope='module')
+def fixture_server():
+    handler = partial(QuietHandler, directory=str(fixtures_dir))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
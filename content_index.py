@@ -0,0 +1,113 @@
+#! /bin/env python3
+
+from urllib.parse import urlsplit
+import threading as t
+import pandas as pd
+import sqlite3
+import time
+
+from database import CHUNK_SIZE, sql_value
+from http_stats import STATS_COLUMNS
+from records import StatsRecord, from_frame
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS content (
+    id TEXT PRIMARY KEY,
+    scraped REAL NOT NULL,
+    title TEXT,
+    views INTEGER,
+    downloads INTEGER,
+    likes INTEGER,
+    upload_date TEXT
+);
+'''
+
+def content_id(content_url):
+    '''Key of a piece of content, independent of the host serving it.'''
+    return urlsplit(content_url).path.rstrip('/')
+
+
+class ContentIndex:
+    '''Stats of every piece of content scraped, keyed by content id.
+
+    Lookups only return entries scraped less than `freshness` seconds ago
+    (any age when None), so a content page is fetched at most once per
+    freshness window whatever the number of collections, splits or runs it
+    shows up in. Pages that fell back to NaN stats are not recorded and
+    get scraped again. With the default ":memory:" path the index only
+    lasts for the run. Safe to share between threads.'''
+
+    def __init__(self, path=':memory:', freshness=None):
+        self.path = str(path)
+        self.freshness = freshness
+        self.lock = t.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM content').fetchone()[0]
+
+    def lookup(self, content_urls):
+        '''Fresh stats of the given URLs, indexed by content url.'''
+        ids = {}
+        for url in content_urls:
+            ids.setdefault(content_id(url), []).append(url)
+        oldest = (time.time() - self.freshness
+                  if self.freshness is not None else 0)
+        keys = list(ids)
+        records, index = [], []
+        with self.lock:
+            for i in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[i:i + CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    'SELECT id, title, views, downloads, likes, upload_date '
+                    f'FROM content WHERE id IN ({placeholders}) '
+                    'AND scraped >= ?', (*chunk, oldest))
+                for key, *stats in rows:
+                    for url in ids[key]:
+                        records.append(stats)
+                        index.append(url)
+        return pd.DataFrame(records, index=index, columns=STATS_COLUMNS)
+
+    def scraped_times(self, content_urls):
+        '''Unix time each URL was last scraped, NaN when unknown.'''
+        content_urls = list(content_urls)
+        keys = [content_id(url) for url in content_urls]
+        times = {}
+        with self.lock:
+            for i in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[i:i + CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                times.update(self.connection.execute(
+                    f'SELECT id, scraped FROM content '
+                    f'WHERE id IN ({placeholders})', chunk))
+        return pd.Series([times.get(key) for key in keys],
+                         index=content_urls, dtype=float)
+
+    def add(self, stats):
+        '''Record stats, a DataFrame indexed by content url or a list of
+        StatsRecords, skipping NaN fallbacks.'''
+        if isinstance(stats, pd.DataFrame):
+            stats = from_frame(StatsRecord, stats)
+        now = time.time()
+        rows = [(content_id(url), now, sql_value(title),
+                 *map(sql_value, (views, downloads, likes)),
+                 sql_value(upload_date))
+                for url, title, views, downloads, likes, upload_date in stats
+                if not pd.isna(views)]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows)
+        return len(rows)
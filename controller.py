@@ -0,0 +1,172 @@
+#! /bin/env python3
+
+import threading as t
+import psutil
+import time
+
+from metrics import BUCKETS, quantile
+
+
+def host_load():
+    '''CPU and memory usage of the host in percent.'''
+    return psutil.cpu_percent(), psutil.virtual_memory().percent
+
+
+class RateLimiter:
+    '''Token bucket shared by every driver. Callers reserve a token and
+    sleep until it is due, so requests are spread evenly at `rate` per
+    second.'''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = t.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveController:
+    '''AIMD control of the number of active drivers and the request rate.
+
+    Every `interval` seconds the window since the last step is compared
+    with the previous ones. The limits are cut by `decrease` when the
+    attempts that timed out and the items that fell back to NaN stats
+    are over `error_threshold` of the items finished in the window,
+    when the median page latency of a stage grows over `latency_factor`
+    times the best median seen for it, or when the host runs out of CPU or
+    memory. Otherwise, if workers had to wait for a driver, one driver and
+    `rate_step` pages per second are added.'''
+
+    def __init__(self, pool, metrics, logger, limiter=None, min_drivers=1,
+                 max_rate=None, interval=10, error_threshold=0.05,
+                 latency_factor=2., max_cpu=90, max_memory=85, decrease=0.5,
+                 rate_step=0.5, min_rate=0.2, load=host_load):
+        self.pool = pool
+        self.metrics = metrics
+        self.logger = logger
+        self.limiter = limiter
+        self.min_drivers = min_drivers
+        self.max_rate = max_rate
+        self.interval = interval
+        self.error_threshold = error_threshold
+        self.latency_factor = latency_factor
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.decrease = decrease
+        self.rate_step = rate_step
+        self.min_rate = min_rate
+        self.load = load
+        self.baselines = {}
+        self.decisions = []
+        self.last = self._sample()
+        self.stopped = t.Event()
+        self.thread = None
+        metrics.gauge('concurrency_limit', lambda: self.pool.limit)
+        if limiter is not None:
+            metrics.gauge('rate_limit', lambda: self.limiter.rate)
+
+    def _sample(self):
+        stages = self.baselines.keys() | {'collections', 'content', 'stats'}
+        return {
+            # Counted as they happen, an item can start in one window and
+            # end in another
+            'errors': (self.metrics.total('attempt_errors_total')
+                       + self.metrics.total('items_total',
+                                            outcome='fallback')),
+            'items': self.metrics.total('items_total'),
+            'wait': self.pool.stats()['checkout wait total'],
+            'latency': {stage: self.metrics.bucket_counts('item_seconds',
+                                                          stage=stage)
+                        for stage in stages}
+        }
+
+    def congestion(self, current, last):
+        '''Reason to back off in the window between two samples, or None.'''
+        cpu, memory = self.load()
+        if cpu > self.max_cpu:
+            return f'CPU at {cpu:.0f}%'
+        if memory > self.max_memory:
+            return f'memory at {memory:.0f}%'
+        items = current['items'] - last['items']
+        errors = current['errors'] - last['errors']
+        # Timeouts without any item finished are congestion too
+        if errors and errors / max(items, 1) > self.error_threshold:
+            return f'{errors} timeouts and fallbacks for {items} items'
+        for stage, counts in current['latency'].items():
+            previous = last['latency'].get(stage, [0] * len(BUCKETS))
+            window = [c - p for c, p in zip(counts, previous)]
+            median = quantile(BUCKETS, window, 0.5)
+            if median is None:
+                continue
+            baseline = self.baselines.setdefault(stage, median)
+            if median > self.latency_factor * baseline:
+                return (f'{stage} median latency {median}s over '
+                        f'{self.latency_factor}x {baseline}s')
+            self.baselines[stage] = min(baseline, median)
+        return None
+
+    def step(self):
+        current = self._sample()
+        reason = self.congestion(current, self.last)
+        demand = current['wait'] > self.last['wait']
+        self.last = current
+        limit = self.pool.limit
+        rate = self.limiter.rate if self.limiter is not None else None
+        if reason is not None:
+            limit = max(self.min_drivers, int(limit * self.decrease))
+            if rate is not None:
+                rate = max(self.min_rate, rate * self.decrease)
+        elif demand:
+            limit += 1
+            if rate is not None:
+                rate = rate + self.rate_step
+                if self.max_rate is not None:
+                    rate = min(rate, self.max_rate)
+        else:
+            return None
+        limit = self.pool.set_limit(limit)
+        if rate is not None:
+            self.limiter.set_rate(rate)
+        decision = 'decrease' if reason is not None else 'increase'
+        rate_text = f', {rate:.2f} pages/s' if rate is not None else ''
+        self.logger.info(f'Controller {decision}: {limit} drivers'
+                         f'{rate_text} ({reason or "waiting for drivers"})')
+        self.decisions.append((decision, limit, rate))
+        return decision
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.step()
+            except Exception:
+                self.logger.exception('Controller step failed')
+
+    def start(self):
+        self.thread = t.Thread(target=self._run, daemon=True,
+                               name='adaptive-controller')
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,371 @@
+#! /bin/env python3
+
+# Work queue shared by every node of a multi-VM crawl. Artists and then
+# their collections are leased to nodes for a limited time; a node renews
+# its leases while it works on them and marks them done once their rows
+# are written. The leases of a node that dies expire and go back to the
+# queue. Each node writes its own output, and merge_outputs combines them
+# afterwards, dropping the rows written twice when a lease expired while
+# its node was still working on it.
+#
+#   python3 coordinator.py serve queue.db --artists artists_urls.csv \
+#       --host 0.0.0.0
+#   python3 pexels_scraper2.py --coordinator http://HOST:8765 --node vm-1
+#   python3 coordinator.py merge data.csv vm-1.csv vm-2.csv ...
+#
+# A LeaseQueue file on a shared disk (or a local one in tests) can be
+# given to --coordinator instead of the URL of a server. The server has no
+# authentication and only listens on localhost unless told otherwise, so
+# expose it to the nodes only on a private network.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from pathlib import Path
+import urllib.request
+import threading as t
+import pandas as pd
+import numpy as np
+import argparse
+import sqlite3
+import json
+import time
+
+from output import open_output
+from pipeline import OUTPUT_COLUMNS
+
+
+KINDS = ('artist', 'collection')
+STATES = ('pending', 'leased', 'done', 'failed')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS leases (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    context TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    node TEXT,
+    expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, url)
+);
+CREATE INDEX IF NOT EXISTS leases_state ON leases (state, kind);
+'''
+
+# Columns identifying a row of the output
+ROW_KEY = ['artist url', 'collection url', 'content url']
+
+
+class LeaseQueue:
+    '''Artist and collection URLs leased to nodes, backed by SQLite.
+
+    A lease lasts `lease_time` seconds unless renewed. Expired leases go
+    back to pending and count as a failed attempt, so a URL that keeps
+    killing its node ends up failed after `max_attempts`. Collections are
+    leased before artists so rows reach the outputs as early as possible.
+
+    Transactions take the write lock up front, so several processes can
+    share the same database file.'''
+
+    def __init__(self, path, lease_time=600, max_attempts=3):
+        self.path = str(path)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.lock = t.Lock()
+        self.connection = sqlite3.connect(self.path, isolation_level=None,
+                                          check_same_thread=False,
+                                          timeout=30)
+        if self.path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def add(self, kind, entries):
+        '''Queue (url, context) entries unless already known.'''
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO leases (kind, url, context) '
+                'VALUES (?, ?, ?)',
+                [(kind, url, json.dumps(context)) for url, context in entries])
+
+    def seed_artists(self, artists_urls):
+        self.add('artist', ((url, None) for url in artists_urls))
+
+    def _expire(self, connection, now):
+        cursor = connection.execute(
+            "UPDATE leases SET attempts = attempts + 1, node = NULL, "
+            "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+            "ELSE 'pending' END "
+            "WHERE state = 'leased' AND expires < ?",
+            (self.max_attempts, now))
+        return cursor.rowcount
+
+    def lease(self, node, limit):
+        '''Lease up to `limit` URLs of a single kind to `node`.
+
+        Returns the kind and a list of (url, context), or (None, []) when
+        nothing is pending.'''
+        now = time.time()
+        with self._transaction() as connection:
+            self._expire(connection, now)
+            for kind in reversed(KINDS):
+                rows = connection.execute(
+                    "SELECT url, context FROM leases "
+                    "WHERE kind = ? AND state = 'pending' LIMIT ?",
+                    (kind, limit)).fetchall()
+                if rows:
+                    break
+            else:
+                return None, []
+            connection.executemany(
+                "UPDATE leases SET state = 'leased', node = ?, expires = ? "
+                "WHERE kind = ? AND url = ?",
+                [(node, now + self.lease_time, kind, url) for url, _ in rows])
+        return kind, [(url, json.loads(context)) for url, context in rows]
+
+    def renew(self, node, kind, urls):
+        '''Extend the leases `node` still holds, returns how many.'''
+        with self._transaction() as connection:
+            cursor = connection.executemany(
+                "UPDATE leases SET expires = ? WHERE kind = ? AND url = ? "
+                "AND state = 'leased' AND node = ?",
+                [(time.time() + self.lease_time, kind, url, node)
+                 for url in urls])
+        return cursor.rowcount
+
+    def complete(self, node, kind, urls, children=()):
+        '''Mark URLs done, adding the (url, context) collections of an
+        artist. URLs leased to another node since their lease expired are
+        left to it.'''
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO leases (kind, url, context) '
+                'VALUES (?, ?, ?)',
+                [('collection', url, json.dumps(context))
+                 for url, context in children])
+            cursor = connection.executemany(
+                "UPDATE leases SET state = 'done', node = ? "
+                "WHERE kind = ? AND url = ? AND (state = 'pending' "
+                "OR state = 'leased' AND node = ?)",
+                [(node, kind, url, node) for url in urls])
+        return cursor.rowcount
+
+    def fail(self, node, kind, urls):
+        '''Give back leases after a failed attempt.'''
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE leases SET attempts = attempts + 1, node = NULL, "
+                "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'pending' END "
+                "WHERE kind = ? AND url = ? AND state = 'leased' "
+                "AND node = ?",
+                [(self.max_attempts, kind, url, node) for url in urls])
+
+    def settings(self):
+        '''Lease settings nodes adapt to, such as their renew interval.'''
+        return {'lease_time': self.lease_time,
+                'max_attempts': self.max_attempts}
+
+    def counts(self):
+        counts = {kind: dict.fromkeys(STATES, 0) for kind in KINDS}
+        with self.lock:
+            for kind, state, n in self.connection.execute(
+                    'SELECT kind, state, COUNT(*) FROM leases '
+                    'GROUP BY kind, state'):
+                counts[kind][state] = n
+        return counts
+
+    def has_work(self):
+        '''Whether URLs are pending or leased, leases may still expire.'''
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM leases WHERE state IN ('pending', 'leased') "
+                "LIMIT 1").fetchone() is not None
+
+
+# Methods of a LeaseQueue callable through serve_queue
+REMOTE_METHODS = ('seed_artists', 'lease', 'renew', 'complete', 'fail',
+                  'settings', 'counts', 'has_work')
+
+
+def serve_queue(queue, port, host='127.0.0.1'):
+    '''Serve the methods of a LeaseQueue as POST /<method> requests with
+    a JSON list of arguments, from a daemon thread.'''
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            method = urlsplit(self.path).path.strip('/')
+            if method not in REMOTE_METHODS:
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            args = json.loads(self.rfile.read(length) or b'[]')
+            payload = json.dumps(getattr(queue, method)(*args)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    t.Thread(target=server.serve_forever, daemon=True,
+             name='coordinator').start()
+    return server
+
+
+class RemoteQueue:
+    '''Client of a queue served by serve_queue, with the same methods.'''
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, method, *args):
+        request = urllib.request.Request(
+            f'{self.url}/{method}', data=json.dumps(args).encode(),
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def seed_artists(self, artists_urls):
+        return self._call('seed_artists', list(artists_urls))
+
+    def lease(self, node, limit):
+        kind, entries = self._call('lease', node, limit)
+        return kind, [tuple(entry) for entry in entries]
+
+    def renew(self, node, kind, urls):
+        return self._call('renew', node, kind, list(urls))
+
+    def complete(self, node, kind, urls, children=()):
+        return self._call('complete', node, kind, list(urls),
+                          [list(child) for child in children])
+
+    def fail(self, node, kind, urls):
+        return self._call('fail', node, kind, list(urls))
+
+    def settings(self):
+        return self._call('settings')
+
+    def counts(self):
+        return self._call('counts')
+
+    def has_work(self):
+        return self._call('has_work')
+
+    def close(self):
+        pass
+
+
+def open_queue(location, **options):
+    '''RemoteQueue for a URL, LeaseQueue for a database path.'''
+    if location.startswith(('http://', 'https://')):
+        return RemoteQueue(location)
+    return LeaseQueue(location, **options)
+
+
+class LeaseKeeper:
+    '''Renew leases from a daemon thread every third of the lease time
+    while a node works on them.'''
+
+    def __init__(self, queue, node, kind, urls, interval):
+        self.queue = queue
+        self.node = node
+        self.kind = kind
+        self.urls = list(urls)
+        self.interval = interval
+        self.stopped = t.Event()
+        self.thread = t.Thread(target=self._run, daemon=True,
+                               name='lease-keeper')
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.queue.renew(self.node, self.kind, self.urls)
+            except Exception:
+                # The lease expires and another node takes the work over
+                pass
+
+
+def merge_outputs(paths, merged_path, output_format='csv', input_format=None):
+    '''Combine the outputs of every node into one, keeping the last copy
+    of rows written by several nodes. Returns the number of rows.'''
+    frames = []
+    for path in paths:
+        node_format = input_format or (
+            'parquet' if Path(path).is_dir() else 'csv')
+        frames.append(
+            open_output(path, node_format).read_columns(OUTPUT_COLUMNS))
+    merged = (pd.concat(frames, ignore_index=True)
+              .drop_duplicates(subset=ROW_KEY, keep='last')
+              .set_index('artist url'))
+    open_output(merged_path, output_format).write(merged)
+    return len(merged)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Coordinate a crawl shared by several nodes')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='serve a lease queue')
+    serve.add_argument('database')
+    serve.add_argument('--artists', help='CSV file of artists to queue')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='address to listen on, 0.0.0.0 for every '
+                       'interface (no authentication)')
+    serve.add_argument('--lease-time', type=float, default=600)
+    merge = commands.add_parser('merge', help='merge the node outputs')
+    merge.add_argument('merged_path')
+    merge.add_argument('paths', nargs='+')
+    merge.add_argument('--output-format', choices=['csv', 'parquet'],
+                       default='csv')
+    args = parser.parse_args()
+    if args.command == 'merge':
+        n_rows = merge_outputs(args.paths, args.merged_path,
+                               args.output_format)
+        print(f'Merged {n_rows} rows into "{args.merged_path}"')
+        return
+    queue = LeaseQueue(args.database, lease_time=args.lease_time)
+    if args.artists:
+        queue.seed_artists(np.loadtxt(args.artists, dtype=str, ndmin=1))
+    serve_queue(queue, args.port, args.host)
+    print(f'Serving {args.database} on http://{args.host}:{args.port}')
+    try:
+        while True:
+            time.sleep(60)
+            print(queue.counts(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+#! /bin/env python3
+
+# Helpers shared by the SQLite stores of the scraper, such as the content
+# index and the aggregates.
+
+import pandas as pd
+
+
+# SQLite limits the number of parameters of a single statement
+CHUNK_SIZE = 500
+
+
+def sql_value(value):
+    '''A value of a DataFrame or record as SQLite stores it: None when
+    missing, strings as they are and numbers, numpy ones included, as
+    integers.'''
+    if pd.isna(value):
+        return None
+    if isinstance(value, str):
+        return value
+    return int(value)
@@ -0,0 +1,321 @@
+#! /bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from collections import Counter
+import threading as t
+import psutil
+import queue
+import time
+
+
+def driver_rss(driver):
+    '''Resident memory of a webdriver's browser process tree in bytes.'''
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process, *process.children(recursive=True)]
+        return sum(p.memory_info().rss for p in processes)
+    except (AttributeError, psutil.Error):
+        return 0
+
+
+# Slot checked out by each thread with DriverPool.driver()
+_checked_out = t.local()
+
+
+def renew_driver(driver):
+    '''Replace `driver`, checked out by this thread with DriverPool.driver()
+    and crashed while serving a page, and return the new driver.'''
+    slot = getattr(_checked_out, 'slot', None)
+    if slot is None:
+        raise RuntimeError('No driver checked out by this thread')
+    pool, n = slot
+    return pool.renew(n, driver)
+
+
+class DriverPool:
+    '''Fixed number of driver slots with blocking checkout.
+
+    Drivers are probed on checkout and recycled on checkin once they have
+    served `max_pages` pages or their process tree grows over `max_rss`
+    bytes. Replacements come from a queue of spare drivers warmed in the
+    background so a worker never waits for a browser to start unless the
+    spares have run out.
+
+    Drivers are launched concurrently (`startup_concurrency` at a time) and
+    each slot becomes available as soon as its driver is ready. A driver
+    that fails to start, or to be re-created when recycled without a spare,
+    is retried `start_attempts` times with an exponential backoff from
+    `start_backoff` seconds in the background, its slot staying out of the
+    pool meanwhile.
+
+    A driver that crashes while checked out is replaced right away with
+    renew_driver() so the page can be retried on the new one.
+
+    At most `limit` drivers are checked out at the same time, which lets a
+    controller change the concurrency of a running job with set_limit.'''
+
+    def __init__(self, n_drivers, create, loggers, main_logger,
+                 is_alive=lambda driver: True, rss=driver_rss,
+                 quit=lambda driver: driver.quit(),
+                 max_pages=500, max_rss=None, rss_check_every=10,
+                 n_spares=1, checkout_timeout=None, startup_concurrency=None,
+                 start_attempts=3, start_backoff=1):
+        self.create = create
+        self.quit = quit
+        self.loggers = loggers
+        self.main_logger = main_logger
+        self.is_alive = is_alive
+        self.rss = rss
+        self.max_pages = max_pages
+        self.max_rss = max_rss
+        self.rss_check_every = rss_check_every
+        self.checkout_timeout = checkout_timeout
+        self.start_attempts = start_attempts
+        self.start_backoff = start_backoff
+        self.restarts = []
+        self.limit = n_drivers
+        self.in_use = 0
+        self.slots = t.Condition()
+        self.drivers = [None] * n_drivers
+        self.pages = [0] * n_drivers
+        self.crashed = [False] * n_drivers
+        self.idle = queue.Queue()
+        self.spares = queue.Queue()
+        self.warmer = ThreadPoolExecutor(max_workers=max(n_spares, 1),
+                                         thread_name_prefix='driver-warmer')
+        self.stats_lock = t.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.
+        self.wait_max = 0.
+        self.checked_out_at = [None] * n_drivers
+        self.busy_total = 0.
+        self.recycles = Counter()
+        self.started_at = time.monotonic()
+        self.ready_times = []
+        self.startup_failures = 0
+        self.starter = ThreadPoolExecutor(
+            max_workers=startup_concurrency or n_drivers,
+            thread_name_prefix='driver-starter')
+        self.startup = [self.starter.submit(self._start, i)
+                        for i in range(n_drivers)]
+        self.starter.shutdown(wait=False)
+        for _ in range(n_spares):
+            self.warmer.submit(self._warm_spare)
+
+    @property
+    def n_drivers(self):
+        return len(self.drivers)
+
+    def _start(self, n, restart=False):
+        for attempt in range(self.start_attempts):
+            if attempt:
+                time.sleep(self.start_backoff * 2 ** (attempt - 1))
+            try:
+                self.drivers[n] = self.create(self.loggers[n])
+                break
+            except Exception:
+                self.main_logger.exception(
+                    f'Driver {n} could not be started (attempt '
+                    f'{attempt + 1} of {self.start_attempts})')
+        else:
+            with self.stats_lock:
+                self.startup_failures += 1
+            return
+        if not restart:
+            with self.stats_lock:
+                self.ready_times.append(time.monotonic() - self.started_at)
+        self.idle.put(n)
+
+    def wait_ready(self):
+        '''Block until every driver has started or failed to start.'''
+        wait(self.startup)
+        return len(self.ready_times)
+
+    def _warm_spare(self):
+        try:
+            self.spares.put(self.create(self.main_logger))
+        except Exception:
+            self.main_logger.exception('Could not warm a spare driver')
+
+    def _quit(self, driver):
+        try:
+            self.quit(driver)
+        except Exception:
+            self.main_logger.exception('Could not quit a recycled driver')
+
+    def checkout(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        while True:
+            waited = time.monotonic() - start
+            if self.startup_failures == self.n_drivers:
+                raise RuntimeError('None of the drivers could be started')
+            if timeout is not None and waited >= timeout:
+                raise TimeoutError(f'No driver available after {timeout}s')
+            poll = 1 if timeout is None else min(1, timeout - waited)
+            with self.slots:
+                if self.in_use >= self.limit:
+                    self.slots.wait(poll)
+                    continue
+                self.in_use += 1
+            try:
+                n = self.idle.get(timeout=poll)
+            except queue.Empty:
+                self._release_slot()
+                continue
+            if self.is_alive(self.drivers[n]) or self._recycle(n, 'dead'):
+                break
+            self._release_slot()
+        waited = time.monotonic() - start
+        with self.stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.checked_out_at[n] = time.monotonic()
+        self.loggers[n].info(f'Driver {n} checked out')
+        return n
+
+    def checkin(self, n):
+        with self.stats_lock:
+            self.busy_total += time.monotonic() - self.checked_out_at[n]
+            self.checked_out_at[n] = None
+        self.pages[n] += 1
+        ready = True
+        try:
+            reason = self._recycle_reason(n)
+            if reason is not None:
+                ready = self._recycle(n, reason)
+        finally:
+            if ready:
+                self.loggers[n].info(f'Driver {n} checked in')
+                self.idle.put(n)
+            self._release_slot()
+
+    def _release_slot(self):
+        with self.slots:
+            self.in_use -= 1
+            self.slots.notify()
+
+    def set_limit(self, limit):
+        '''Change how many drivers can be checked out at the same time.'''
+        with self.slots:
+            self.limit = max(1, min(limit, self.n_drivers))
+            self.slots.notify_all()
+        return self.limit
+
+    @contextmanager
+    def driver(self, timeout=None):
+        n = self.checkout(timeout)
+        _checked_out.slot = (self, n)
+        try:
+            yield self.drivers[n], self.loggers[n]
+        finally:
+            _checked_out.slot = None
+            self.checkin(n)
+
+    def renew(self, n, driver):
+        '''Replace the crashed `driver` of checked out slot `n` and return
+        the new one. When none can be created, RuntimeError is raised and
+        the slot is restarted on checkin.'''
+        if self.drivers[n] is not driver:
+            # Already replaced after an earlier crash
+            return self.drivers[n]
+        self.crashed[n] = not self._replace(n, 'crashed')
+        if self.crashed[n]:
+            raise RuntimeError(f'Driver {n} crashed and could not be replaced')
+        return self.drivers[n]
+
+    def _recycle_reason(self, n):
+        if self.crashed[n]:
+            return 'crashed'
+        if self.max_pages is not None and self.pages[n] >= self.max_pages:
+            return 'pages'
+        if (self.max_rss is not None
+                and self.pages[n] % self.rss_check_every == 0
+                and self.rss(self.drivers[n]) > self.max_rss):
+            return 'rss'
+        return None
+
+    def _recycle(self, n, reason):
+        '''Replace the driver of slot `n`. Returns whether the slot has a
+        driver again, otherwise it is restarted in the background and goes
+        back to the pool once ready.'''
+        self.crashed[n] = False
+        if self._replace(n, reason):
+            return True
+        restart = t.Thread(target=self._start, args=(n, True), daemon=True,
+                           name=f'driver-restart-{n}')
+        self.restarts.append(restart)
+        restart.start()
+        return False
+
+    def _replace(self, n, reason):
+        '''Put a spare, or a new driver, in slot `n`. Returns whether
+        there was one, the slot is left without a driver otherwise.'''
+        self.loggers[n].info(
+            f'Recycling driver {n} ({reason}) after {self.pages[n]} pages')
+        old_driver = self.drivers[n]
+        self.pages[n] = 0
+        with self.stats_lock:
+            self.recycles[reason] += 1
+        ready = True
+        try:
+            self.drivers[n] = self.spares.get_nowait()
+            # Only a spare taken is warmed again, so at most `n_spares`
+            # idle browsers wait in the queue
+            self.warmer.submit(self._warm_spare)
+        except queue.Empty:
+            self.loggers[n].warning('No spare driver ready. Creating one')
+            try:
+                self.drivers[n] = self.create(self.loggers[n])
+            except Exception:
+                self.main_logger.exception(
+                    f'Driver {n} could not be recreated')
+                self.drivers[n] = None
+                ready = False
+        if old_driver is not None:
+            self.warmer.submit(self._quit, old_driver)
+        return ready
+
+    def utilisation(self):
+        '''Fraction of the driver time since startup spent checked out.'''
+        now = time.monotonic()
+        with self.stats_lock:
+            busy = self.busy_total + sum(now - start for start
+                                         in self.checked_out_at
+                                         if start is not None)
+        elapsed = (now - self.started_at) * self.n_drivers
+        return busy / elapsed if elapsed > 0 else 0.
+
+    def stats(self):
+        utilisation = self.utilisation()
+        with self.stats_lock:
+            return {
+                'drivers ready': len(self.ready_times),
+                'startup first ready': min(self.ready_times, default=None),
+                'startup all ready': (max(self.ready_times)
+                                      if len(self.ready_times) == self.n_drivers
+                                      else None),
+                'checkouts': self.checkouts,
+                'checkout wait total': self.wait_total,
+                'checkout wait mean': self.wait_total / max(self.checkouts, 1),
+                'checkout wait max': self.wait_max,
+                'drivers busy': sum(start is not None
+                                    for start in self.checked_out_at),
+                'utilisation': utilisation,
+                'limit': self.limit,
+                'recycles': dict(self.recycles),
+                'spares ready': self.spares.qsize()
+            }
+
+    def close(self):
+        self.wait_ready()
+        for restart in self.restarts:
+            restart.join()
+        self.warmer.shutdown(wait=True)
+        while not self.spares.empty():
+            self._quit(self.spares.get_nowait())
+        for driver in self.drivers:
+            if driver is not None:
+                self._quit(driver)
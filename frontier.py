@@ -0,0 +1,138 @@
+#! /bin/env python3
+
+from pathlib import Path
+import sqlite3
+import json
+import time
+
+
+KINDS = ('artist', 'collection', 'content')
+STATES = ('pending', 'in-flight', 'done', 'failed')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS frontier (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    parent TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    context TEXT,
+    updated REAL,
+    PRIMARY KEY (kind, url, parent)
+);
+CREATE INDEX IF NOT EXISTS frontier_kind_state ON frontier (kind, state);
+CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state);
+'''
+
+
+class Frontier:
+    '''Persistent crawl frontier backed by SQLite in WAL mode.
+
+    Every artist, collection and content URL is a row with its state
+    (pending / in-flight / done / failed) and attempt count. A content URL
+    appears once per collection it belongs to, with `parent` set to the
+    collection url, and `context` keeps the columns needed to write its row
+    without joining against earlier stages.'''
+
+    def __init__(self, path, max_attempts=3):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, kind, entries):
+        '''Insert (url, parent, context) entries as pending if unknown.'''
+        rows = [(kind, url, parent, json.dumps(context), time.time())
+                for url, parent, context in entries]
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO frontier '
+                '(kind, url, parent, context, updated) VALUES (?, ?, ?, ?, ?)',
+                rows)
+
+    def seed_artists(self, artists_urls):
+        self.add('artist', ((url, '', None) for url in artists_urls))
+
+    def reset_in_flight(self):
+        '''Return URLs claimed by a crashed run to the pending state.'''
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE frontier SET state = 'pending' "
+                "WHERE state = 'in-flight'")
+        return cursor.rowcount
+
+    def claim(self, kind, limit):
+        '''Mark up to `limit` distinct pending URLs as in-flight.
+
+        Returns a list of (url, parent, context) for every pending row of
+        the claimed URLs, rows already done under another parent are left
+        out.'''
+        with self.connection:
+            urls = [url for url, in self.connection.execute(
+                "SELECT DISTINCT url FROM frontier "
+                "WHERE kind = ? AND state = 'pending' LIMIT ?",
+                (kind, limit))]
+            rows = self._pending_rows(kind, urls)
+            self.connection.executemany(
+                "UPDATE frontier SET state = 'in-flight', updated = ? "
+                "WHERE kind = ? AND url = ? AND parent = ?",
+                [(time.time(), kind, url, parent) for url, parent, _ in rows])
+        return [(url, parent, json.loads(context))
+                for url, parent, context in rows]
+
+    def complete(self, kind, urls, children_kind=None, children=()):
+        '''Mark the claimed rows of URLs as done, atomically adding the
+        children they produced.'''
+        with self.connection:
+            if children_kind is not None:
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO frontier '
+                    '(kind, url, parent, context, updated) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(children_kind, url, parent, json.dumps(context),
+                      time.time()) for url, parent, context in children])
+            self._set_state(kind, urls, 'done', "state = 'in-flight'")
+
+    def fail(self, kind, urls):
+        '''Count a failed attempt of the claimed rows of URLs; URLs over
+        max_attempts become failed.'''
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE frontier SET attempts = attempts + 1, updated = ?, '
+                "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'pending' END WHERE kind = ? AND url = ? "
+                "AND state = 'in-flight'",
+                [(time.time(), self.max_attempts, kind, url) for url in urls])
+
+    def counts(self):
+        counts = {kind: dict.fromkeys(STATES, 0) for kind in KINDS}
+        for kind, state, n in self.connection.execute(
+                'SELECT kind, state, COUNT(*) FROM frontier '
+                'GROUP BY kind, state'):
+            counts[kind][state] = n
+        return counts
+
+    def has_pending(self):
+        return self.connection.execute(
+            "SELECT 1 FROM frontier WHERE state = 'pending' LIMIT 1"
+        ).fetchone() is not None
+
+    def _pending_rows(self, kind, urls):
+        rows = []
+        for url in urls:
+            rows.extend(self.connection.execute(
+                'SELECT url, parent, context FROM frontier '
+                "WHERE kind = ? AND url = ? AND state = 'pending'",
+                (kind, url)))
+        return rows
+
+    def _set_state(self, kind, urls, state, condition='1'):
+        self.connection.executemany(
+            f'UPDATE frontier SET state = ?, updated = ? '
+            f'WHERE kind = ? AND url = ? AND {condition}',
+            [(state, time.time(), kind, url) for url in urls])
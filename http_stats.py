@@ -0,0 +1,172 @@
+#! /bin/env python3
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+import aiohttp
+import asyncio
+import pandas as pd
+import json
+import re
+
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/84.0.4147.125 Safari/537.36')
+
+STATS_COLUMNS = ['title', 'views', 'downloads', 'likes', 'upload date']
+
+# Same elements the Selenium engine reads once the info button is clicked
+STATS_XPATH = {
+    'button': '//*[@id="photo-page-body"]/div/div/section[1]/div[1]/button[2]',
+    'title': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[2]/div[1]/div[2]/div/h1/strong',
+    'views': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[2]/div/div[1]/div/div/div[2]/div',
+    'likes': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[3]/div/div[2]/div',
+    'downloads': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[3]/div/div[1]/div',
+    'upload date': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[2]/div[1]/div[2]/div/small'
+}
+
+# Key names the embedded page data may use for each field
+DATA_KEYS = {
+    'title': ('title', 'alt', 'name'),
+    'views': ('views', 'views_count', 'viewCount'),
+    'downloads': ('downloads', 'downloads_count', 'downloadCount'),
+    'likes': ('likes', 'likes_count', 'likeCount'),
+    'upload date': ('created_at', 'published_at', 'uploadDate', 'upload_date')
+}
+
+
+def find_by_xpath(soup, xpath):
+    # Only the subset of XPath used in STATS_XPATH: an id anchor followed
+    # by child steps such as "div" or "section[1]"
+    anchor, *steps = xpath.lstrip('/').split('/')
+    element_id = re.fullmatch(r'\*\[@id="(.*)"\]', anchor).group(1)
+    root = soup.find(id=element_id)
+    nodes = [] if root is None else [root]
+    for step in steps:
+        match = re.fullmatch(r'(\w+)(?:\[(\d+)\])?', step)
+        name, position = match.group(1), match.group(2)
+        children = []
+        for node in nodes:
+            tags = [child for child in node.children
+                    if isinstance(child, Tag) and child.name == name]
+            if position is not None:
+                tags = tags[int(position) - 1:int(position)]
+            children.extend(tags)
+        nodes = children
+    return nodes[0] if nodes else None
+
+
+def _find_stats_dict(obj):
+    if isinstance(obj, dict):
+        fields = ('views', 'downloads', 'likes')
+        if all(any(k in obj for k in DATA_KEYS[f]) for f in fields):
+            return obj
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return None
+    for child in children:
+        found = _find_stats_dict(child)
+        if found is not None:
+            return found
+    return None
+
+
+def _first_key(obj, field):
+    for key in DATA_KEYS[field]:
+        if obj.get(key) is not None:
+            return obj[key]
+    return None
+
+
+def parse_embedded_data(soup):
+    script = soup.find('script', id='__NEXT_DATA__')
+    if script is None or not script.string:
+        return None
+    stats = _find_stats_dict(json.loads(script.string))
+    if stats is None:
+        return None
+    upload_date = _first_key(stats, 'upload date')
+    if upload_date is None:
+        return None
+    return {
+        'title': _first_key(stats, 'title') or '',
+        'views': _first_key(stats, 'views'),
+        'downloads': _first_key(stats, 'downloads'),
+        'likes': _first_key(stats, 'likes'),
+        'upload date': upload_date
+    }
+
+
+def parse_static_html(soup):
+    elements = {field: find_by_xpath(soup, STATS_XPATH[field])
+                for field in STATS_COLUMNS}
+    required = ('views', 'downloads', 'likes', 'upload date')
+    if any(elements[field] is None for field in required):
+        return None
+    text = {field: element.get_text(strip=True)
+            for field, element in elements.items() if element is not None}
+    return {'title': '', **text}
+
+
+def parse_content_stats(html):
+    '''Return the raw stats record of a content page, as shown on the
+    page, or None if the page cannot be parsed without a browser.'''
+    soup = BeautifulSoup(html, 'html.parser')
+    for parser in (parse_embedded_data, parse_static_html):
+        try:
+            record = parser(soup)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            record = None
+        if record is not None:
+            return record
+    return None
+
+
+async def _fetch_one(session, semaphore, logger, content_url):
+    async with semaphore:
+        try:
+            async with session.get(content_url) as response:
+                if response.status != 200:
+                    logger.warning(
+                        f'HTTP {response.status} when fetching {content_url}')
+                    return content_url, None
+                html = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            logger.warning(f'HTTP request failed for {content_url}')
+            return content_url, None
+    record = parse_content_stats(html)
+    if record is None:
+        logger.info(f'Could not parse {content_url} without a browser')
+    return content_url, record
+
+
+async def _fetch_all(content_urls, logger, concurrency, timeout):
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    headers = {'User-Agent': USER_AGENT}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=client_timeout,
+                                     headers=headers) as session:
+        tasks = [_fetch_one(session, semaphore, logger, url)
+                 for url in content_urls]
+        return await asyncio.gather(*tasks)
+
+
+def fetch_content_stats(content_urls, logger, concurrency=32, timeout=30):
+    '''Scrape content stats over pooled HTTP connections.
+
+    Returns the raw stats of the parsed pages in the same layout as
+    get_content_stats and the list of URLs that need a browser.'''
+    content_urls = list(dict.fromkeys(content_urls))
+    logger.info(f'HTTP engine fetching {len(content_urls)} content pages')
+    results = asyncio.run(
+        _fetch_all(content_urls, logger, concurrency, timeout))
+    parsed = {url: record for url, record in results if record is not None}
+    failed = [url for url, record in results if record is None]
+    stats = pd.DataFrame.from_dict(parsed, orient='index',
+                                   columns=STATS_COLUMNS)
+    logger.info(f'HTTP engine parsed {len(parsed)} pages, '
+                f'{len(failed)} left for the browser')
+    return stats, failed
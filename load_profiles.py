@@ -0,0 +1,85 @@
+#! /bin/env python3
+
+from collections import namedtuple
+
+
+LoadProfile = namedtuple('LoadProfile', ['page_load_strategy', 'blocked'])
+
+# URL patterns understood by the CDP Network.setBlockedURLs command
+RESOURCE_PATTERNS = {
+    'images': ['*.jpg*', '*.jpeg*', '*.png*', '*.gif*', '*.webp*', '*.svg*',
+               '*.ico*', '*images.pexels.com/*'],
+    'media': ['*.mp4*', '*.webm*', '*.m3u8*', '*videos.pexels.com/*',
+              '*player.vimeo.com/*'],
+    'fonts': ['*.woff*', '*.ttf*', '*.otf*', '*fonts.googleapis.com/*',
+              '*fonts.gstatic.com/*'],
+    'trackers': ['*google-analytics.com/*', '*googletagmanager.com/*',
+                 '*doubleclick.net/*', '*facebook.net/*', '*hotjar.com/*']
+}
+
+LOAD_PROFILES = {
+    'full': LoadProfile('normal', ()),
+    'light': LoadProfile('eager', ('images', 'media', 'fonts', 'trackers')),
+}
+
+STAGES = ('collections', 'content', 'stats')
+
+# Stages that parse the page right after driver.get. An eager driver
+# returns as soon as the DOM is parsed, before the scripts rendering the
+# page have run, so these stages wait for the load to complete as a
+# normal page load would and only keep the blocked URLs of their profile.
+# The stats stage waits for the elements it reads on its own.
+FULL_LOAD_STAGES = ('collections', 'content')
+
+
+def parse_stage_profiles(spec):
+    '''Parse "light" or "collections=light,stats=full" into a profile name
+    per stage. Stages not listed use the full profile.'''
+    if '=' not in spec:
+        names = dict.fromkeys(STAGES, spec)
+    else:
+        names = dict.fromkeys(STAGES, 'full')
+        for item in spec.split(','):
+            stage, name = item.split('=')
+            if stage not in STAGES:
+                raise ValueError(f'Unknown stage "{stage}"')
+            names[stage] = name
+    for name in names.values():
+        if name not in LOAD_PROFILES:
+            raise ValueError(f'Unknown load profile "{name}"')
+    return names
+
+
+def page_load_strategy(stage_profiles):
+    '''Strategy of a driver shared by all stages: eager as soon as one
+    stage does not need the full page.'''
+    strategies = {LOAD_PROFILES[name].page_load_strategy
+                  for name in stage_profiles.values()}
+    return 'normal' if strategies == {'normal'} else 'eager'
+
+
+def needs_full_load(driver, stage):
+    '''Whether a stage has to wait for the page load to complete after
+    driver.get on this driver.'''
+    stage_profiles = getattr(driver, 'stage_profiles', None)
+    return (stage in FULL_LOAD_STAGES and stage_profiles is not None
+            and page_load_strategy(stage_profiles) == 'eager')
+
+
+def blocked_urls(profile):
+    return [pattern for resource in profile.blocked
+            for pattern in RESOURCE_PATTERNS[resource]]
+
+
+def apply_load_profile(driver, stage):
+    '''Switch the URLs blocked by the driver to those of the stage profile.
+    Drivers created without stage profiles are left untouched.'''
+    stage_profiles = getattr(driver, 'stage_profiles', None)
+    if stage_profiles is None:
+        return
+    urls = blocked_urls(LOAD_PROFILES[stage_profiles[stage]])
+    if getattr(driver, 'blocked_urls', None) == urls:
+        return
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': urls})
+    driver.blocked_urls = urls
@@ -0,0 +1,191 @@
+#! /bin/env python3
+
+from pathlib import Path
+import threading as t
+import pandas as pd
+import tempfile
+import shutil
+import psutil
+import time
+import gc
+
+
+# Rough size of a joined output row held in pandas, used to turn a memory
+# budget into a number of rows
+ROW_BYTES = 2048
+
+
+def process_tree_rss():
+    '''Resident memory of this process and its children (the browsers of
+    the threads backend, the workers of the process backends) in bytes.'''
+    process = psutil.Process()
+    total = 0
+    for p in (process, *process.children(recursive=True)):
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def host_memory():
+    '''Memory used on the host in percent.'''
+    return psutil.virtual_memory().percent
+
+
+class MemoryBudget:
+    '''Memory limit of a job: `limit` bytes of process tree RSS and at most
+    `max_host` percent of the host memory.
+
+    Usage crosses the high watermark at `high` times the limit and stays
+    over it until it falls back under `low` times the limit, or while the
+    host uses more than `max_host` percent. Producers call throttle()
+    before starting new work so they pause while the downstream stages and
+    the driver recycling bring memory back down. Usage is sampled at most
+    every `interval` seconds.'''
+
+    def __init__(self, limit, high=0.9, low=0.75, max_host=90,
+                 interval=1, max_wait=300, rss=process_tree_rss,
+                 host=host_memory, metrics=None, logger=None):
+        self.limit = limit
+        self.high = high
+        self.low = low
+        self.max_host = max_host
+        self.interval = interval
+        self.max_wait = max_wait
+        self.rss = rss
+        self.host = host
+        self.metrics = metrics
+        self.logger = logger
+        self.lock = t.Lock()
+        self.sampled_at = None
+        self.usage = (0, 0)
+        self.is_over = False
+
+    def chunk_rows(self, fraction=0.1, min_rows=1000):
+        '''Rows of output a stage can hold in memory at once.'''
+        return max(int(self.limit * fraction / ROW_BYTES), min_rows)
+
+    def _sample(self):
+        now = time.monotonic()
+        with self.lock:
+            if (self.sampled_at is not None
+                    and now - self.sampled_at < self.interval):
+                return self.usage
+            self.sampled_at = now
+        self.usage = (self.rss(), self.host())
+        if self.metrics is not None:
+            self.metrics.set('memory_rss_bytes', self.usage[0])
+        return self.usage
+
+    def over(self):
+        '''Whether usage is over the high watermark, or has not gone back
+        under the low one since.'''
+        rss, host = self._sample()
+        watermark = self.low if self.is_over else self.high
+        self.is_over = rss > watermark * self.limit or host > self.max_host
+        return self.is_over
+
+    def throttle(self):
+        '''Block while over the budget, for at most `max_wait` seconds.'''
+        if not self.over():
+            return 0
+        start = time.monotonic()
+        gc.collect()
+        if self.logger is not None:
+            rss, host = self.usage
+            self.logger.warning(
+                f'Memory over budget ({rss / 2**20:.0f}MB RSS, {host:.0f}% '
+                'of the host), pausing new work')
+        while self.over():
+            if time.monotonic() - start > self.max_wait:
+                if self.logger is not None:
+                    self.logger.warning('Still over the memory budget after '
+                                        f'{self.max_wait}s, resuming')
+                break
+            time.sleep(self.interval)
+        waited = time.monotonic() - start
+        if self.metrics is not None:
+            self.metrics.inc('memory_throttle_seconds_total', waited)
+        return waited
+
+
+class SpillBuffer:
+    '''DataFrames appended in order and read back in chunks of at most
+    `chunk_rows` rows.
+
+    Frames stay in memory until they add up to `chunk_rows` rows or the
+    `budget` is over its watermark, then they are written to Parquet files
+    under `directory` (a temporary directory by default). Without a
+    budget nothing is spilled and the frames are read back in one chunk.'''
+
+    def __init__(self, budget=None, chunk_rows=None, directory=None,
+                 metrics=None):
+        self.budget = budget
+        self.chunk_rows = chunk_rows
+        self.directory = directory
+        self.metrics = metrics
+        self.frames = []
+        self.n_buffered = 0
+        self.files = []
+        self.tmp_dir = None
+
+    def __len__(self):
+        return self.n_buffered + sum(n for _, n in self.files)
+
+    def append(self, df):
+        if len(df) == 0:
+            return
+        self.frames.append(df)
+        self.n_buffered += len(df)
+        if self.budget is not None and (self.n_buffered >= self.chunk_rows
+                                        or self.budget.over()):
+            self.spill()
+
+    def spill(self):
+        if not self.frames:
+            return
+        if self.tmp_dir is None:
+            self.tmp_dir = Path(tempfile.mkdtemp(prefix='spill-',
+                                                 dir=self.directory))
+        path = self.tmp_dir / f'{len(self.files):06d}.parquet'
+        pd.concat(self.frames).to_parquet(path)
+        self.files.append((path, self.n_buffered))
+        if self.metrics is not None:
+            self.metrics.inc('spilled_rows_total', self.n_buffered)
+        self.frames = []
+        self.n_buffered = 0
+
+    def _frames(self):
+        for path, _ in self.files:
+            yield pd.read_parquet(path)
+        yield from self.frames
+
+    def chunks(self):
+        '''Every row appended, in order, in frames of at most `chunk_rows`
+        rows, or in a single frame without a chunk size.'''
+        if self.chunk_rows is None:
+            frames = list(self._frames())
+            if frames:
+                yield pd.concat(frames)
+            return
+        pending, n_pending = [], 0
+        for df in self._frames():
+            while len(df):
+                take = self.chunk_rows - n_pending
+                pending.append(df.iloc[:take])
+                n_pending += len(pending[-1])
+                df = df.iloc[take:]
+                if n_pending == self.chunk_rows:
+                    yield pd.concat(pending)
+                    pending, n_pending = [], 0
+        if pending:
+            yield pd.concat(pending)
+
+    def close(self):
+        self.frames = []
+        self.n_buffered = 0
+        self.files = []
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
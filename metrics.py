@@ -0,0 +1,356 @@
+#! /bin/env python3
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+import threading as t
+import bisect
+import json
+import time
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float('inf'))
+
+
+def quantile(buckets, counts, q, maximum=None):
+    '''Upper bound of the bucket holding the q-th quantile.'''
+    total = sum(counts)
+    if total == 0:
+        return None
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        if cumulative >= q * total:
+            return bound if maximum is None else min(bound, maximum)
+    return maximum
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        return quantile(self.buckets, self.counts, q, self.max)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max
+        }
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    text = ','.join(f'{k}="{v}"' for k, v in labels)
+    return '{' + text + '}'
+
+
+class Trace:
+    '''Where the time went while scraping one URL.'''
+
+    def __init__(self, stage, url):
+        self.stage = stage
+        self.url = url
+        self.start = time.time()
+        self.started = time.monotonic()
+        self.spans = []
+        self.outcome = 'ok'
+
+    def as_dict(self):
+        return {
+            'stage': self.stage,
+            'url': self.url,
+            'start': self.start,
+            'duration': time.monotonic() - self.started,
+            'outcome': self.outcome,
+            'spans': [{'phase': phase, 'offset': offset, 'duration': duration}
+                      for phase, offset, duration in self.spans]
+        }
+
+
+class Metrics:
+    '''Counters, gauges and latency histograms labelled by stage, plus
+    per-URL traces made of timed spans (navigate, wait, scroll, parse).
+
+    Every method is thread safe. Gauges are either set or computed from a
+    callable when a snapshot is taken.'''
+
+    def __init__(self, trace_file=None, keep_traces=100):
+        self.lock = t.Lock()
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+        self.traces = deque(maxlen=keep_traces)
+        self.trace_file = None
+        self.local = t.local()
+        if trace_file is not None:
+            self.trace_to(trace_file)
+
+    def trace_to(self, path):
+        '''Append every finished trace to `path` as a JSON line.'''
+        with self.lock:
+            self.trace_file = open(path, 'a')
+
+    def inc(self, name, n=1, **labels):
+        with self.lock:
+            self.counters[_key(name, labels)] += n
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def gauge(self, name, function, **labels):
+        '''Register a callable read on every snapshot.'''
+        self.set(name, function, **labels)
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = _key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def total(self, name, **labels):
+        '''Sum of the counters called `name` whose labels include `labels`.'''
+        match = set(labels.items())
+        with self.lock:
+            return sum(value for (n, key), value in self.counters.items()
+                       if n == name and match <= set(key))
+
+    def bucket_counts(self, name, **labels):
+        with self.lock:
+            histogram = self.histograms.get(_key(name, labels))
+            if histogram is None:
+                return [0] * len(BUCKETS)
+            return list(histogram.counts)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    @contextmanager
+    def trace(self, stage, url):
+        '''Trace one URL of a stage. Spans opened by the same thread inside
+        the block are attached to it.'''
+        trace = Trace(stage, url)
+        self.local.trace = trace
+        try:
+            yield trace
+        except BaseException:
+            trace.outcome = 'error'
+            raise
+        finally:
+            self.local.trace = None
+            record = trace.as_dict()
+            self.observe('item_seconds', record['duration'], stage=stage)
+            self.inc('items_total', stage=stage, outcome=trace.outcome)
+            with self.lock:
+                self.traces.append(record)
+                if self.trace_file is not None:
+                    self.trace_file.write(json.dumps(record) + '\n')
+                    self.trace_file.flush()
+
+    def current_trace(self):
+        return getattr(self.local, 'trace', None)
+
+    @contextmanager
+    def span(self, phase):
+        trace = self.current_trace()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            stage = trace.stage if trace is not None else 'none'
+            self.observe('phase_seconds', duration, stage=stage, phase=phase)
+            if trace is not None:
+                trace.spans.append(
+                    (phase, start - trace.started, duration))
+
+    def _gauge_values(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = []
+        for key, value in gauges:
+            if callable(value):
+                try:
+                    value = value()
+                except Exception:
+                    continue
+            values.append((key, value))
+        return values
+
+    def snapshot(self):
+        gauges = self._gauge_values()
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, h.summary())
+                          for key, h in self.histograms.items()]
+            traces = len(self.traces)
+
+        def entries(items):
+            return [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in items]
+        return {
+            'time': time.time(),
+            'uptime': time.monotonic() - self.started,
+            'counters': entries(counters),
+            'gauges': entries(gauges),
+            'histograms': entries(histograms),
+            'rates': self.rates(counters),
+            'recent traces': traces
+        }
+
+    def rates(self, counters=None):
+        '''Items per second, retries per item and the rate of items that
+        got a fallback value (NaN stats, partial collection) by stage.'''
+        if counters is None:
+            with self.lock:
+                counters = list(self.counters.items())
+        totals = defaultdict(lambda: defaultdict(int))
+        for (name, labels), value in counters:
+            labels = dict(labels)
+            if 'stage' not in labels:
+                continue
+            stage_totals = totals[labels['stage']]
+            stage_totals[name] += value
+            if name == 'items_total' and labels.get('outcome') == 'fallback':
+                stage_totals['fallbacks'] += value
+        uptime = time.monotonic() - self.started
+        rates = {}
+        for stage, stage_totals in totals.items():
+            items = stage_totals['items_total']
+            if not items:
+                continue
+            rates[stage] = {
+                'items/s': items / uptime,
+                'retries/item': max(stage_totals['attempts_total'] - items,
+                                    0) / items,
+                'fallback rate': stage_totals['fallbacks'] / items
+            }
+        return rates
+
+    def prometheus(self):
+        '''Snapshot in the Prometheus text exposition format.'''
+        gauges = self._gauge_values()
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(h.buckets), list(h.counts), h.count, h.sum)
+                for key, h in self.histograms.items())
+        lines = []
+        for (name, labels), value in counters:
+            lines.append(f'pexels_{name}{_label_text(labels)} {value}')
+        for (name, labels), value in sorted(gauges, key=lambda g: g[0]):
+            if isinstance(value, (int, float)):
+                lines.append(f'pexels_{name}{_label_text(labels)} {value}')
+        for (name, labels), buckets, counts, count, total in histograms:
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else bound
+                bucket_labels = labels + (('le', le),)
+                lines.append(f'pexels_{name}_bucket'
+                             f'{_label_text(bucket_labels)} {cumulative}')
+            lines.append(f'pexels_{name}_count{_label_text(labels)} {count}')
+            lines.append(f'pexels_{name}_sum{_label_text(labels)} {total}')
+        return '\n'.join(lines) + '\n'
+
+    def recent_traces(self):
+        with self.lock:
+            return list(self.traces)
+
+    def close(self):
+        with self.lock:
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+
+
+def serve_metrics(metrics, port, host='127.0.0.1'):
+    '''Serve /metrics (Prometheus text), /metrics.json and /traces from a
+    daemon thread and return the server.'''
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == '/metrics':
+                body, content_type = metrics.prometheus(), 'text/plain'
+            elif path == '/metrics.json':
+                body = json.dumps(metrics.snapshot(), default=str)
+                content_type = 'application/json'
+            elif path == '/traces':
+                body = json.dumps(metrics.recent_traces())
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    t.Thread(target=server.serve_forever, daemon=True,
+             name='metrics-server').start()
+    return server
+
+
+class SnapshotWriter:
+    '''Append a JSON snapshot of the metrics to `path` every `interval`
+    seconds and once more when stopped.'''
+
+    def __init__(self, metrics, path, interval=60):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = t.Event()
+        self.thread = t.Thread(target=self._run, daemon=True,
+                               name='metrics-snapshots')
+        self.thread.start()
+
+    def write(self):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.metrics.snapshot(), default=str) + '\n')
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
@@ -0,0 +1,333 @@
+#! /bin/env python3
+
+# Local stand-in for pexels.com serving synthetic artists, infinitely
+# scrolling collections and content pages with the markup the scrapers
+# select on.
+#
+#   python3 mock_pexels.py --port 8000 --artists 20 --latency 0.2
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from html import escape
+import threading as t
+import argparse
+import datetime
+import random
+import json
+import time
+import re
+
+
+def format_count(n):
+    for suffix, scale in (('B', 10**9), ('M', 10**6), ('K', 10**3)):
+        if n >= scale:
+            return f'{n / scale:.1f}'.rstrip('0').rstrip('.') + suffix
+    return str(n)
+
+
+def to_count(string):
+    scale = {'K': 10**3, 'M': 10**6, 'B': 10**9}
+    if string[-1] in scale:
+        return int(float(string[:-1]) * scale[string[-1]])
+    return int(string)
+
+
+CONTENT_PAGE = '''<!DOCTYPE html>
+<html>
+<head><title>{title}</title></head>
+<body>
+<img src="/images/{slug}.jpeg?auto=compress" width="1920" height="1080">
+<div id="photo-page-body"><div><div><section>
+<div><button>Like</button><button id="info-button">Info</button></div>
+<div id="info" style="display: none"><div>
+  <div>
+    <div></div>
+    <div>
+      <div></div>
+      <div><div><div><div><div>
+        <div>Views</div><div><div>{views}</div></div>
+      </div></div></div></div></div>
+      <div><div>
+        <div><div>{downloads}</div></div>
+        <div><div>{likes}</div></div>
+      </div></div>
+    </div>
+  </div>
+  <div><div>
+    <div></div>
+    <div><div>
+      <h1><strong>{title}</strong></h1>
+      <small>Uploaded at {upload_date}</small>
+    </div></div>
+  </div></div>
+</div></div>
+</section></div></div></div>
+<script id="__NEXT_DATA__" type="application/json">{data}</script>
+<script>
+document.getElementById('info-button').addEventListener('click', () => {{
+    fetch('/api/info/{slug}').then(() => {{
+        document.getElementById('info').style.display = 'block';
+    }});
+}});
+</script>
+</body>
+</html>
+'''
+
+COLLECTIONS_PAGE = '''<!DOCTYPE html>
+<html>
+<head><title>{name} collections</title></head>
+<body>
+<h1>{name}</h1>
+<div class="discover__collections">
+{links}
+</div>
+</body>
+</html>
+'''
+
+COLLECTION_PAGE = '''<!DOCTYPE html>
+<html>
+<head><title>{name}</title></head>
+<body>
+<span>{artist_name}</span>
+<h1>
+{name}
+</h1>
+<div id="grid">
+{items}
+</div>
+<script>
+let page = 1, loading = false, more = {more};
+window.addEventListener('scroll', () => {{
+    if (loading || !more) return;
+    if (window.innerHeight + window.scrollY < document.body.scrollHeight - 800) return;
+    loading = true;
+    fetch('{path}page/' + (page + 1)).then(r => r.json()).then(data => {{
+        const grid = document.getElementById('grid');
+        for (const item of data.items) grid.insertAdjacentHTML('beforeend', item);
+        page += 1;
+        more = data.more;
+        loading = false;
+    }}).catch(() => {{ loading = false; }});
+}});
+</script>
+</body>
+</html>
+'''
+
+PHOTO_ITEM = ('<article style="height: 300px"><a class="js-photo-link '
+              'photo-item__link" href="{href}"><img src="/images/{slug}.jpeg" '
+              'width="400" height="300"></a></article>')
+VIDEO_ITEM = ('<article style="height: 300px"><a class="js-photo-link '
+              'js-photo-item__link photo-item__link" href="{href}"><img '
+              'src="/images/{slug}.jpeg" width="400" height="300"></a></article>')
+
+
+class MockPexels:
+    '''Deterministic synthetic site: the same seed and sizes always give
+    the same artists, collections, content and stats.'''
+
+    def __init__(self, n_artists=5, collections=(1, 4),
+                 collection_size=(5, 200), page_size=30, latency=0.,
+                 jitter=0., error_rate=0., seed=0):
+        self.n_artists = n_artists
+        self.collections = collections
+        self.collection_size = collection_size
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.log = []
+        self.log_lock = t.Lock()
+
+    def rng(self, key):
+        return random.Random(f'{self.seed}:{key}')
+
+    def artist_slugs(self):
+        return [f'artist-{i}' for i in range(self.n_artists)]
+
+    def artist(self, slug):
+        rng = self.rng(slug)
+        n_collections = rng.randint(*self.collections)
+        return {
+            'name': slug.replace('-', ' ').title(),
+            'collections': [f'{slug}-collection-{i}'
+                            for i in range(n_collections)]
+        }
+
+    def content_pool(self, artist_slug):
+        size = int(self.collection_size[1] * 1.2) + 1
+        return [f'{artist_slug}-{"video" if i % 5 == 0 else "photo"}-{i}'
+                for i in range(size)]
+
+    def collection(self, slug):
+        artist_slug = slug.rsplit('-collection-', 1)[0]
+        rng = self.rng(slug)
+        size = rng.randint(*self.collection_size)
+        return {
+            'name': slug.replace('-', ' ').title(),
+            'artist': artist_slug,
+            'items': rng.sample(self.content_pool(artist_slug), size)
+        }
+
+    def content(self, slug):
+        rng = self.rng(slug)
+        upload_date = (datetime.date(2015, 1, 1)
+                       + datetime.timedelta(days=rng.randint(0, 2500)))
+        return {
+            'title': slug.replace('-', ' ').capitalize(),
+            'views': format_count(rng.randint(10, 5 * 10**6)),
+            'downloads': format_count(rng.randint(0, 10**5)),
+            'likes': format_count(rng.randint(0, 10**4)),
+            'upload date': upload_date
+        }
+
+    @staticmethod
+    def content_path(slug):
+        kind = 'video' if '-video-' in slug else 'photo'
+        return f'/{kind}/{slug}/'
+
+    def render_artist(self, slug):
+        artist = self.artist(slug)
+        links = [f'/collections/{c}/' for c in artist['collections']]
+        links += [f'/@{slug}/likes/', f'/@{slug}/featured-uploads/']
+        return COLLECTIONS_PAGE.format(
+            name=escape(artist['name']),
+            links='\n'.join(f'<a class="discover__collections__collection" '
+                            f'href="{link}">{link}</a>' for link in links))
+
+    def render_items(self, items):
+        rendered = []
+        for slug in items:
+            template = VIDEO_ITEM if '-video-' in slug else PHOTO_ITEM
+            rendered.append(template.format(href=self.content_path(slug),
+                                            slug=slug))
+        return rendered
+
+    def render_collection(self, slug, path):
+        collection = self.collection(slug)
+        items = collection['items']
+        return COLLECTION_PAGE.format(
+            name=escape(collection['name']),
+            artist_name=escape(self.artist(collection['artist'])['name']),
+            items='\n'.join(self.render_items(items[:self.page_size])),
+            more='true' if len(items) > self.page_size else 'false',
+            path=path)
+
+    def render_collection_page(self, slug, page):
+        items = self.collection(slug)['items']
+        start = (page - 1) * self.page_size
+        return json.dumps({
+            'items': self.render_items(items[start:start + self.page_size]),
+            'more': start + self.page_size < len(items)
+        })
+
+    def render_content(self, slug):
+        stats = self.content(slug)
+        data = {'props': {'pageProps': {'medium': {'attributes': {
+            'title': stats['title'],
+            'views': to_count(stats['views']),
+            'downloads': to_count(stats['downloads']),
+            'likes': to_count(stats['likes']),
+            'created_at': stats['upload date'].isoformat() + 'T00:00:00Z'
+        }}}}}
+        return CONTENT_PAGE.format(
+            slug=slug, title=escape(stats['title']), views=stats['views'],
+            downloads=stats['downloads'], likes=stats['likes'],
+            upload_date=stats['upload date'].strftime('%B %d, %Y'),
+            data=json.dumps(data))
+
+    def route(self, path):
+        '''Return (status, content type, body, is page) for a path.'''
+        routes = (
+            (r'/@([\w-]+)/collections/', 'text/html', self.render_artist),
+            (r'/collections/([\w-]+)/page/(\d+)', 'application/json',
+             lambda slug, page: self.render_collection_page(slug, int(page))),
+            (r'/collections/([\w-]+)/', 'text/html',
+             lambda slug: self.render_collection(slug, path)),
+            (r'/(?:photo|video)/([\w-]+)/', 'text/html', self.render_content),
+            (r'/api/info/([\w-]+)', 'application/json', lambda slug: '{}'),
+        )
+        for pattern, content_type, render in routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                is_page = content_type == 'text/html'
+                return 200, content_type, render(*match.groups()), is_page
+        return 404, 'text/plain', 'Not found', False
+
+    def record(self, path, referer, status, start):
+        with self.log_lock:
+            self.log.append((start, time.monotonic(), path, referer, status))
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                start = time.monotonic()
+                path = urlsplit(self.path).path
+                status, content_type, body, is_page = site.route(path)
+                if site.latency or site.jitter:
+                    time.sleep(site.latency + random.random() * site.jitter)
+                if is_page and random.random() < site.error_rate:
+                    status, content_type, body = (
+                        503, 'text/plain', 'Service unavailable')
+                payload = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                site.record(path, self.headers.get('Referer'), status, start)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host='127.0.0.1', port=0):
+        '''Start serving in a daemon thread and return the server.'''
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        thread = t.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock pexels.com')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--artists', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--jitter', type=float, default=0.)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--max-collection-size', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    site = MockPexels(n_artists=args.artists, latency=args.latency,
+                      jitter=args.jitter, error_rate=args.error_rate,
+                      collection_size=(5, args.max_collection_size),
+                      seed=args.seed)
+    server = site.serve(args.host, args.port)
+    print(f'Serving mock pexels.com on {base_url(server)}')
+    for slug in site.artist_slugs():
+        print(f'{base_url(server)}/@{slug}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
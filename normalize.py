@@ -0,0 +1,115 @@
+#! /bin/env python3
+
+# The stats stage stores the strings shown on a content page, such as
+# "12.5K" or "Uploaded at March 14, 2021", and a whole batch of them is
+# turned into numbers and ISO dates here with vectorised string ops. A
+# malformed value only leaves its own field empty and is reported with
+# the row it comes from. Raw stats saved with --raw-stats can be
+# normalised again without scraping anything:
+#
+#   python3 normalize.py raw_stats.csv stats.csv [--errors errors.csv]
+
+import argparse
+import pandas as pd
+
+
+COUNT_COLUMNS = ['views', 'downloads', 'likes']
+
+SUFFIXES = {'': 1, 'K': 10**3, 'M': 10**6, 'B': 10**9}
+
+# An integer part, either plain or grouped by thousands with commas, an
+# optional fraction after a decimal point or comma, and a suffix
+COUNT_PATTERN = (r'^(?P<whole>\d{1,3}(?:,\d{3})+|\d+)'
+                 r'(?:(?P<separator>[.,])(?P<fraction>\d+))?'
+                 r'\s*(?P<suffix>[KMB]?)$')
+
+# Page text of the static and Selenium engines, ISO dates or datetimes of
+# the embedded page data and of already normalised stats
+DATE_FORMATS = [
+    (r'^(Uploaded at \w+ \d{1,2}, \d{4})$', 'Uploaded at %B %d, %Y'),
+    (r'^(\d{4}-\d{2}-\d{2})(?:[T ].*)?$', '%Y-%m-%d'),
+]
+
+
+def parse_counts(values):
+    '''Counts such as "987", "1,024", "1.2K" or "1,2K" as nullable
+    integers.
+
+    Commas followed by groups of three digits separate thousands, and a
+    fraction is only accepted before a suffix, after a point or, when the
+    integer part is not grouped, a comma. Ambiguous strings such as
+    "1.024" or "1,234,5K" are NA rather than guessed.'''
+    text = values.astype('string').str.strip().str.upper()
+    parts = text.str.extract(COUNT_PATTERN)
+    grouped = parts['whole'].str.contains(',', regex=False)
+    has_fraction = parts['fraction'].notna()
+    valid = parts['whole'].notna() & ~(has_fraction & (
+        (parts['suffix'] == '')
+        | (parts['separator'] == ',') & grouped))
+    numbers = pd.to_numeric(
+        parts['whole'].str.replace(',', '', regex=False) + '.'
+        + parts['fraction'].fillna('0'), errors='coerce')
+    scale = parts['suffix'].map(SUFFIXES)
+    return (numbers * scale).where(valid).round().astype('Int64')
+
+
+def parse_dates(values):
+    '''Upload dates as "YYYY-MM-DD" strings, NaN when not understood.'''
+    text = values.astype('string').str.strip()
+    dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[s]')
+    for pattern, date_format in DATE_FORMATS:
+        todo = dates.isna() & text.notna()
+        if not todo.any():
+            break
+        matched = text[todo].str.extract(pattern)[0]
+        dates[todo] = pd.to_datetime(matched, format=date_format,
+                                     errors='coerce')
+    return dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna())
+
+
+def normalize_stats(raw):
+    '''Normalised copy of `raw` stats, and one row per malformed value,
+    indexed like `raw`, with the field and the raw value.
+
+    Missing values are not malformed, so rows of pages that failed to
+    scrape keep their NaN stats without being reported. Values that are
+    already normalised are left as they are.'''
+    stats = raw.copy()
+    errors = []
+    parsers = [(column, parse_counts) for column in COUNT_COLUMNS]
+    parsers.append(('upload date', parse_dates))
+    for column, parse in parsers:
+        if column not in raw:
+            continue
+        stats[column] = parse(raw[column])
+        malformed = raw[column].notna() & stats[column].isna()
+        errors.append(pd.DataFrame({'field': column,
+                                    'value': raw[column][malformed]}))
+    errors = (pd.concat(errors) if errors
+              else pd.DataFrame(columns=['field', 'value']))
+    return stats, errors
+
+
+def normalize_file(raw_path, stats_path, errors_path=None):
+    '''Normalise a CSV of raw stats indexed by content url.'''
+    raw = pd.read_csv(raw_path, index_col=0, dtype=str,
+                      keep_default_na=False, na_values=[''])
+    stats, errors = normalize_stats(raw)
+    stats.to_csv(stats_path)
+    if errors_path is not None:
+        errors.to_csv(errors_path)
+    return len(stats), len(errors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Normalise raw content stats saved by the scraper')
+    parser.add_argument('raw_path')
+    parser.add_argument('stats_path')
+    parser.add_argument('--errors', dest='errors_path',
+                        help='CSV file listing every malformed value')
+    args = parser.parse_args()
+    n_rows, n_errors = normalize_file(args.raw_path, args.stats_path,
+                                      args.errors_path)
+    print(f'Normalised {n_rows} rows of "{args.raw_path}" into '
+          f'"{args.stats_path}", {n_errors} malformed values')
@@ -0,0 +1,209 @@
+#! /bin/env python3
+
+from urllib.parse import quote
+from pathlib import Path
+import threading as t
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pandas as pd
+import argparse
+import datetime
+import uuid
+import os
+
+
+TEXT = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMA = pa.schema([
+    ('artist url', TEXT),
+    ('artist name', TEXT),
+    ('collection url', TEXT),
+    ('collection name', TEXT),
+    ('content url', pa.string()),
+    ('title', pa.string()),
+    ('views', pa.int64()),
+    ('downloads', pa.int64()),
+    ('likes', pa.int64()),
+    ('upload date', TEXT),
+])
+
+# Stats of a piece of content at the time it was scraped
+SNAPSHOT_SCHEMA = pa.schema([
+    ('content url', pa.string()),
+    ('scraped at', pa.timestamp('us')),
+    ('title', pa.string()),
+    ('views', pa.int64()),
+    ('downloads', pa.int64()),
+    ('likes', pa.int64()),
+    ('upload date', TEXT),
+])
+
+
+class CsvOutput:
+    '''The original output: rows appended to a single CSV file.'''
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def write(self, df):
+        header = False if self.path.exists() else True
+        df.to_csv(self.path, header=header, mode='a')
+
+    def has_rows(self):
+        return self.path.exists()
+
+    def completed(self, column='artist url'):
+        if not self.path.exists():
+            return pd.Series([], dtype=object).unique()
+        return pd.read_csv(self.path, usecols=[column])[column].unique()
+
+    def read_columns(self, columns):
+        if not self.path.exists():
+            return pd.DataFrame(columns=columns)
+        return pd.read_csv(self.path, usecols=columns)[columns]
+
+
+class ParquetOutput:
+    '''Rows written as zstd-compressed Parquet files under `path`.
+
+    Every batch is split by partition (`artist` url or scrape `date`) and
+    each part goes to its own file in a hive-style directory such as
+    `artist=https%3A%2F%2Fwww.pexels.com%2F%40name`. Files are written
+    under a hidden name and renamed once complete, so readers never see a
+    half-written batch.
+
+    The index of the written DataFrames is the first column of `schema`.'''
+
+    def __init__(self, path, partition_by='artist', row_group_size=100000,
+                 schema=SCHEMA):
+        if partition_by not in ('artist', 'date'):
+            raise ValueError(f'Cannot partition by "{partition_by}"')
+        self.path = Path(path)
+        self.partition_by = partition_by
+        self.row_group_size = row_group_size
+        self.schema = schema
+        self.index = schema[0].name
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _partitions(self, df):
+        if self.partition_by == 'date':
+            today = datetime.date.today().isoformat()
+            return [(f'date={today}', df)]
+        return [(f'artist={quote(str(artist_url), safe="")}', group)
+                for artist_url, group in df.groupby('artist url', sort=False)]
+
+    def write(self, df):
+        df = df.reset_index()
+        if df.columns[0] == 'index':
+            df = df.rename(columns={'index': self.index})
+        # Columns of a batch with only NaN stats come as float
+        for field in self.schema:
+            if field.type in (TEXT, pa.string()):
+                column = df[field.name].astype(object)
+                df[field.name] = column.where(column.notna(), None)
+        for partition, group in self._partitions(df):
+            table = pa.Table.from_pandas(group, schema=self.schema,
+                                         preserve_index=False)
+            directory = self.path / partition
+            directory.mkdir(exist_ok=True)
+            name = f'part-{uuid.uuid4().hex}.parquet'
+            tmp_path = directory / f'.{name}.tmp'
+            pq.write_table(table, tmp_path, compression='zstd',
+                           row_group_size=self.row_group_size)
+            os.replace(tmp_path, directory / name)
+
+    def has_rows(self):
+        # The directory is created with the output, only finished files
+        # have the .parquet suffix
+        return next(self.path.rglob('*.parquet'), None) is not None
+
+    def dataset(self):
+        return ds.dataset(self.path, schema=self.schema, format='parquet',
+                          partitioning=None)
+
+    def completed(self, column='artist url'):
+        '''Unique values of one column, reading nothing else.'''
+        table = self.dataset().to_table(columns=[column])
+        return table.column(column).to_pandas().unique()
+
+    def read_columns(self, columns):
+        df = self.dataset().to_table(columns=columns).to_pandas()
+        for column, dtype in df.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def read(self, columns=None):
+        df = self.read_columns(columns)
+        return df.set_index(self.index) if self.index in df else df
+
+
+class CompletionLog:
+    '''Artists whose rows are all written, one URL per line of `path`.
+
+    The rows of an artist can reach the output over several writes, so a
+    run that stops halfway leaves some of them on disk: resumed runs skip
+    the artists listed here rather than every artist with a row. Safe to
+    share between threads.'''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = t.Lock()
+
+    def exists(self):
+        return self.path.exists()
+
+    def add(self, artist_urls):
+        with self.lock, open(self.path, 'a') as f:
+            f.writelines(f'{url}\n' for url in artist_urls)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def completed(self):
+        if not self.path.exists():
+            return pd.Series([], dtype=object).unique()
+        return pd.Series(self.path.read_text().split()).unique()
+
+
+def completion_log(output_path):
+    '''The CompletionLog kept next to an output.'''
+    output_path = Path(output_path)
+    return CompletionLog(output_path.with_name(f'{output_path.name}.done'))
+
+
+def open_output(path, output_format, partition_by='artist'):
+    if output_format == 'parquet':
+        return ParquetOutput(path, partition_by=partition_by)
+    return CsvOutput(path)
+
+
+def open_snapshots(path, output_format):
+    '''Time-stamped content stats, partitioned by day in Parquet.'''
+    if output_format == 'parquet':
+        return ParquetOutput(path, partition_by='date',
+                             schema=SNAPSHOT_SCHEMA)
+    return CsvOutput(path)
+
+
+def convert_csv(csv_path, parquet_path, partition_by='artist',
+                chunksize=500000):
+    '''Copy an existing data.csv into a Parquet output.'''
+    output = ParquetOutput(parquet_path, partition_by=partition_by)
+    n_rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        output.write(chunk.set_index('artist url'))
+        n_rows += len(chunk)
+    return n_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert a CSV output of the scraper to Parquet')
+    parser.add_argument('csv_path')
+    parser.add_argument('parquet_path')
+    parser.add_argument('--partition-by', choices=['artist', 'date'],
+                        default='artist')
+    args = parser.parse_args()
+    n_rows = convert_csv(args.csv_path, args.parquet_path, args.partition_by)
+    print(f'Converted {n_rows} rows to "{args.parquet_path}"')
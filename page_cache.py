@@ -0,0 +1,182 @@
+#! /bin/env python3
+
+from pathlib import Path
+import threading as t
+import hashlib
+import sqlite3
+import json
+import time
+import zlib
+import os
+
+from load_profiles import STAGES
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    stage TEXT NOT NULL,
+    url TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (stage, url)
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed);
+CREATE INDEX IF NOT EXISTS pages_hash ON pages (hash);
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+'''
+
+
+def parse_ttls(spec):
+    '''Parse "24" or "collections=168,stats=6" into seconds per stage from
+    a number of hours. Stages not listed are trusted whatever their age.'''
+    if '=' not in spec:
+        return dict.fromkeys(STAGES, float(spec) * 3600)
+    ttls = {}
+    for item in spec.split(','):
+        stage, hours = item.split('=')
+        if stage not in STAGES:
+            raise ValueError(f'Unknown stage "{stage}"')
+        ttls[stage] = float(hours) * 3600
+    return ttls
+
+
+class PageCache:
+    '''What the stage functions extracted from every page, on disk.
+
+    Payloads are stored zlib-compressed under `path`/objects, in files
+    named by the hash of their content so identical payloads are stored
+    once, and indexed by stage and URL in `path`/index.db. Entries older
+    than the TTL of their stage (`ttls`, seconds per stage) are not
+    returned, and the least recently used ones are evicted once the
+    objects add up to more than `max_bytes`, checked every
+    `evict_every` puts.
+
+    Safe to share between threads, and between processes opening the same
+    path.'''
+
+    def __init__(self, path, max_bytes=None, ttls=None, level=6,
+                 evict_every=100):
+        self.path = Path(path)
+        self.objects = self.path / 'objects'
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.level = level
+        self.evict_every = evict_every
+        self.n_puts = 0
+        self.lock = t.Lock()
+        self.connection = sqlite3.connect(str(self.path / 'index.db'),
+                                          check_same_thread=False,
+                                          timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def size(self):
+        '''Bytes of compressed payloads on disk.'''
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def _object_path(self, digest):
+        return self.objects / digest[:2] / digest[2:]
+
+    def get(self, stage, url):
+        '''Payload cached for the URL, None when missing or expired.'''
+        now = time.time()
+        ttl = self.ttls.get(stage)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT hash, stored FROM pages WHERE stage = ? AND url = ?',
+                (stage, url)).fetchone()
+            if row is None or ttl is not None and now - row[1] > ttl:
+                return None
+            with self.connection:
+                self.connection.execute(
+                    'UPDATE pages SET accessed = ? WHERE stage = ? AND url = ?',
+                    (now, stage, url))
+        try:
+            data = self._object_path(row[0]).read_bytes()
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            return None
+        return json.loads(zlib.decompress(data))
+
+    def put(self, stage, url, payload):
+        '''Cache a JSON serialisable payload.'''
+        data = zlib.compress(json.dumps(payload).encode(), self.level)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.'
+                                      f'{t.get_ident()}.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        now = time.time()
+        with self.lock, self.connection:
+            old = self.connection.execute(
+                'SELECT hash FROM pages WHERE stage = ? AND url = ?',
+                (stage, url)).fetchone()
+            self.connection.execute(
+                'INSERT OR IGNORE INTO objects VALUES (?, ?)',
+                (digest, len(data)))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                (stage, url, digest, now, now))
+            if old is not None and old[0] != digest:
+                self._drop_unreferenced([old[0]])
+            self.n_puts += 1
+            check = self.n_puts % self.evict_every == 0
+        if self.max_bytes is not None and check:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        '''Drop the least recently used entries until the objects take at
+        most `max_bytes`. Returns the number of entries dropped.'''
+        dropped = 0
+        with self.lock, self.connection:
+            size = self.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+            if size <= max_bytes:
+                return 0
+            rows = self.connection.execute(
+                'SELECT stage, url, hash FROM pages ORDER BY accessed')
+            for stage, url, digest in rows.fetchall():
+                self.connection.execute(
+                    'DELETE FROM pages WHERE stage = ? AND url = ?',
+                    (stage, url))
+                dropped += 1
+                size -= self._drop_unreferenced([digest])
+                if size <= max_bytes:
+                    break
+        return dropped
+
+    def _drop_unreferenced(self, digests):
+        freed = 0
+        for digest in digests:
+            if self.connection.execute(
+                    'SELECT 1 FROM pages WHERE hash = ? LIMIT 1',
+                    (digest,)).fetchone() is not None:
+                continue
+            row = self.connection.execute(
+                'SELECT size FROM objects WHERE hash = ?',
+                (digest,)).fetchone()
+            self.connection.execute('DELETE FROM objects WHERE hash = ?',
+                                    (digest,))
+            self._object_path(digest).unlink(missing_ok=True)
+            freed += row[0] if row is not None else 0
+        return freed
@@ -6,23 +6,48 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (NoSuchElementException,
-                                        TimeoutException, ElementClickInterceptedException)
+                                        TimeoutException, ElementClickInterceptedException,
+                                        WebDriverException)
 import pandas as pd
 import numpy as np
-import datetime
-import threading as t
-from concurrent.futures import ThreadPoolExecutor
 import psutil
 from operator import methodcaller
-from functools import partial
+from functools import partial, wraps
 from itertools import chain
 from itertools import chain
 import math
 import time
-import sys
+import socket
 import gc
 from pathlib import Path
+import os
 import logging
+import argparse
+import tempfile
+import shutil
+
+from http_stats import STATS_XPATH, fetch_content_stats
+from pipeline import StagePipeline, OUTPUT_COLUMNS
+from output import open_output, open_snapshots, completion_log, CsvOutput
+from frontier import Frontier
+from retry import RetryPolicy, CircuitBreaker, retry_call
+from driver_pool import DriverPool, renew_driver
+from scroll import ScrollSettings, scroll_to_end
+from load_profiles import (parse_stage_profiles, page_load_strategy,
+                           apply_load_profile, needs_full_load)
+from metrics import Metrics, serve_metrics, SnapshotWriter
+from controller import AdaptiveController, RateLimiter
+from content_index import ContentIndex
+from refresh import known_content, schedule, to_snapshot
+from scheduler import CostModel, batches_by_cost
+from backends import ThreadBackend, AsyncioBackend, ProcessBackend
+from records import (CollectionRecord, ContentRecord, StatsRecord, Failed,
+                     nan_record, to_frame, from_frame)
+from normalize import normalize_stats
+from memory import MemoryBudget, SpillBuffer
+from coordinator import open_queue, LeaseKeeper
+from page_cache import PageCache, parse_ttls
+from aggregates import AggregateStore, AggregatedOutput
 
 
 logs_dir = Path('./logs')
@@ -44,8 +69,11 @@ def setup_logger(name):
 
 n_physical_cores = psutil.cpu_count(logical=False)
 
+# Points the scraper at another host, e.g. the local mock_pexels.py server
+BASE_URL = os.environ.get('PEXELS_BASE_URL', 'https://www.pexels.com')
+
 
-def create_driver(logger):
+def create_driver(logger, profile_template=None, stage_profiles=None):
     chrome_options = webdriver.ChromeOptions()
     chrome_options.headless = True
     # chrome_options.javascriptEnabled = True
@@ -58,37 +86,199 @@ def create_driver(logger):
     chrome_options.add_argument('seleniumProtocol=WebDriver')
     chrome_options.add_argument(
         "user-agent=Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.125 Safari/537.36")
-    while True:
-        try:
-            driver = webdriver.Chrome(options=chrome_options)
-            logger.info( 'Webdriver initialised correctly.')
-            return driver
-        except:
-            logger.exception(
-                'Web driver could not be initialised. Retrying...')
-
-def vectorize(function):
+    if stage_profiles is not None:
+        chrome_options.page_load_strategy = page_load_strategy(stage_profiles)
+    profile_dir = None
+    if profile_template is not None:
+        # Chrome locks its user data dir so every driver gets its own copy
+        profile_dir = tempfile.mkdtemp(prefix='chrome-profile-')
+        shutil.copytree(profile_template, profile_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('Singleton*'))
+        chrome_options.add_argument(f'--user-data-dir={profile_dir}')
+    # A single attempt, DriverPool retries the drivers that fail to start
+    try:
+        driver = webdriver.Chrome(options=chrome_options)
+    except WebDriverException:
+        if profile_dir is not None:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    driver.profile_dir = profile_dir
+    driver.stage_profiles = stage_profiles
+    logger.info( 'Webdriver initialised correctly.')
+    return driver
+
+
+def quit_driver(driver):
+    driver.quit()
+    if getattr(driver, 'profile_dir', None) is not None:
+        shutil.rmtree(driver.profile_dir, ignore_errors=True)
+
+retry_policy = RetryPolicy()
+circuit_breaker = CircuitBreaker()
+metrics = Metrics()
+# Set by main() when --max-rate is given
+rate_limiter = None
+# Replaced by a persistent index with --content-index
+content_index = ContentIndex()
+# Items per collection seen in the output, in split mode, or while scraping
+collection_sizes = CostModel()
+# Set by main() when --raw-stats is given
+raw_stats = None
+# Set by main() when --memory-budget is given
+memory_budget = None
+spill_dir = None
+# Set by configure() with --page-cache, --replay only reads it
+page_cache = None
+replay = False
+
+
+def mark_fallback():
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.outcome = 'fallback'
+
+
+def cached_records(stage, record, url):
+    if page_cache is None:
+        return None
+    payload = page_cache.get(stage, url)
+    metrics.inc('page_cache_total', stage=stage,
+                outcome='miss' if payload is None else 'hit')
+    if payload is None:
+        return None
+    return [record(*fields) for fields in payload]
+
+
+class DriverCrashed(WebDriverException):
+    pass
+
+
+# Page loads that may work on another attempt, anything else is a bug
+RETRIED_EXCEPTIONS = (TimeoutException, ElementClickInterceptedException,
+                      DriverCrashed)
+
+
+def vectorize(function=None, *, stage, record, failed):
+    if function is None:
+        return partial(vectorize, stage=stage, record=record, failed=failed)
+
+    # Keeps the name of the stage function so the process backends can
+    # pickle it by reference
+    @wraps(function)
     def wrapper(driver, logger, array):
         if not isinstance(array, np.ndarray):
             array = np.array(array, ndmin=1)
-        f = partial(function, driver, logger)
-        while True:
+        apply_load_profile(driver, stage)
+
+        def attempt(item):
+            nonlocal driver
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            metrics.inc('attempts_total', stage=stage)
             try:
-                return list(map(f, array))
-            except TimeoutException:
-                logger.exception('Timeout exception')
+                return function(driver, logger, item)
+            except RETRIED_EXCEPTIONS:
+                # Read by the adaptive controller
+                metrics.inc('attempt_errors_total', stage=stage)
+                raise
+            except WebDriverException as e:
+                if driver_is_alive(driver):
+                    raise
+                metrics.inc('attempt_errors_total', stage=stage)
+                # The next attempt runs on a new browser
+                driver = renew_driver(driver)
+                apply_load_profile(driver, stage)
+                raise DriverCrashed(f'Driver crashed on {item}') from e
+
+        def give_up(item, error):
+            mark_fallback()
+            return failed(item, error)
+        results = []
+        for item in array:
+            with metrics.trace(stage, item) as trace:
+                cached = cached_records(stage, record, str(item))
+                if cached is not None:
+                    results.append(cached)
+                    continue
+                if replay:
+                    logger.warning(f'{item} is not in the page cache')
+                    results.append(give_up(item, None))
+                    continue
+                result = retry_call(attempt, item, retry_policy,
+                                    circuit_breaker, logger, give_up,
+                                    exceptions=RETRIED_EXCEPTIONS)
+                # Fallbacks are not cached so they get scraped again
+                if page_cache is not None and trace.outcome == 'ok':
+                    page_cache.put(stage, str(item), [list(r) for r in result])
+                results.append(result)
+        return results
+    wrapper.record = record
     return wrapper
 
 
-@vectorize
+def scrape_items(drivers, function, urls, cost=None, failed=None):
+    '''Every record a stage function returns for the URLs, in a single
+    list. The URLs it gave up on are added to `failed` when given.'''
+    urls = list(urls)
+    results = [records for result
+               in drivers.map_items(function, urls, cost=cost)
+               for records in result]
+    if failed is not None:
+        failed.extend(url for url, records in zip(urls, results)
+                      if isinstance(records, Failed))
+    return list(chain.from_iterable(results))
+
+
+def scrape_frame(drivers, function, urls, cost=None, failed=None):
+    '''Run a stage function on every URL and put all of the records it
+    returns in a single DataFrame.'''
+    return to_frame(function.record,
+                    scrape_items(drivers, function, urls, cost, failed))
+
+
+class TruncatedCollection(TimeoutException):
+    def __init__(self, collection_url, result, partial):
+        super().__init__(
+            f'{collection_url} stopped loading after {result.steps} scroll '
+            f'steps ({result.reason}) with {len(partial)} items')
+        self.partial = partial
+
+
+def load_page(driver, stage, url, timeout=30):
+    '''driver.get, waiting for the load to complete on eager drivers in
+    the stages that parse the page right away.'''
+    with metrics.span('navigate'):
+        driver.get(url)
+    if needs_full_load(driver, stage):
+        with metrics.span('wait'):
+            WebDriverWait(driver, timeout).until(
+                lambda driver: driver.execute_script(
+                    'return document.readyState') == 'complete')
+
+
+def no_collections(artist_url, error=None):
+    return Failed()
+
+
+def no_content(collection_url, error=None):
+    # A collection that never fully loaded keeps what was scraped, but is
+    # still not done
+    if isinstance(error, TruncatedCollection):
+        return Failed(error.partial)
+    return Failed()
+
+
+@vectorize(stage='collections', record=CollectionRecord,
+           failed=no_collections)
 def get_collections_urls(driver, logger, artist_url):
     collections_url = artist_url + '/collections/'
-    driver.get(collections_url)
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    artist_name = driver.find_element_by_tag_name('h1').text
+    load_page(driver, 'collections', collections_url)
+    with metrics.span('parse'):
+        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        artist_name = driver.find_element_by_tag_name('h1').text
+        matches = soup.find_all(
+            'a', {'class': 'discover__collections__collection'})
     logger.info(f'COLLECTIONS from "{artist_name}":')
-    matches = soup.find_all(
-        'a', {'class': 'discover__collections__collection'})
 
     # likes and featured uploads should not be included
     def collections_filter(collection):
@@ -97,208 +287,879 @@ def get_collections_urls(driver, logger, artist_url):
         return not likes_collection and not featured_uploads_collection
     collections_dirs = list(
         filter(collections_filter, map(methodcaller('get', 'href'), matches)))
-    data = {
-        'artist name': [artist_name] * len(collections_dirs),
-        'collection url': collections_dirs
-    }
-    index = [artist_url] * len(collections_dirs)
-    df = pd.DataFrame(data, index=index)
-    df['collection url'] = 'https://www.pexels.com' + \
-        df['collection url'].astype(str)
-    return df
-
-
-@vectorize
+    return [CollectionRecord(artist_url, artist_name, BASE_URL + str(href))
+            for href in collections_dirs]
+
+
+VIDEO_CLASS = 'js-photo-link js-photo-item__link photo-item__link'
+PHOTO_CLASS = 'js-photo-link photo-item__link'
+
+# Returns the hrefs of the content links that were not returned by a
+# previous call on the same page, so only new items cross the WebDriver
+# protocol after each scroll step
+NEW_LINKS_SCRIPT = f"""
+const seen = window.__scraperSeenLinks || (window.__scraperSeenLinks = new Set());
+const links = document.querySelectorAll(
+    'a[class="{PHOTO_CLASS}"], a[class="{VIDEO_CLASS}"]');
+const fresh = [];
+for (const link of links) {{
+    const href = link.getAttribute('href');
+    if (href !== null && !seen.has(href)) {{
+        seen.add(href);
+        fresh.push(href);
+    }}
+}}
+return fresh;
+"""
+
+# 'page-source' parses the scrolled DOM with BeautifulSoup, 'script'
+# collects the links in the browser while scrolling
+link_extraction = 'page-source'
+
+
+COUNT_LINKS_SCRIPT = f"""
+return document.querySelectorAll(
+    'a[class="{PHOTO_CLASS}"], a[class="{VIDEO_CLASS}"]').length;
+"""
+
+# 'adaptive' waits on page activity (see scroll.py), 'fixed' sleeps one
+# second after every scroll
+scroll_engine = 'adaptive'
+scroll_settings = ScrollSettings()
+
+
+def collect_new_links(driver):
+    return driver.execute_script(NEW_LINKS_SCRIPT)
+
+
+@vectorize(stage='content', record=ContentRecord, failed=no_content)
 def get_content_urls(driver, logger, collection_url):
-    driver.get(collection_url)
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    collection_name = soup.find('h1').get_text().strip('\n')
+    load_page(driver, 'content', collection_url)
+    in_browser = link_extraction == 'script'
+    if in_browser:
+        collection_name = driver.find_element(
+            By.TAG_NAME, 'h1').get_attribute('textContent').strip('\n')
+        content_dirs = collect_new_links(driver)
+    else:
+        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        collection_name = soup.find('h1').get_text().strip('\n')
     artist_name = driver.find_element_by_tag_name('span').text
     logger.info(
         f'FETCHING CONTENT from "{artist_name}" in "{collection_name}" collection')
 
-    old_scroll_height = 0
-    new_scroll_height = driver.execute_script(
-        "return document.body.scrollHeight;")
-    while old_scroll_height < new_scroll_height:
-        old_scroll_height = new_scroll_height
-        driver.execute_script(f"window.scrollTo(0, {old_scroll_height});")
-        time.sleep(1)
-        new_scroll_height = driver.execute_script(
-            "return document.body.scrollHeight;")
-
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    video_class = 'js-photo-link js-photo-item__link photo-item__link'
-    photo_class = 'js-photo-link photo-item__link'
-    photos = soup.find_all('a', {'class': photo_class})
-    videos = soup.find_all('a', {'class': video_class})
-    content_dirs = list(
-        map(methodcaller('get', 'href'), chain(photos, videos)))
-    data = {
-        'collection name': [collection_name] * len(content_dirs),
-        'content url': content_dirs
-    }
-    index = [collection_url] * len(content_dirs)
-    df = pd.DataFrame(data, index=index)
-    df['content url'] = 'https://www.pexels.com' + \
-        df['content url'].astype(str)
+    if scroll_engine == 'adaptive':
+        if in_browser:
+            def collect():
+                new_links = collect_new_links(driver)
+                content_dirs.extend(new_links)
+                return len(new_links)
+        else:
+            n_links = driver.execute_script(COUNT_LINKS_SCRIPT)
+
+            def collect():
+                nonlocal n_links
+                n = driver.execute_script(COUNT_LINKS_SCRIPT)
+                new_links, n_links = n - n_links, n
+                return new_links
+        with metrics.span('scroll'):
+            scroll = scroll_to_end(driver, collect, scroll_settings)
+        logger.info(f'Scrolled "{collection_name}" in {scroll.steps} steps '
+                    f'and {scroll.elapsed:.1f}s ({scroll.reason})')
+    else:
+        with metrics.span('scroll'):
+            old_scroll_height = 0
+            new_scroll_height = driver.execute_script(
+                "return document.body.scrollHeight;")
+            while old_scroll_height < new_scroll_height:
+                old_scroll_height = new_scroll_height
+                driver.execute_script(
+                    f"window.scrollTo(0, {old_scroll_height});")
+                time.sleep(1)
+                if in_browser:
+                    content_dirs.extend(collect_new_links(driver))
+                new_scroll_height = driver.execute_script(
+                    "return document.body.scrollHeight;")
+
+    if not in_browser:
+        with metrics.span('parse'):
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
+            photos = soup.find_all('a', {'class': PHOTO_CLASS})
+            videos = soup.find_all('a', {'class': VIDEO_CLASS})
+            content_dirs = list(
+                map(methodcaller('get', 'href'), chain(photos, videos)))
+    content = [ContentRecord(collection_url, collection_name,
+                             BASE_URL + str(href)) for href in content_dirs]
     logger.info(
         f'GOT CONTENT from "{artist_name}" in "{collection_name}" collection')
-    return df
-
-
-def to_number(string):
-    d = {
-        'K': 1000,
-        'M': 1000000,
-        'B': 1000000000
-    }
-    if string[-1] in list(d.keys()):
-        key = string[-1]
-        number = int(float(string.strip(key)) * d[key])
-    else:
-        number = int(string)
-    return number
+    metrics.inc('content_links_total', len(content))
+    if scroll_engine == 'adaptive' and not scroll.complete:
+        raise TruncatedCollection(collection_url, scroll, content)
+    return content
 
 
-@vectorize
+@vectorize(stage='stats', record=StatsRecord, failed=nan_record)
 def get_content_stats(driver, logger, content_url):
     logger.info(f'SCRAPING stats from {content_url}')
-    driver.get(content_url)
-    xpath = {
-        'button': '//*[@id="photo-page-body"]/div/div/section[1]/div[1]/button[2]',
-        'title': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[2]/div[1]/div[2]/div/h1/strong',
-        'views': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[2]/div/div[1]/div/div/div[2]/div',
-        'likes': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[3]/div/div[2]/div',
-        'downloads': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[1]/div[2]/div[3]/div/div[1]/div',
-        'upload date': '//*[@id="photo-page-body"]/div/div/section[1]/div[2]/div/div[2]/div[1]/div[2]/div/small'
-    }
-    for i in range(3):
-        try:
-            WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.XPATH, xpath['button']))).click()
-            WebDriverWait(driver, 5).until(
-                EC.visibility_of_element_located((By.XPATH, xpath['views'])))
-            break
-        except (ElementClickInterceptedException, TimeoutException):
-            logger.warning(
-                'Web driver timed out when looking '
-                f'for the info button in {content_url}. Retrying...')
-            driver.get('about:blank')
-            time.sleep(2)
-            driver.get(content_url)
-            if i == 2:
-                logger.warning(
-                    f'{content_url} is corrupted. Assigning NA '
-                    'values to this piece of content')
-                data = {
-                    'title': [np.nan],
-                    'views': [np.nan],
-                    'downloads': [np.nan],
-                    'likes': [np.nan],
-                    'upload date': [np.nan]
-                }
-                return pd.DataFrame(data, index=[content_url])
+    with metrics.span('navigate'):
+        driver.get(content_url)
+    xpath = STATS_XPATH
+    # Timeouts go to retry_call, which reloads the page and feeds the
+    # circuit breaker
+    with metrics.span('wait'):
+        WebDriverWait(driver, 5).until(EC.element_to_be_clickable(
+            (By.XPATH, xpath['button']))).click()
+        WebDriverWait(driver, 5).until(
+            EC.visibility_of_element_located((By.XPATH, xpath['views'])))
 
     def get_str_from_xpath(
         xpath): return driver.find_element_by_xpath(xpath).text
-    def get_date(string): return datetime.datetime.strptime(
-        string, "Uploaded at %B %d, %Y").strftime('%Y-%m-%d')
+    with metrics.span('parse'):
+        try:
+            title = driver.find_element_by_xpath(xpath['title']).text
+        except NoSuchElementException:
+            title = ''
+        # Raw page text, normalise() turns the whole stage into numbers
+        record = StatsRecord(
+            content_url, title,
+            get_str_from_xpath(xpath['views']),
+            get_str_from_xpath(xpath['downloads']),
+            get_str_from_xpath(xpath['likes']),
+            get_str_from_xpath(xpath['upload date']))
+    return [record]
+
+
+def driver_is_alive(driver):
+    try:
+        driver.execute_script('return 1;')
+        return True
+    except WebDriverException:
+        return False
+
+
+class ThreadedDrivers(DriverPool):
+    def __init__(self, n_threads, main_logger, profile_template=None,
+                 stage_profiles=None, name_prefix='', **pool_options):
+        loggers = [setup_logger(f'{name_prefix}{i}') for i in range(n_threads)]
+        create = partial(create_driver, profile_template=profile_template,
+                         stage_profiles=stage_profiles)
+        super().__init__(n_threads, create, loggers, main_logger,
+                         is_alive=driver_is_alive, quit=quit_driver,
+                         **pool_options)
+
+
+def make_drivers(args, n_drivers, main_logger, name_prefix=''):
+    if args.replay:
+        # The stage functions only read the page cache
+        loggers = [setup_logger(f'{name_prefix}{i}')
+                   for i in range(n_drivers)]
+        return DriverPool(n_drivers, lambda logger: None, loggers,
+                          main_logger, rss=lambda driver: 0,
+                          quit=lambda driver: None, n_spares=0)
+    max_rss = args.max_rss * 2**20 if args.max_rss else None
+    return ThreadedDrivers(n_drivers, main_logger,
+                           max_pages=args.max_pages, max_rss=max_rss,
+                           checkout_timeout=args.checkout_timeout,
+                           profile_template=args.profile_dir,
+                           startup_concurrency=args.startup_concurrency,
+                           stage_profiles=args.stage_profiles,
+                           name_prefix=name_prefix)
+
+
+def make_worker_backend(args, n_threads):
+    '''Backend of a worker process of the processes and hybrid backends.'''
+    configure(args)
+    name = f'process-{os.getpid()}'
+    logger = setup_logger(name)
+    drivers = make_drivers(args, n_threads, logger, name_prefix=f'{name}-')
+    return ThreadBackend(drivers, speculate=not args.no_speculation,
+                         straggler_factor=args.straggler_factor,
+                         logger=logger)
+
+
+def make_backend(args, n_drivers, main_logger):
+    '''Run the stages on `n_drivers` drivers with the --backend of args.'''
+    if args.backend in ('processes', 'hybrid'):
+        threads = args.threads_per_process if args.backend == 'hybrid' else 1
+        n_processes = max(n_drivers // threads, 1)
+        main_logger.info(f'Starting {n_processes} processes with '
+                         f'{threads} drivers each')
+        worker_args = argparse.Namespace(**vars(args))
+        if args.max_rate:
+            worker_args.max_rate = args.max_rate / n_processes
+        return ProcessBackend(n_processes, make_worker_backend,
+                              (worker_args, threads),
+                              threads_per_process=threads)
+    backend = AsyncioBackend if args.backend == 'asyncio' else ThreadBackend
+    drivers = make_drivers(args, n_drivers, main_logger)
+    return backend(drivers, speculate=not args.no_speculation,
+                   straggler_factor=args.straggler_factor,
+                   logger=main_logger)
+
+
+def register_backend_metrics(backend):
+    metrics.gauge('speculative_total',
+                  lambda: backend.stats().get('speculative', 0))
+    drivers = getattr(backend, 'pool', None)
+    if drivers is None:
+        return
+    metrics.gauge('driver_utilisation', drivers.utilisation)
+    metrics.gauge('drivers_busy', lambda: drivers.stats()['drivers busy'])
+    metrics.gauge('drivers_ready', lambda: drivers.stats()['drivers ready'])
+    metrics.gauge('checkout_wait_mean',
+                  lambda: drivers.stats()['checkout wait mean'])
+    metrics.gauge('circuit_breaker_open', lambda: int(circuit_breaker.is_open))
+
+
+def throttle():
+    '''Wait before starting new work while over the memory budget.'''
+    if memory_budget is not None:
+        memory_budget.throttle()
+
+
+def scrape_content_urls(drivers, collection_urls, failed=None):
+    # Largest collections first so they don't end up last on one driver
+    content = scrape_frame(drivers, get_content_urls, collection_urls,
+                           cost=collection_sizes, failed=failed)
+    collection_sizes.update(content.index.value_counts())
+    return content
+
+
+def get_content_stats_http(drivers, content_urls, logger):
+    with metrics.timer('http_batch_seconds'):
+        stats, failed = fetch_content_stats(content_urls, logger)
+    metrics.inc('http_pages_total', len(stats), outcome='parsed')
+    metrics.inc('http_pages_total', len(failed), outcome='browser')
+    if failed:
+        logger.info(f'Falling back to Selenium for {len(failed)} pages')
+        stats = pd.concat(
+            [stats, scrape_frame(drivers, get_content_stats, failed)])
+    return stats
+
+
+def normalize(raw, logger):
+    '''Normalised stats of a batch of raw stats, saved first with
+    --raw-stats so they can be normalised again later.'''
+    if raw_stats is not None and len(raw):
+        raw_stats.write(raw)
+    with metrics.timer('normalize_seconds'):
+        stats, errors = normalize_stats(raw)
+    for content_url, field, value in errors.itertuples():
+        logger.warning(f'Malformed {field} "{value}" in {content_url}')
+        metrics.inc('malformed_values_total', field=field)
+    return stats
+
+
+def scrape_content_stats(drivers, content_urls, stats_engine, logger):
+    if stats_engine == 'http':
+        raw = get_content_stats_http(drivers, content_urls, logger)
+    else:
+        raw = scrape_frame(drivers, get_content_stats, content_urls)
+    return normalize(raw, logger)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Scrape collections and content stats from pexels.com')
+    parser.add_argument('artists_urls_file', nargs='?',
+                        default='artists_urls.csv')
+    parser.add_argument('data_filename', nargs='?', default='data.csv')
+    parser.add_argument('--stats-engine', choices=['selenium', 'http'],
+                        default='selenium',
+                        help='engine used to scrape the content stats pages')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='stream the stages through bounded queues '
+                        'instead of scraping in 5-artist splits')
+    parser.add_argument('--queue-size', type=int, default=1000,
+                        help='bound of each pipeline queue')
+    parser.add_argument('--memory-budget', type=float, metavar='GB',
+                        help='memory of the scraper and its browsers: over '
+                        'it intermediate results are spilled to disk and '
+                        'new work is paused')
+    parser.add_argument('--spill-dir', metavar='PATH',
+                        help='directory of the spilled results (default: '
+                        'a temporary directory)')
+    parser.add_argument('--coordinator', metavar='URL|PATH',
+                        help='lease artists and collections from a queue '
+                        'shared by several nodes: the URL of '
+                        '"coordinator.py serve" or a queue database file')
+    parser.add_argument('--node', default=f'{socket.gethostname()}-'
+                        f'{os.getpid()}',
+                        help='name of this node in the shared queue')
+    parser.add_argument('--page-cache', metavar='PATH',
+                        help='directory caching what was extracted from '
+                        'every page so re-runs skip the pages already seen')
+    parser.add_argument('--cache-size', type=float, default=10,
+                        metavar='GB', help='size of the page cache')
+    parser.add_argument('--cache-ttl', default='24',
+                        help='hours a cached page is trusted, for every '
+                        'stage ("24") or per stage ("collections=168,'
+                        'stats=6")')
+    parser.add_argument('--replay', action='store_true',
+                        help='run offline from the page cache only, '
+                        'without starting any browser')
+    parser.add_argument('--aggregates', metavar='PATH',
+                        help='SQLite database of per-artist and '
+                        'per-collection aggregates updated with every '
+                        'batch written (see aggregates.py)')
+    parser.add_argument('--frontier', metavar='PATH',
+                        help='SQLite crawl frontier used to resume runs '
+                        'at URL level')
+    parser.add_argument('--max-attempts', type=int, default=5,
+                        help='attempts per URL before recording it as failed')
+    parser.add_argument('--backoff', type=float, default=1,
+                        help='base delay in seconds of the exponential backoff')
+    parser.add_argument('--max-pages', type=int, default=500,
+                        help='pages served by a driver before recycling it')
+    parser.add_argument('--max-rss', type=int, metavar='MB',
+                        help='recycle drivers whose browser uses more memory')
+    parser.add_argument('--checkout-timeout', type=float,
+                        help='seconds to wait for a free driver')
+    parser.add_argument('--profile-dir', metavar='PATH',
+                        help='pre-built Chrome profile copied for every driver')
+    parser.add_argument('--startup-concurrency', type=int,
+                        help='browsers launched at the same time on startup')
+    parser.add_argument('--load-profile', default='full',
+                        help='page load profile ("full" or "light") for all '
+                        'stages or per stage as "collections=light,'
+                        'content=light,stats=full"')
+    parser.add_argument('--link-extraction',
+                        choices=['page-source', 'script'],
+                        default='page-source',
+                        help='parse the scrolled page source in Python or '
+                        'collect content links in the browser while scrolling')
+    parser.add_argument('--scroll', choices=['adaptive', 'fixed'],
+                        default='adaptive',
+                        help='how collections are scrolled to the end')
+    parser.add_argument('--max-scroll-wait', type=float, default=20,
+                        help='longest wait in seconds for a scroll step to '
+                        'load new items')
+    parser.add_argument('--output-format', choices=['csv', 'parquet'],
+                        default='csv',
+                        help='append rows to a CSV file or write Parquet '
+                        'files into the data_filename directory')
+    parser.add_argument('--partition-by', choices=['artist', 'date'],
+                        default='artist',
+                        help='partitioning of the Parquet output')
+    parser.add_argument('--backend',
+                        choices=['threads', 'processes', 'asyncio', 'hybrid'],
+                        default='threads',
+                        help='how the drivers are run: threads of this '
+                        'process, one worker process each, an asyncio event '
+                        'loop, or processes with --threads-per-process '
+                        'drivers each')
+    parser.add_argument('--drivers', type=int,
+                        help='number of drivers (physical cores by default)')
+    parser.add_argument('--threads-per-process', type=int, default=2,
+                        help='drivers per worker process of --backend hybrid')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adjust the number of active drivers (and the '
+                        'request rate with --max-rate) to timeouts, latency '
+                        'and host load while the job runs')
+    parser.add_argument('--max-drivers', type=int,
+                        default=2 * n_physical_cores,
+                        help='drivers started for --adaptive')
+    parser.add_argument('--min-drivers', type=int, default=1,
+                        help='lowest number of active drivers for --adaptive')
+    parser.add_argument('--max-rate', type=float,
+                        help='pages per second requested by all drivers')
+    parser.add_argument('--control-interval', type=float, default=10,
+                        help='seconds between two --adaptive adjustments')
+    parser.add_argument('--content-index', metavar='PATH',
+                        help='SQLite index of scraped content stats reused '
+                        'across runs')
+    parser.add_argument('--raw-stats', metavar='PATH',
+                        help='CSV file keeping the stats as scraped, before '
+                        'normalisation, see normalize.py')
+    parser.add_argument('--freshness', type=float, default=7,
+                        help='days before content in the index is scraped '
+                        'again')
+    parser.add_argument('--refresh', action='store_true',
+                        help='only scrape again the stats of content '
+                        'already in data_filename, the stalest and most '
+                        'popular first, and append them to --snapshots')
+    parser.add_argument('--snapshots', metavar='PATH',
+                        default='snapshots.csv',
+                        help='time-stamped stats written by --refresh')
+    parser.add_argument('--budget', type=int, default=1000,
+                        help='content pages scraped by --refresh')
+    parser.add_argument('--min-age', type=float, default=1,
+                        help='days before --refresh scrapes content again')
+    parser.add_argument('--popularity-weight', type=float, default=1,
+                        help='how much more often --refresh visits content '
+                        'with more views')
+    parser.add_argument('--no-speculation', action='store_true',
+                        help='never re-issue slow URLs on idle drivers')
+    parser.add_argument('--straggler-factor', type=float, default=2,
+                        help='how many times slower than expected a URL '
+                        'runs before it is re-issued')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve /metrics, /metrics.json and /traces on '
+                        'this local port')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='append periodic JSON metrics snapshots to PATH')
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help='seconds between metrics snapshots')
+    parser.add_argument('--trace-file', metavar='PATH',
+                        help='append a JSON trace of every scraped URL to PATH')
+    args = parser.parse_args()
+    try:
+        args.stage_profiles = parse_stage_profiles(args.load_profile)
+    except ValueError as e:
+        parser.error(str(e))
     try:
-        title = driver.find_element_by_xpath(xpath['title']).text
-    except NoSuchElementException:
-        title = ''
-    data = {
-        'title': [title],
-        'views': [to_number(get_str_from_xpath(xpath['views']))],
-        'downloads': [to_number(get_str_from_xpath(xpath['downloads']))],
-        'likes': [to_number(get_str_from_xpath(xpath['likes']))],
-        'upload date': [get_date(get_str_from_xpath(xpath['upload date']))]
-    }
-    return pd.DataFrame(data, index=[content_url])
-
-
-class ThreadedDrivers:
-    def __init__(self, n_threads, main_logger):
-        self.loggers = [setup_logger(str(i)) for i in range(n_threads)]
-        self.drivers = [create_driver(self.loggers[i]) for i in range(n_threads)]
-        self.locks = [t.Lock() for _ in range(n_threads)]
-        self.main_logger = main_logger
-
-    def acquire_lock(self):
-        for i, lock in enumerate(self.locks):
-            if lock.acquire(blocking=False):
-                self.loggers[i].info(f'Lock {i} acquired')
-                return i
-        raise IndexError('No more drivers available')
-
-    def func_wrapper(self, function, array):
-        n_lock = self.acquire_lock()
-        driver = self.drivers[n_lock]
-        logger = self.loggers[n_lock]
-        result = function(driver, logger, array)
-        self.locks[n_lock].release()
-        self.loggers[n_lock].info(f'Lock {n_lock} released')
-        return result
-
-    def map(self, function, array):
-        f = partial(ThreadedDrivers.func_wrapper, self, function)
-        max_chunksize = max(len(array)//(len(self.drivers)), 1)
-        chunksize = min(max_chunksize, 2000)
-        self.main_logger.info(f'Array length: {len(array)}')
-        self.main_logger.info(f'Max chunksize: {max_chunksize}')
-        self.main_logger.info(f'chunksize: {chunksize}')
-        with ThreadPoolExecutor(max_workers=len(self.drivers)) as executor:
-            return pd.concat(chain.from_iterable(executor.map(f, array, chunksize=chunksize)))
+        args.cache_ttl = parse_ttls(args.cache_ttl)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.replay and not args.page_cache:
+        parser.error('--replay needs a --page-cache')
+    if args.replay and args.stats_engine != 'selenium':
+        parser.error('--replay only supports the selenium stats engine')
+    if set(args.stage_profiles.values()) == {'full'}:
+        args.stage_profiles = None
+    if args.pipeline and args.stats_engine != 'selenium':
+        parser.error('--pipeline only supports the selenium stats engine')
+    if args.pipeline and args.frontier:
+        parser.error('--pipeline and --frontier cannot be combined')
+    if args.pipeline and args.backend != 'threads':
+        parser.error('--pipeline needs the threads backend')
+    if args.adaptive and args.backend not in ('threads', 'asyncio'):
+        parser.error('--adaptive needs the threads or asyncio backend')
+    if args.refresh and (args.pipeline or args.frontier):
+        parser.error('--refresh cannot be combined with --pipeline or '
+                     '--frontier')
+    if args.coordinator and (args.pipeline or args.frontier or args.refresh):
+        parser.error('--coordinator cannot be combined with --pipeline, '
+                     '--frontier or --refresh')
+    return args
+
+
+def indexed_content_stats(driver, logger, content_urls):
+    '''get_content_stats that skips content already in the index.'''
+    results = []
+    for content_url in content_urls:
+        known = from_frame(StatsRecord, content_index.lookup([content_url]))
+        if known:
+            metrics.inc('dedup_total', outcome='indexed')
+            results.append(known)
+            continue
+        results.append(get_content_stats(driver, logger, [content_url])[0])
+    return results
+
+
+def scrape_pipeline(drivers, artists_urls, output, completion, queue_size,
+                    logger):
+    def normalize_batch(raw):
+        stats = normalize(raw, logger)
+        # Only the newly scraped content, not the index hits
+        indexed = content_index.lookup(stats.index).index
+        content_index.add(stats[~stats.index.isin(indexed)])
+        return stats
+
+    stages = (get_collections_urls, get_content_urls, indexed_content_stats)
+    pipeline = StagePipeline(drivers, stages,
+                             output.write,
+                             logger, queue_size=queue_size,
+                             normalize=normalize_batch, memory=memory_budget,
+                             complete=completion.add)
+    for name in ('artists', 'collections', 'content', 'rows'):
+        metrics.gauge('queue_depth', getattr(pipeline, name).qsize,
+                      queue=name)
+    logger.info(f'Streaming {len(artists_urls)} artists through the pipeline')
+    rows = pipeline.run(artists_urls)
+    metrics.inc('rows_written_total', rows)
+    logger.info(f'Pipeline finished after writing {rows} rows')
+
+
+def scrape_stats(drivers, content_urls, stats_engine, logger):
+    # Content shared by several collections is scraped once and the join
+    # fans its stats back out to every row
+    content_urls = list(content_urls)
+    unique_urls = list(dict.fromkeys(content_urls))
+    known = content_index.lookup(unique_urls)
+    indexed = set(known.index)
+    todo = [url for url in unique_urls if url not in indexed]
+    metrics.inc('dedup_total', len(content_urls) - len(unique_urls),
+                outcome='duplicate')
+    metrics.inc('dedup_total', len(known), outcome='indexed')
+    logger.info(f'{len(content_urls)} content URLs: {len(todo)} to scrape, '
+                f'{len(known)} already in the index and '
+                f'{len(content_urls) - len(unique_urls)} duplicates')
+    if not todo:
+        return known
+    stats = scrape_content_stats(drivers, todo, stats_engine, logger)
+    content_index.add(stats)
+    return pd.concat([known, stats]) if len(known) else stats
+
+
+def without(urls, failed):
+    return [url for url in urls if url not in failed]
+
+
+def scrape_frontier(drivers, frontier, output, stats_engine, logger,
+                    batch_size=2000, counts_interval=30):
+    n_reset = frontier.reset_in_flight()
+    logger.info(f'Frontier state: {frontier.counts()} '
+                f'({n_reset} in-flight URLs reset to pending)')
+    counted_at = None
+    # Downstream stages first so rows reach the output as early as possible
+    while frontier.has_pending():
+        throttle()
+        for kind, limit in (('content', batch_size),
+                            ('collection', batch_size), ('artist', 5)):
+            claimed = frontier.claim(kind, limit)
+            if claimed:
+                break
+        urls = list(dict.fromkeys(url for url, _, _ in claimed))
+        # Counting groups the whole frontier, only refresh the gauges from
+        # time to time
+        if (counted_at is None
+                or time.monotonic() - counted_at > counts_interval):
+            counted_at = time.monotonic()
+            for pending_kind, states in frontier.counts().items():
+                metrics.set('queue_depth', states['pending'],
+                            queue=pending_kind)
+        logger.info(f'Scraping {len(urls)} {kind} URLs from the frontier')
+        # URLs the stage gave up on, retried until max_attempts
+        failed = []
+        try:
+            if kind == 'artist':
+                collections = scrape_items(drivers, get_collections_urls,
+                                           urls, failed=failed)
+                children = [
+                    (collection_url, artist_url,
+                     {'artist url': artist_url, 'artist name': artist_name})
+                    for artist_url, artist_name, collection_url
+                    in collections if artist_url not in failed]
+                frontier.complete(kind, without(urls, failed), 'collection',
+                                  children)
+            elif kind == 'collection':
+                content = scrape_content_urls(drivers, urls, failed)
+                contexts = {url: context for url, _, context in claimed}
+                children = [
+                    (content_url, collection_url,
+                     {**contexts[collection_url],
+                      'collection url': collection_url,
+                      'collection name': collection_name})
+                    for collection_url, collection_name, content_url
+                    in content.reset_index().itertuples(index=False)
+                    if collection_url not in failed]
+                frontier.complete(kind, without(urls, failed), 'content',
+                                  children)
+            else:
+                stats = scrape_stats(drivers, urls, stats_engine, logger)
+                rows = pd.DataFrame.from_records(
+                    [{**context, 'content url': url}
+                     for url, _, context in claimed])
+                joined_df = (rows.join(stats, on='content url', how='left')
+                             .set_index('artist url'))
+                output.write(joined_df[OUTPUT_COLUMNS[1:]])
+                metrics.inc('rows_written_total', len(joined_df))
+                frontier.complete(kind, urls)
+        except Exception:
+            logger.exception(f'Failed to scrape {len(urls)} {kind} URLs')
+            frontier.fail(kind, urls)
+            continue
+        if failed:
+            logger.warning(f'Gave up on {len(failed)} {kind} URLs for now')
+            frontier.fail(kind, failed)
+    logger.info(f'Frontier exhausted: {frontier.counts()}')
+
+
+def scrape_leases(drivers, queue, node, output, stats_engine, logger,
+                  renew_interval=None, poll_interval=30):
+    '''Scrape the artists and collections leased from a queue shared with
+    other nodes until every URL is done or failed. Leases are renewed
+    every third of the lease time of the queue by default.'''
+    limit = 2 * drivers.n_drivers
+    if renew_interval is None:
+        renew_interval = queue.settings()['lease_time'] / 3
+    while queue.has_work():
+        throttle()
+        kind, leased = queue.lease(node, limit)
+        if not leased:
+            # What is left is leased to other nodes until they finish it
+            # or their leases expire
+            time.sleep(poll_interval)
+            continue
+        urls = [url for url, _ in leased]
+        logger.info(f'Leased {len(urls)} {kind} URLs as {node}')
+        failed = []
+        try:
+            with LeaseKeeper(queue, node, kind, urls, renew_interval):
+                if kind == 'artist':
+                    children = [
+                        (collection_url, {'artist url': artist_url,
+                                          'artist name': artist_name})
+                        for artist_url, artist_name, collection_url
+                        in scrape_items(drivers, get_collections_urls, urls,
+                                        failed=failed)
+                        if artist_url not in failed]
+                    n_done = queue.complete(node, kind,
+                                            without(urls, failed), children)
+                else:
+                    content = scrape_content_urls(drivers, urls, failed)
+                    # Collections given up on are scraped again in full
+                    content = content[~content.index.isin(failed)]
+                    stats = scrape_stats(drivers, content['content url'],
+                                         stats_engine, logger)
+                    contexts = pd.DataFrame.from_dict(dict(leased),
+                                                      orient='index')
+                    joined_df = (
+                        content.join(contexts)
+                        .rename_axis('collection url').reset_index()
+                        .join(stats, on='content url', how='left')
+                        .set_index('artist url')
+                    )
+                    output.write(joined_df[OUTPUT_COLUMNS[1:]])
+                    metrics.inc('rows_written_total', len(joined_df))
+                    n_done = queue.complete(node, kind,
+                                            without(urls, failed))
+        except Exception:
+            logger.exception(f'Failed to scrape {len(urls)} {kind} URLs')
+            queue.fail(node, kind, urls)
+            metrics.inc('leases_total', len(urls), kind=kind,
+                        outcome='failed')
+            continue
+        if failed:
+            logger.warning(f'Gave up on {len(failed)} {kind} URLs for now')
+            queue.fail(node, kind, failed)
+            metrics.inc('leases_total', len(failed), kind=kind,
+                        outcome='failed')
+        metrics.inc('leases_total', n_done, kind=kind, outcome='done')
+        if n_done < len(urls) - len(failed):
+            # merge_outputs drops the rows both nodes wrote
+            n_lost = len(urls) - len(failed) - n_done
+            logger.warning(f'{n_lost} leases expired and were taken over '
+                           'by other nodes')
+            metrics.inc('leases_total', n_lost, kind=kind, outcome='lost')
+    logger.info(f'Shared queue exhausted: {queue.counts()}')
+
+
+def scrape_refresh(drivers, output, snapshots, budget, stats_engine, logger,
+                   batch_size=500, **schedule_options):
+    content = known_content(output, snapshots, content_index.scraped_times)
+    now = time.time()
+    content_urls = schedule(content, budget, now, **schedule_options)
+    logger.info(f'Refreshing {len(content_urls)} of {len(content)} known '
+                'content pages')
+    for i in range(0, len(content_urls), batch_size):
+        batch = content_urls[i:i + batch_size]
+        throttle()
+        stats = scrape_content_stats(drivers, batch, stats_engine, logger)
+        content_index.add(stats)
+        snapshot = to_snapshot(stats, time.time())
+        snapshots.write(snapshot)
+        metrics.inc('rows_written_total', len(snapshot))
+        logger.info(f'Saved {len(snapshot)} snapshots '
+                    f'({len(batch) - len(snapshot)} pages failed)')
+
+
+def scrape_split_content(drivers, collection_urls, logger, failed=None):
+    '''Content of the collections of a split in a SpillBuffer. Over a
+    memory budget the collections are scraped in batches of about one
+    chunk of items and the content goes to disk past the first chunk.'''
+    if memory_budget is None:
+        content = SpillBuffer()
+        content.append(scrape_content_urls(drivers, collection_urls, failed))
+        return content
+    chunk_rows = memory_budget.chunk_rows()
+    content = SpillBuffer(memory_budget, chunk_rows, spill_dir, metrics)
+    for batch in batches_by_cost(collection_urls, collection_sizes,
+                                 chunk_rows, min_items=drivers.n_drivers):
+        throttle()
+        content.append(scrape_content_urls(drivers, batch, failed))
+    if content.files:
+        logger.info(f'Spilled {len(content)} content URLs to disk')
+    return content
+
+
+def complete_split(completion, artists_urls, failed, logger):
+    '''Log the artists of a split as complete but those with a collection,
+    or their list of collections, given up on, left to the next run.'''
+    failed = set(failed)
+    if failed:
+        logger.warning(f'{len(failed)} artists are incomplete and will be '
+                       f'scraped again on the next run: {sorted(failed)}')
+    completion.add(without(artists_urls, failed))
+
+
+def scrape_splits(drivers, artists_urls, output, completion, stats_engine,
+                  logger):
+    n_splits = math.ceil(len(artists_urls) / 5)
+    artists_splits = np.array_split(artists_urls, n_splits)
+    for i, artists_split in enumerate(artists_splits):
+        metrics.set('queue_depth', n_splits - i, queue='splits')
+        logger.info(f'Scraping collections of the following artists:\n{artists_split}')
+        failed_artists, failed_collections = [], []
+        collections = scrape_frame(drivers, get_collections_urls,
+                                   artists_split, failed=failed_artists)
+        if len(collections) == 0:
+            logger.info('No collections in this split')
+            complete_split(completion, artists_split, failed_artists, logger)
+            continue
+        logger.info('Scraping content urls from collections')
+        content = scrape_split_content(drivers, collections['collection url'],
+                                       logger, failed_collections)
+        try:
+            # One chunk per split without a memory budget
+            for chunk in content.chunks():
+                throttle()
+                logger.info(f'Scraping statistics of {len(chunk)} items')
+                stats = scrape_stats(drivers, chunk['content url'],
+                                     stats_engine, logger)
+                logger.info('Joining data')
+                joined_df = (
+                    collections
+                    .join(chunk, on='collection url', how='right')
+                    .join(stats, on='content url', how='left')
+                )
+                joined_df.index.name = 'artist url'
+                logger.info(f'Saving data to "{str(output.path)}"')
+                output.write(joined_df)
+                metrics.inc('rows_written_total', len(joined_df))
+        finally:
+            content.close()
+        # Only once the last chunk of the split is written
+        failed_artists.extend(collections.index[
+            collections['collection url'].isin(failed_collections)])
+        complete_split(completion, artists_split, failed_artists, logger)
+        gc.collect()
+
+
+def configure(args):
+    '''Apply the scraping settings of args to this process.'''
+    global link_extraction, scroll_engine, rate_limiter, page_cache, replay
+    link_extraction = args.link_extraction
+    scroll_engine = args.scroll
+    scroll_settings.max_timeout = args.max_scroll_wait
+    retry_policy.max_attempts = args.max_attempts
+    retry_policy.base_delay = args.backoff
+    if args.max_rate:
+        rate_limiter = RateLimiter(args.max_rate)
+    if args.page_cache:
+        # Replays trust every cached page whatever its age
+        page_cache = PageCache(args.page_cache,
+                               max_bytes=args.cache_size * 2**30,
+                               ttls={} if args.replay else args.cache_ttl)
+    replay = args.replay
 
 
 def main():
+    global content_index, raw_stats, memory_budget, spill_dir
     main_logger = setup_logger('main')
-    artists_urls_file = sys.argv[1] if len(
-        sys.argv) > 1 else 'artists_urls.csv'
-    data_filename = sys.argv[2] if len(sys.argv) > 2 else 'data.csv'
-    data_path = Path('.') / data_filename
-    artists_urls = np.loadtxt(artists_urls_file, dtype=str, ndmin=1)
-    if data_path.exists():
-        df = pd.read_csv(str(data_path))
-        completed = df['artist url'].unique()
+    args = parse_args()
+    configure(args)
+    artists_urls_file = args.artists_urls_file
+    data_path = Path('.') / args.data_filename
+    if not args.refresh:
+        artists_urls = np.loadtxt(artists_urls_file, dtype=str, ndmin=1)
+    if args.frontier:
+        frontier = Frontier(args.frontier)
+        frontier.seed_artists(artists_urls)
+    if args.coordinator:
+        # Seeding is idempotent so every node can queue the same artists
+        queue = open_queue(args.coordinator)
+        queue.seed_artists(artists_urls)
+    output = open_output(data_path, args.output_format, args.partition_by)
+    resumed = output.has_rows()
+    completion = completion_log(data_path)
+    if args.aggregates:
+        aggregates = AggregateStore(args.aggregates)
+        output = AggregatedOutput(output, aggregates)
+    if args.content_index:
+        content_index = ContentIndex(args.content_index,
+                                     freshness=args.freshness * 24 * 3600)
+        main_logger.info(f'Content index with {len(content_index)} entries')
+    if args.raw_stats:
+        raw_stats = CsvOutput(args.raw_stats)
+    if args.memory_budget:
+        memory_budget = MemoryBudget(args.memory_budget * 2**30,
+                                     metrics=metrics, logger=main_logger)
+        spill_dir = args.spill_dir
+    if args.refresh:
+        snapshots = open_snapshots(Path('.') / args.snapshots,
+                                   args.output_format)
+    elif not (args.frontier or args.coordinator):
+        if not resumed:
+            # Created with the output so resumed runs can rely on it
+            completion.add([])
+            completed = []
+        elif completion.exists():
+            completed = completion.completed()
+        else:
+            main_logger.warning(f'No "{completion.path}", resuming after '
+                                'every artist with rows in the output')
+            completed = output.completed('artist url')
         artists_urls = artists_urls[~np.isin(artists_urls, completed)]
+        if resumed and not args.pipeline:
+            # Reads a column of the whole output, only once a split
+            # needs it
+            collection_sizes.load = lambda: output.read_columns(
+                ['collection url'])['collection url'].value_counts()
 
-    n_threads = n_physical_cores #* 2
-    main_logger.info(f'Using {n_threads} threads')
-    
-    n_splits = math.ceil(len(artists_urls) / 5)
-    artists_splits = np.array_split(artists_urls, n_splits)
-    drivers = ThreadedDrivers(n_threads, main_logger)
+    n_threads = args.drivers or n_physical_cores
+    if args.adaptive:
+        n_threads = max(args.max_drivers, args.min_drivers)
+    main_logger.info(f'Using {n_threads} drivers ({args.backend} backend)')
+
+    drivers = make_backend(args, n_threads, main_logger)
+    register_backend_metrics(drivers)
+    controller = None
+    if args.adaptive:
+        drivers.pool.set_limit(max(n_physical_cores, args.min_drivers))
+        controller = AdaptiveController(
+            drivers.pool, metrics, main_logger, limiter=rate_limiter,
+            min_drivers=args.min_drivers, max_rate=args.max_rate,
+            interval=args.control_interval).start()
+    if args.trace_file:
+        metrics.trace_to(args.trace_file)
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_port)
+        main_logger.info(
+            f'Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics')
+    metrics_snapshots = None
+    if args.metrics_file:
+        metrics_snapshots = SnapshotWriter(metrics, args.metrics_file,
+                                           args.metrics_interval)
 
     try:
-        for artists_split in artists_splits:
-            main_logger.info(f'Scraping collections of the following artists:\n{artists_split}')
-            collections = drivers.map(get_collections_urls, artists_split)
-            collections
-            if len(collections) == 0:
-                main_logger.info('No collections in this split')
-                continue
-            main_logger.info('Scraping content urls from collections')
-            content = drivers.map(get_content_urls, collections['collection url'])
-            main_logger.info('Scraping content statistics')
-            stats = drivers.map(get_content_stats, content['content url'])
-            main_logger.info('Joining data')
-            joined_df = (
-                collections
-                .join(content, on='collection url', how='right')
-                .join(stats, on='content url', how='left')
-            )
-            joined_df.index.name = 'artist url'
-            header = False if data_path.exists() else True
-            main_logger.info(f'Saving data to "{str(data_path)}"')
-            joined_df.to_csv(data_path, header=header, mode='a')
-            gc.collect()
+        if args.refresh:
+            scrape_refresh(drivers, output, snapshots, args.budget,
+                           args.stats_engine, main_logger,
+                           min_age=args.min_age,
+                           popularity_weight=args.popularity_weight)
+        elif args.coordinator:
+            scrape_leases(drivers, queue, args.node, output,
+                          args.stats_engine, main_logger)
+        elif args.frontier:
+            scrape_frontier(drivers, frontier, output, args.stats_engine,
+                            main_logger)
+        elif args.pipeline:
+            scrape_pipeline(drivers.pool, artists_urls, output, completion,
+                            args.queue_size, main_logger)
+        else:
+            scrape_splits(drivers, artists_urls, output, completion,
+                          args.stats_engine, main_logger)
     finally:
+        if controller is not None:
+            controller.stop()
+        main_logger.info(f'Backend stats: {drivers.stats()}')
         main_logger.info('Closing web drivers')
-        for driver in drivers.drivers:
-            driver.quit()
+        drivers.close()
         main_logger.info('All web drivers savely closed')
+        if metrics_snapshots is not None:
+            metrics_snapshots.stop()
+        main_logger.info(f'Scraping rates: {metrics.rates()}')
+        metrics.close()
+        if args.frontier:
+            frontier.close()
+        if args.coordinator:
+            queue.close()
+        content_index.close()
+        if page_cache is not None:
+            page_cache.close()
+        if args.aggregates:
+            aggregates.close()
 
 
 if __name__ == '__main__':
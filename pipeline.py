@@ -0,0 +1,233 @@
+#! /bin/env python3
+
+from collections import Counter
+import pandas as pd
+import threading as t
+import queue
+import time
+
+from records import Failed, as_columns
+
+
+OUTPUT_COLUMNS = ['artist url', 'artist name', 'collection url',
+                  'collection name', 'content url', 'title', 'views',
+                  'downloads', 'likes', 'upload date']
+
+
+class StagePipeline:
+    '''Run the three scraping stages concurrently linked by bounded queues.
+
+    Every driver runs a worker that prefers downstream work (stats, then
+    content urls, then collections) so items flow to the output as soon as
+    they are ready. Rows are handed to `write` in batches of DataFrames
+    indexed by artist url, with the same columns main() writes, after
+    `normalize` turned the raw stats of the batch, indexed by content url,
+    into their final values.
+
+    While `memory` (a MemoryBudget) is over its watermark, workers stop
+    taking new artists and collections and only drain the content already
+    queued, and the writer flushes its batch right away.
+
+    Once every row of an artist is written, its url is passed to
+    `complete`, so runs resumed after a crash skip only the artists
+    finished in full. Artists whose list of collections, or one of their
+    collections, a stage gave up on (a Failed result) are left out.'''
+
+    def __init__(self, drivers, stages, write, logger, queue_size=1000,
+                 batch_size=500, flush_interval=30, normalize=None,
+                 memory=None, complete=None):
+        self.drivers = drivers
+        self.get_collections, self.get_content, self.get_stats = stages
+        self.write = write
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.normalize = normalize
+        self.memory = memory
+        self.complete = complete
+        self.artists = queue.Queue()
+        self.collections = queue.Queue(maxsize=queue_size)
+        self.content = queue.Queue(maxsize=queue_size)
+        self.rows = queue.Queue(maxsize=queue_size)
+        self.unfinished = 0
+        self.unfinished_lock = t.Lock()
+        # Items and unwritten rows of every artist
+        self.pending = Counter()
+        self.failed = set()
+        self.error = None
+        self.rows_written = 0
+
+    def _add_task(self):
+        with self.unfinished_lock:
+            self.unfinished += 1
+
+    def _task_done(self):
+        with self.unfinished_lock:
+            self.unfinished -= 1
+
+    def _hold(self, artist_url):
+        with self.unfinished_lock:
+            self.pending[artist_url] += 1
+
+    def _release(self, artists_urls):
+        done = []
+        with self.unfinished_lock:
+            for artist_url in artists_urls:
+                self.pending[artist_url] -= 1
+                if self.pending[artist_url] == 0:
+                    del self.pending[artist_url]
+                    if artist_url not in self.failed:
+                        done.append(artist_url)
+        if done and self.complete is not None:
+            self.complete(done)
+
+    def _record_failure(self, artist_url, result):
+        if isinstance(result, Failed):
+            with self.unfinished_lock:
+                self.failed.add(artist_url)
+
+    def _finished(self):
+        with self.unfinished_lock:
+            return self.unfinished == 0 or self.error is not None
+
+    def _put(self, q, item, driver, logger):
+        # While a queue is full the producer helps draining it instead of
+        # blocking, otherwise every worker could end up waiting on a put
+        helper = {
+            id(self.collections): (self.collections, self._scrape_content),
+            id(self.content): (self.content, self._scrape_stats),
+        }
+        self._add_task()
+        while self.error is None:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                self._run_one(*helper[id(q)], driver, logger)
+
+    def _run_one(self, q, handler, driver, logger):
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            return False
+        try:
+            handler(driver, logger, item)
+        finally:
+            self._task_done()
+        return True
+
+    def _scrape_collections(self, driver, logger, artist_url):
+        collections = self.get_collections(driver, logger, [artist_url])[0]
+        self._record_failure(artist_url, collections)
+        for record in collections:
+            self._hold(artist_url)
+            self._put(self.collections, tuple(record), driver, logger)
+        self._release([artist_url])
+
+    def _scrape_content(self, driver, logger, item):
+        artist_url, artist_name, collection_url = item
+        content = self.get_content(driver, logger, [collection_url])[0]
+        self._record_failure(artist_url, content)
+        for _, collection_name, content_url in content:
+            context = {
+                'artist url': artist_url,
+                'artist name': artist_name,
+                'collection url': collection_url,
+                'collection name': collection_name,
+                'content url': content_url
+            }
+            self._hold(artist_url)
+            self._put(self.content, context, driver, logger)
+        self._release([artist_url])
+
+    def _scrape_stats(self, driver, logger, context):
+        # The row keeps the hold of its content until written
+        stats = self.get_stats(driver, logger, [context['content url']])[0]
+        self.rows.put({**context, **as_columns(stats[0])})
+
+    def _over_memory(self):
+        return self.memory is not None and self.memory.over()
+
+    def _worker(self):
+        all_stages = ((self.content, self._scrape_stats),
+                      (self.collections, self._scrape_content),
+                      (self.artists, self._scrape_collections))
+        try:
+            while not self._finished():
+                stages = all_stages
+                if self._over_memory():
+                    if self.content.empty():
+                        # Nothing left to drain, resumes after max_wait
+                        # if memory does not come down
+                        self.memory.throttle()
+                    else:
+                        stages = all_stages[:1]
+                if all(q.empty() for q, _ in stages):
+                    time.sleep(0.1)
+                    continue
+                with self.drivers.driver() as (driver, logger):
+                    any(self._run_one(q, handler, driver, logger)
+                        for q, handler in stages)
+        except Exception as e:
+            self.logger.exception('Pipeline worker failed')
+            self.error = self.error or e
+
+    def _flush(self, records):
+        if not records:
+            return
+        df = pd.DataFrame.from_records(records, columns=OUTPUT_COLUMNS)
+        if self.normalize is not None:
+            df = self.normalize(df.set_index('content url')).reset_index()
+        self.write(df[OUTPUT_COLUMNS].set_index('artist url'))
+        self.rows_written += len(records)
+        self._release([record['artist url'] for record in records])
+        self.logger.info(f'Pipeline wrote {len(records)} rows '
+                         f'({self.rows_written} in total)')
+        records.clear()
+
+    def _writer(self):
+        records = []
+        last_flush = time.monotonic()
+        record = ()
+        try:
+            while record is not None:
+                try:
+                    record = self.rows.get(timeout=1)
+                except queue.Empty:
+                    record = ()
+                if record:
+                    records.append(record)
+                if (record is None or len(records) >= self.batch_size
+                        or time.monotonic() - last_flush > self.flush_interval
+                        or records and self._over_memory()):
+                    self._flush(records)
+                    last_flush = time.monotonic()
+        except Exception as e:
+            self.logger.exception('Pipeline writer failed')
+            self.error = self.error or e
+            # Workers stop on the error, keep taking their rows so none of
+            # them stays blocked on a full queue
+            while record is not None:
+                record = self.rows.get()
+
+    def run(self, artists_urls):
+        for artist_url in artists_urls:
+            self._add_task()
+            self._hold(artist_url)
+            self.artists.put(artist_url)
+        writer = t.Thread(target=self._writer, name='pipeline-writer')
+        writer.start()
+        workers = [t.Thread(target=self._worker, name=f'pipeline-worker-{i}')
+                   for i in range(self.drivers.n_drivers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.rows.put(None)
+        writer.join()
+        if self.error is not None:
+            raise self.error
+        if self.failed:
+            self.logger.warning(f'{len(self.failed)} artists are incomplete '
+                                'and will be scraped again on the next run')
+        return self.rows_written
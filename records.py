@@ -0,0 +1,54 @@
+#! /bin/env python3
+
+# Stage functions return plain tuples, one per row, and the rows of a
+# whole stage are turned into a DataFrame once by to_frame, instead of
+# building and concatenating one small DataFrame per URL.
+
+from collections import namedtuple
+import pandas as pd
+import numpy as np
+
+
+CollectionRecord = namedtuple(
+    'CollectionRecord', ['artist_url', 'artist_name', 'collection_url'])
+ContentRecord = namedtuple(
+    'ContentRecord', ['collection_url', 'collection_name', 'content_url'])
+StatsRecord = namedtuple(
+    'StatsRecord',
+    ['content_url', 'title', 'views', 'downloads', 'likes', 'upload_date'])
+
+# Column names of the fields after the first one, which is the index
+COLUMNS = {
+    CollectionRecord: ['artist name', 'collection url'],
+    ContentRecord: ['collection name', 'content url'],
+    StatsRecord: ['title', 'views', 'downloads', 'likes', 'upload date'],
+}
+
+
+class Failed(list):
+    '''Records of a URL a stage gave up on, none or only part of them,
+    so callers can tell it from a URL that has no records.'''
+
+
+def nan_record(content_url, error=None):
+    return [StatsRecord(content_url, *[np.nan] * 5)]
+
+
+def as_columns(record):
+    '''Fields of a record but the index, by column name.'''
+    return dict(zip(COLUMNS[type(record)], record[1:]))
+
+
+def to_frame(record_type, records):
+    '''DataFrame indexed by the first field of the records, with the same
+    columns the stage functions used to return.'''
+    records = list(records)
+    columns = list(zip(*records)) or [()] * len(record_type._fields)
+    data = {name: list(column)
+            for name, column in zip(COLUMNS[record_type], columns[1:])}
+    return pd.DataFrame(data, index=list(columns[0]),
+                        columns=COLUMNS[record_type])
+
+
+def from_frame(record_type, df):
+    return [record_type(*row) for row in df[COLUMNS[record_type]].itertuples()]
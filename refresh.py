@@ -0,0 +1,66 @@
+#! /bin/env python3
+
+import pandas as pd
+import numpy as np
+
+from http_stats import STATS_COLUMNS
+
+
+DAY = 24 * 3600
+
+
+def known_content(output, snapshots, scraped_times=None):
+    '''Every content URL in the crawl output with its latest views and
+    the time its stats were last scraped (NaN when unknown).
+
+    Views and times of refresh snapshots take precedence over the crawl,
+    and `scraped_times(urls)` (e.g. ContentIndex.scraped_times) fills in
+    the times of content that was never refreshed.'''
+    crawl = output.read_columns(['content url', 'views'])
+    content = (crawl.dropna(subset=['content url'])
+               .drop_duplicates('content url', keep='last')
+               .set_index('content url'))
+    content['last scraped'] = np.nan
+    if scraped_times is not None and len(content):
+        content['last scraped'] = scraped_times(content.index)
+    history = snapshots.read_columns(['content url', 'scraped at', 'views'])
+    if len(history):
+        history['scraped at'] = (pd.to_datetime(history['scraped at'])
+                                 - pd.Timestamp(0)).dt.total_seconds()
+        latest = (history.sort_values('scraped at')
+                  .drop_duplicates('content url', keep='last')
+                  .set_index('content url'))
+        latest = latest[latest.index.isin(content.index)]
+        content.loc[latest.index, 'views'] = latest['views']
+        content.loc[latest.index, 'last scraped'] = latest['scraped at']
+    return content
+
+
+def refresh_priority(content, now, popularity_weight=1., unknown_age=365):
+    '''Days since the last scrape weighted by the order of magnitude of
+    the views, so popular content, whose numbers move the most, comes
+    back sooner. Content never scraped counts as `unknown_age` days old.'''
+    staleness = ((now - content['last scraped']) / DAY).fillna(unknown_age)
+    views = pd.to_numeric(content['views'], errors='coerce').fillna(0)
+    return staleness.clip(lower=0) * (
+        1 + popularity_weight * np.log10(views.clip(lower=0) + 1))
+
+
+def schedule(content, budget, now, min_age=1, **priority_options):
+    '''Content URLs to refresh, most urgent first, at most `budget` of them
+    and none scraped less than `min_age` days ago.'''
+    age = (now - content['last scraped']) / DAY
+    candidates = content[~(age < min_age)]
+    priority = refresh_priority(candidates, now, **priority_options)
+    return list(priority.sort_values(ascending=False, kind='stable')
+                .index[:budget])
+
+
+def to_snapshot(stats, scraped_at):
+    '''Stats indexed by content url as snapshot rows, without NaN
+    fallbacks.'''
+    stats = stats[stats['views'].notna()]
+    snapshot = stats[STATS_COLUMNS].copy()
+    snapshot.insert(0, 'scraped at', pd.Timestamp(int(scraped_at), unit='s'))
+    snapshot.index.name = 'content url'
+    return snapshot
@@ -0,0 +1,88 @@
+#! /bin/env python3
+
+from collections import deque
+import threading as t
+import random
+import time
+
+
+class RetryPolicy:
+    '''Exponential backoff with jitter and a cap on attempts per item.'''
+
+    def __init__(self, max_attempts=5, base_delay=1, max_delay=60,
+                 jitter=0.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+
+class CircuitBreaker:
+    '''Shared by every driver: when at least `threshold` of the last
+    `window` calls failed the breaker opens and callers pause for
+    `cooldown` seconds before hitting the site again.'''
+
+    def __init__(self, window=50, threshold=0.5, min_calls=10, cooldown=60):
+        self.outcomes = deque(maxlen=window)
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.times_opened = 0
+        self.lock = t.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record(self, success, logger=None):
+        with self.lock:
+            self.outcomes.append(success)
+            if self.is_open or len(self.outcomes) < self.min_calls:
+                return
+            failure_rate = self.outcomes.count(False) / len(self.outcomes)
+            if failure_rate >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                if logger is not None:
+                    logger.warning(
+                        f'{failure_rate:.0%} of the last {len(self.outcomes)} '
+                        f'requests failed. Pausing for {self.cooldown}s')
+
+    def wait(self):
+        while True:
+            with self.lock:
+                if self.opened_at is None:
+                    return
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining <= 0:
+                    self.opened_at = None
+                    self.outcomes.clear()
+                    return
+            time.sleep(min(remaining, 1))
+
+
+def retry_call(function, item, policy, breaker, logger, failed,
+               exceptions=(Exception,)):
+    '''Call function(item) until it succeeds or the policy gives up, in
+    which case failed(item, last_error) is returned instead.'''
+    for attempt in range(1, policy.max_attempts + 1):
+        breaker.wait()
+        try:
+            result = function(item)
+        except exceptions as e:
+            error = e
+            breaker.record(False, logger)
+            logger.exception(
+                f'Attempt {attempt}/{policy.max_attempts} failed for {item}')
+            if attempt < policy.max_attempts:
+                time.sleep(policy.delay(attempt))
+            continue
+        breaker.record(True, logger)
+        return result
+    logger.error(f'Giving up on {item} after {policy.max_attempts} attempts')
+    return failed(item, error)
@@ -0,0 +1,189 @@
+#! /bin/env python3
+
+import threading as t
+import statistics
+import heapq
+import time
+
+
+class CostModel:
+    '''Relative cost of a URL: the number of items a collection had the
+    last time it was scraped, the median of the known ones for new URLs.
+
+    `load`, when set, returns the sizes known beforehand and is only
+    called on the first lookup.'''
+
+    def __init__(self, sizes=None, load=None):
+        self.sizes = dict(sizes or {})
+        self.load = load
+        self.lock = t.Lock()
+        # Computed on the first lookup after the sizes change
+        self.median = None
+
+    def update(self, sizes):
+        with self.lock:
+            self.sizes.update(sizes)
+            self.median = None
+
+    def _load(self):
+        if self.load is not None:
+            # Sizes seen since are more recent
+            self.sizes = {**dict(self.load()), **self.sizes}
+            self.load = None
+            self.median = None
+
+    def __call__(self, url):
+        with self.lock:
+            self._load()
+            if url in self.sizes:
+                return max(self.sizes[url], 1)
+            if not self.sizes:
+                return 1
+            if self.median is None:
+                self.median = max(statistics.median(self.sizes.values()), 1)
+            return self.median
+
+
+def batches_by_cost(items, cost, max_cost, min_items=1):
+    '''Consecutive batches of `items` whose costs add up to at most
+    `max_cost`, with at least `min_items` items each (but the last) so a
+    batch keeps every worker busy.'''
+    batch, batch_cost = [], 0
+    for item in items:
+        item_cost = cost(item)
+        if len(batch) >= min_items and batch_cost + item_cost > max_cost:
+            yield batch
+            batch, batch_cost = [], 0
+        batch.append(item)
+        batch_cost += item_cost
+    if batch:
+        yield batch
+
+
+class Scheduler:
+    '''Run `function` on every item from a shared queue, most expensive
+    items first, with one thread per worker.
+
+    Once the queue is empty, idle workers re-issue stragglers: items that
+    have been running for more than `straggler_factor` times the time
+    their cost predicts (from the seconds per unit of cost of the items
+    already done) and at least `min_straggler_time` seconds. The first
+    copy to finish wins. Results are returned in the order of `items`.
+
+    When an item fails, workers stop taking new items and map() raises
+    its error once the items already running are over. A scheduler runs a
+    single map, the losing copies of speculated items keep running in the
+    background after it returns successfully.'''
+
+    def __init__(self, n_workers, cost=None, speculate=True,
+                 straggler_factor=2., min_straggler_time=10, min_done=3,
+                 logger=None):
+        self.n_workers = n_workers
+        self.cost = cost or (lambda item: 1)
+        self.speculate = speculate
+        self.straggler_factor = straggler_factor
+        self.min_straggler_time = min_straggler_time
+        self.min_done = min_done
+        self.logger = logger
+        self.n_speculative = 0
+        self.n_wasted = 0
+
+    def map(self, function, items):
+        items = list(items)
+        if not items:
+            return []
+        self.function = function
+        self.items = items
+        self.costs = [self.cost(item) for item in items]
+        self.queue = [(-cost, i) for i, cost in enumerate(self.costs)]
+        heapq.heapify(self.queue)
+        self.results = {}
+        self.errors = {}
+        self.running = {}
+        self.speculated = set()
+        self.rates = []
+        self.cancelled = False
+        self.condition = t.Condition()
+        workers = [t.Thread(target=self._worker, daemon=True,
+                            name=f'scheduler-{n}')
+                   for n in range(min(self.n_workers, len(items)))]
+        for worker in workers:
+            worker.start()
+        with self.condition:
+            while (not self.errors
+                   and len(self.results) + len(self.errors) < len(items)):
+                self.condition.wait()
+            self.cancelled = bool(self.errors)
+            self.condition.notify_all()
+        if self.errors:
+            # Workers hold drivers, none may outlive a failed map
+            for worker in workers:
+                worker.join()
+            raise next(iter(self.errors.values()))
+        return [self.results[i] for i in range(len(items))]
+
+    def _done(self, i):
+        return i in self.results or i in self.errors
+
+    def _straggler(self, now):
+        if not self.speculate or len(self.rates) < self.min_done:
+            return None
+        rate = statistics.median(self.rates)
+        slowest, slowest_ratio = None, self.straggler_factor
+        for i, starts in self.running.items():
+            if i in self.speculated or self._done(i):
+                continue
+            elapsed = now - min(starts)
+            if elapsed < self.min_straggler_time:
+                continue
+            ratio = elapsed / max(rate * self.costs[i], 1e-9)
+            if ratio > slowest_ratio:
+                slowest, slowest_ratio = i, ratio
+        return slowest
+
+    def _next(self):
+        '''Index and start time of the next item to run, None once every
+        item is done.'''
+        with self.condition:
+            while (not self.cancelled and len(self.results)
+                   + len(self.errors) < len(self.items)):
+                if self.queue:
+                    _, i = heapq.heappop(self.queue)
+                else:
+                    i = self._straggler(time.monotonic())
+                    if i is None:
+                        self.condition.wait(timeout=1)
+                        continue
+                    self.speculated.add(i)
+                    self.n_speculative += 1
+                    if self.logger is not None:
+                        self.logger.info(f'Re-issuing straggler {self.items[i]}')
+                start = time.monotonic()
+                self.running.setdefault(i, []).append(start)
+                return i, start
+            return None
+
+    def _worker(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            i, start = task
+            try:
+                result, error = self.function(self.items[i]), None
+            except Exception as e:
+                result, error = None, e
+            with self.condition:
+                self.running[i].remove(start)
+                if not self.running[i]:
+                    del self.running[i]
+                if self._done(i):
+                    self.n_wasted += 1
+                elif error is None:
+                    self.results[i] = result
+                    self.rates.append(
+                        (time.monotonic() - start) / self.costs[i])
+                elif i not in self.running:
+                    # Only fail once no other copy can still succeed
+                    self.errors[i] = error
+                self.condition.notify_all()
@@ -1,5 +1,17 @@
 #! /bin/sh
 
+# scraper_setup.sh VM_NAME [COORDINATOR_URL]
+#
+# With a coordinator ("python3 coordinator.py serve --host IP" listening
+# on the private network of the VMs) the VM leases its work from the shared queue instead of scraping
+# every artist, and its data.csv is merged with the other nodes' ones by
+# "python3 coordinator.py merge".
+
+SCRAPER_ARGS=''
+if [ -n "$2" ]; then
+    SCRAPER_ARGS="--coordinator $2 --node $1"
+fi
+
 COMMAND='
 git clone https://github.com/karb94/pexels_scrapper.git &&
 cd pexels_scrapper &&
@@ -11,7 +23,7 @@ curl -sSO 'https://chromedriver.storage.googleapis.com/90.0.4430.24/chromedriver
 # curl -sSO 'https://chromedriver.storage.googleapis.com/91.0.4472.19/chromedriver_linux64.zip' &&
 unzip chromedriver_linux64.zip && rm chromedriver_linux64.zip &&
 mv chromedriver env/bin/ &&
-rm -f data.csv &&
-setsid -f python3 pexels_scraper2.py >output 2>&1'
+rm -f data.csv data.csv.done &&
+setsid -f python3 pexels_scraper2.py '"$SCRAPER_ARGS"' >output 2>&1'
 
 gcloud compute ssh "$1" --command="$COMMAND"
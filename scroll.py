@@ -0,0 +1,117 @@
+#! /bin/env python3
+
+from collections import namedtuple
+import time
+
+
+ScrollResult = namedtuple('ScrollResult',
+                          ['complete', 'reason', 'steps', 'elapsed'])
+
+# Counts DOM mutations and fetch/XHR requests still in flight from the
+# moment it is installed in the page
+INSTALL_OBSERVER_SCRIPT = '''
+if (!window.__scraperActivity) {
+    const activity = window.__scraperActivity = {mutations: 0, pending: 0};
+    new MutationObserver(records => {
+        activity.mutations += records.length;
+    }).observe(document.body, {childList: true, subtree: true});
+    const fetch = window.fetch;
+    window.fetch = function(...args) {
+        activity.pending++;
+        return fetch.apply(this, args).finally(() => activity.pending--);
+    };
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function(...args) {
+        activity.pending++;
+        this.addEventListener('loadend', () => activity.pending--);
+        return send.apply(this, args);
+    };
+}
+'''
+
+# Page height, requests in flight, DOM mutations so far and finished
+# network requests so far
+ACTIVITY_SCRIPT = '''
+const activity = window.__scraperActivity;
+return [document.body.scrollHeight, activity.pending, activity.mutations,
+        performance.getEntriesByType('resource').length];
+'''
+
+SCROLL_SCRIPT = 'window.scrollTo(0, document.body.scrollHeight);'
+NUDGE_SCRIPT = 'window.scrollBy(0, -window.innerHeight);'
+
+
+class ScrollSettings:
+    '''Timings of the adaptive scroll engine in seconds.
+
+    After each scroll the page is polled every `poll` seconds until new
+    items appear. A step without new items ends when the page has been
+    quiet (no request in flight, no DOM mutations nor finished requests)
+    for `idle` seconds, or after a timeout that adapts to how long earlier
+    steps took to load (`factor` times their moving average, within
+    `min_timeout` and `max_timeout`).'''
+
+    def __init__(self, poll=0.1, idle=0.75, min_timeout=2, max_timeout=20,
+                 initial_timeout=5, factor=4, max_steps=5000):
+        self.poll = poll
+        self.idle = idle
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.initial_timeout = initial_timeout
+        self.factor = factor
+        self.max_steps = max_steps
+
+    def timeout(self, response_time):
+        if response_time is None:
+            return self.initial_timeout
+        timeout = self.factor * response_time
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+
+def scroll_to_end(driver, collect, settings):
+    '''Scroll an infinite list until it stops growing.
+
+    `collect` is called while waiting and returns how many new items have
+    appeared since its previous call. The result tells whether the list
+    was fully loaded: the page went quiet without new items ('idle'), or
+    it was cut short because it kept busy without producing items
+    ('timeout') or hit `max_steps`.'''
+    start = time.monotonic()
+    driver.execute_script(INSTALL_OBSERVER_SCRIPT)
+    response_time = None
+    nudged = False
+    for step in range(1, settings.max_steps + 1):
+        height, _, *activity = driver.execute_script(ACTIVITY_SCRIPT)
+        driver.execute_script(SCROLL_SCRIPT)
+        step_start = last_activity = time.monotonic()
+        timeout = settings.timeout(response_time)
+        progressed = quiet = False
+        while not progressed:
+            time.sleep(settings.poll)
+            now = time.monotonic()
+            new_height, pending, *new_activity = driver.execute_script(
+                ACTIVITY_SCRIPT)
+            progressed = collect() > 0 or new_height > height
+            if pending or new_activity != activity:
+                activity = new_activity
+                last_activity = now
+            quiet = now - last_activity >= settings.idle
+            if quiet or now - step_start >= timeout:
+                break
+        if progressed:
+            elapsed = time.monotonic() - step_start
+            response_time = (elapsed if response_time is None
+                             else 0.7 * response_time + 0.3 * elapsed)
+            nudged = False
+            continue
+        if quiet:
+            return ScrollResult(True, 'idle', step, time.monotonic() - start)
+        if nudged:
+            return ScrollResult(False, 'timeout', step,
+                                time.monotonic() - start)
+        # Scrolling up and down again re-triggers lazy loaders that missed
+        # the first scroll event
+        nudged = True
+        driver.execute_script(NUDGE_SCRIPT)
+    return ScrollResult(False, 'max steps', settings.max_steps,
+                        time.monotonic() - start)
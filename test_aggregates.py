@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import AggregateStore, AggregatedOutput, rebuild
+from output import CsvOutput, ParquetOutput
+from pipeline import OUTPUT_COLUMNS
+
+
+def make_rows(rows):
+    '''Output rows from (artist, collection, content, views, likes, date).'''
+    df = pd.DataFrame([
+        {'artist url': f'https://www.pexels.com/@{artist}',
+         'artist name': artist.title(),
+         'collection url': f'https://www.pexels.com/collections/{collection}',
+         'collection name': collection.title(),
+         'content url': f'https://www.pexels.com/photo/{content}',
+         'title': content.title(), 'views': views, 'downloads': np.nan,
+         'likes': likes, 'upload date': date}
+        for artist, collection, content, views, likes, date in rows],
+        columns=OUTPUT_COLUMNS)
+    return df.set_index('artist url')
+
+
+ARTIST = 'https://www.pexels.com/@ann'
+COLLECTION = 'https://www.pexels.com/collections/c1'
+
+
+@pytest.fixture
+def store():
+    store = AggregateStore(':memory:', top_k=2)
+    yield store
+    store.close()
+
+
+def test_batches_are_merged(store):
+    store.add(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14'),
+                         ('ann', 'c1', 'p2', 300, 1, '2021-04-02'),
+                         ('bob', 'c3', 'p9', 50, 2, '2020-01-01')]))
+    store.add(make_rows([('ann', 'c2', 'p3', 200, 9, '2020-12-31'),
+                         ('ann', 'c2', 'p4', np.nan, np.nan, np.nan)]))
+    summary = store.summary(ARTIST)
+    assert summary['items'] == 4
+    assert summary['scraped'] == 3
+    assert summary['views_sum'] == 600
+    assert summary['views_max'] == 300
+    assert summary['likes_sum'] == 15
+    assert summary['downloads_sum'] == 0
+    assert summary['downloads_max'] is None
+    assert summary['first_upload'] == '2020-12-31'
+    assert summary['last_upload'] == '2021-04-02'
+    assert store.summary(COLLECTION)['artist'] == ARTIST
+    assert store.summary('https://www.pexels.com/@nobody') is None
+    ranking = store.ranking('artist', 'views')
+    assert list(ranking.index) == [ARTIST, 'https://www.pexels.com/@bob']
+    assert list(store.collections(ARTIST)['views_sum']) == [400, 200]
+
+
+def test_top_content_is_pruned(store):
+    store.add(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14'),
+                         ('ann', 'c1', 'p2', 300, 1, '2021-04-02')]))
+    store.add(make_rows([('ann', 'c1', 'p3', 200, 9, '2021-04-20')]))
+    top = store.top(COLLECTION, 'views')
+    assert list(top['content_url'].str[-2:]) == ['p2', 'p3']
+    assert list(top['views']) == [300, 200]
+    top = store.top(ARTIST, 'likes', n=1)
+    assert list(top['title']) == ['P3']
+    assert store.connection.execute(
+        'SELECT COUNT(*) FROM top').fetchone()[0] == 2 * 2 * 2
+
+
+def test_content_in_several_collections_counts_once_per_artist(store):
+    store.add(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14'),
+                         ('ann', 'c2', 'p1', 100, 5, '2021-03-14')]))
+    store.add(make_rows([('ann', 'c3', 'p1', 100, 5, '2021-03-14'),
+                         ('ann', 'c3', 'p2', 10, 1, '2021-04-01')]))
+    summary = store.summary(ARTIST)
+    assert (summary['items'], summary['views_sum']) == (2, 110)
+    assert list(store.top(ARTIST)['views']) == [100, 10]
+    assert store.uploads(ARTIST).to_dict() == {'2021-03': 1, '2021-04': 1}
+    # Every collection still counts its own copy
+    assert list(store.collections(ARTIST)['views_sum']) == [110, 100, 100]
+
+
+def test_stats_scraped_later_replace_nan_rows(store):
+    store.add(make_rows([('ann', 'c1', 'p1', np.nan, np.nan, np.nan)]))
+    store.add(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14'),
+                         ('ann', 'c1', 'p1', np.nan, np.nan, np.nan)]))
+    store.add(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14')]))
+    for key in (ARTIST, COLLECTION):
+        summary = store.summary(key)
+        assert (summary['items'], summary['scraped'],
+                summary['views_sum']) == (1, 1, 100)
+        assert store.uploads(key).to_dict() == {'2021-03': 1}
+    assert list(store.top(ARTIST)['views']) == [100]
+
+
+def test_uploads_per_month(store):
+    store.add(make_rows([('ann', 'c1', 'p1', 1, 1, '2021-03-14'),
+                         ('ann', 'c1', 'p2', 1, 1, '2021-03-30'),
+                         ('ann', 'c2', 'p3', 1, 1, '2021-05-01')]))
+    store.add(make_rows([('ann', 'c2', 'p4', 1, 1, '2021-05-07')]))
+    assert store.uploads(ARTIST).to_dict() == {'2021-03': 2, '2021-05': 2}
+    assert store.uploads(COLLECTION).to_dict() == {'2021-03': 2}
+
+
+@pytest.mark.parametrize('output_class', [CsvOutput, ParquetOutput])
+def test_aggregated_output_and_rebuild(tmp_path, store, output_class):
+    path = tmp_path / 'data'
+    output = AggregatedOutput(output_class(path), store)
+    output.write(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14')]))
+    output.write(make_rows([('bob', 'c3', 'p9', 50, 2, '2020-01-01')]))
+    assert set(output.completed()) == {ARTIST, 'https://www.pexels.com/@bob'}
+    expected = store.ranking('artist', 'views')
+    # Rows written again, after a resume for instance, count once
+    output.write(make_rows([('ann', 'c1', 'p1', 100, 5, '2021-03-14')]))
+    assert store.summary(ARTIST)['views_sum'] == 100
+    assert rebuild(store, path, chunksize=1) == 3
+    assert store.summary(ARTIST)['views_sum'] == 100
+    assert list(store.top(ARTIST)['views']) == [100]
+    assert store.ranking('artist', 'views').index.equals(expected.index)
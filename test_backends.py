@@ -0,0 +1,76 @@
+import logging
+import time
+import os
+
+from collections import namedtuple
+import pytest
+
+from backends import ThreadBackend, AsyncioBackend, ProcessBackend
+from driver_pool import DriverPool
+
+
+class FakeDriver:
+    def quit(self):
+        pass
+
+
+def make_pool(n_drivers):
+    logger = logging.getLogger()
+    return DriverPool(n_drivers, lambda logger: FakeDriver(),
+                      [logger] * n_drivers, logger, rss=lambda driver: 0,
+                      n_spares=0)
+
+
+def make_worker_backend(n_drivers):
+    return ThreadBackend(make_pool(n_drivers))
+
+
+# Module level so the process backends can pickle it
+Record = namedtuple('Record', ['url', 'pid', 'size'])
+
+
+def stage(driver, logger, urls):
+    if 'broken' in urls:
+        raise ValueError('broken')
+    time.sleep(0.01)
+    return [[Record(url, os.getpid(), len(url))] for url in urls]
+
+
+URLS = [f'https://www.pexels.com/collections/{"x" * i}/' for i in range(12)]
+
+
+@pytest.fixture(params=['threads', 'asyncio', 'processes', 'hybrid'])
+def backend(request):
+    if request.param == 'threads':
+        backend = ThreadBackend(make_pool(3))
+    elif request.param == 'asyncio':
+        backend = AsyncioBackend(make_pool(3))
+    else:
+        threads = 2 if request.param == 'hybrid' else 1
+        backend = ProcessBackend(2, make_worker_backend, (threads,),
+                                 threads_per_process=threads)
+    yield backend
+    backend.close()
+
+
+def test_backends_return_results_in_order(backend):
+    records = backend.map(stage, URLS, cost=len)
+    assert [record.url for record in records] == URLS
+    assert [record.size for record in records] == [len(url) for url in URLS]
+    assert backend.stats()['backend'] == backend.name
+
+
+def test_backends_raise_stage_errors(backend):
+    with pytest.raises(ValueError):
+        backend.map(stage, URLS[:3] + ['broken'])
+
+
+def test_process_backend_spreads_work_over_processes():
+    backend = ProcessBackend(2, make_worker_backend, (1,))
+    try:
+        records = backend.map(stage, URLS * 4)
+    finally:
+        backend.close()
+    pids = {record.pid for record in records}
+    assert len(pids) == 2
+    assert os.getpid() not in pids
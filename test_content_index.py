@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from content_index import ContentIndex, content_id
+from records import StatsRecord, nan_record, to_frame
+from normalize import normalize_stats
+
+
+def stats(*rows):
+    return pd.DataFrame(
+        [row[1:] for row in rows], index=[row[0] for row in rows],
+        columns=['title', 'views', 'downloads', 'likes', 'upload date'])
+
+
+def test_content_id_ignores_host():
+    assert (content_id('https://www.pexels.com/photo/waves-123/')
+            == content_id('http://127.0.0.1:8000/photo/waves-123')
+            == '/photo/waves-123')
+
+
+def test_lookup_returns_recorded_stats():
+    index = ContentIndex()
+    url = 'https://www.pexels.com/photo/waves-123/'
+    recorded = stats((url, 'Waves', 12500, 1024, 87, '2021-03-14'))
+    failed = to_frame(StatsRecord,
+                      nan_record('https://www.pexels.com/photo/x-1/'))
+    assert index.add(pd.concat([recorded, failed])) == 1
+    found = index.lookup([url, 'https://www.pexels.com/photo/x-1/'])
+    pd.testing.assert_frame_equal(found, recorded)
+    assert len(index) == 1
+
+
+def test_entries_expire_after_freshness(tmp_path):
+    path = tmp_path / 'content.db'
+    url = 'https://www.pexels.com/photo/waves-123/'
+    index = ContentIndex(path, freshness=3600)
+    index.add(stats((url, 'Waves', 1, 2, 3, '2021-03-14')))
+    index.connection.execute('UPDATE content SET scraped = scraped - 7200')
+    index.connection.commit()
+    index.close()
+    assert len(ContentIndex(path).lookup([url])) == 1
+    assert len(ContentIndex(path, freshness=3600).lookup([url])) == 0
+
+
+def test_stats_fan_out_to_every_collection_row():
+    content = pd.DataFrame(
+        {'collection name': ['A', 'B', 'B'],
+         'content url': ['p1', 'p1', 'p2']}, index=['c1', 'c2', 'c2'])
+    index = ContentIndex()
+    index.add(stats(('p1', 'One', 10, 1, 1, '2020-01-01'),
+                    ('p2', 'Two', 20, 2, 2, '2020-01-02')))
+    known = index.lookup(np.unique(content['content url']))
+    joined = content.join(known, on='content url')
+    assert joined['views'].tolist() == [10, 10, 20]
+
+
+def test_malformed_counters_are_stored_as_null():
+    index = ContentIndex()
+    url = 'https://www.pexels.com/photo/waves-123/'
+    raw = stats((url, 'Waves', '12.5K', 'oops', '87', None))
+    assert index.add(normalize_stats(raw)[0]) == 1
+    found = index.lookup([url])
+    assert found.loc[url, 'views'] == 12500
+    assert pd.isna(found.loc[url, 'downloads'])
+    assert pd.isna(found.loc[url, 'upload date'])
@@ -0,0 +1,28 @@
+import pytest
+import logging
+import shutil
+
+import pexels_scraper2
+
+pytestmark = pytest.mark.skipif(shutil.which('chromedriver') is None,
+                                reason='chromedriver is not installed')
+
+
+@pytest.fixture(scope='module')
+def driver():
+    driver = pexels_scraper2.create_driver(logging.getLogger())
+    yield driver
+    pexels_scraper2.quit_driver(driver)
+
+
+@pytest.mark.parametrize('mode', ['page-source', 'script'])
+def test_link_extraction_modes(fixture_server, driver, monkeypatch, mode):
+    monkeypatch.setattr(pexels_scraper2, 'link_extraction', mode)
+    url = f'{fixture_server}/collection/static.html'
+    content = pexels_scraper2.get_content_urls(driver, logging.getLogger(),
+                                               [url])[0]
+    assert {record.collection_name for record in content} == {'Beaches'}
+    assert sorted(record.content_url for record in content) == sorted(
+        [f'https://www.pexels.com/photo/photo-{i}/'
+         for i in range(1, 13) if i % 4]
+        + [f'https://www.pexels.com/video/clip-{i}/' for i in (4, 8, 12)])
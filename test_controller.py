@@ -0,0 +1,115 @@
+import time
+
+from controller import AdaptiveController, RateLimiter
+from metrics import Metrics
+
+
+class FakePool:
+    def __init__(self, n_drivers, limit):
+        self.n_drivers = n_drivers
+        self.limit = limit
+        self.wait_total = 0.
+
+    def set_limit(self, limit):
+        self.limit = max(1, min(limit, self.n_drivers))
+        return self.limit
+
+    def stats(self):
+        return {'checkout wait total': self.wait_total}
+
+
+def start(metrics, stage, n, timeouts=0):
+    metrics.inc('attempts_total', n + timeouts, stage=stage)
+    metrics.inc('attempt_errors_total', timeouts, stage=stage)
+
+
+def finish(metrics, stage, n, seconds=0.3, failures=0):
+    for i in range(n):
+        outcome = 'fallback' if i < failures else 'ok'
+        metrics.inc('items_total', stage=stage, outcome=outcome)
+        metrics.observe('item_seconds', seconds, stage=stage)
+
+
+def scrape(metrics, stage, n, seconds=0.3, failures=0):
+    start(metrics, stage, n)
+    finish(metrics, stage, n, seconds, failures)
+
+
+def make_controller(pool, metrics, logger, load=(10, 10), **options):
+    return AdaptiveController(pool, metrics, logger, load=lambda: load,
+                              **options)
+
+
+def test_additive_increase_only_with_demand(logger):
+    metrics, pool = Metrics(), FakePool(8, 2)
+    limiter = RateLimiter(1)
+    controller = make_controller(pool, metrics, logger, limiter=limiter,
+                                 max_rate=1.2)
+    scrape(metrics, 'stats', 20)
+    assert controller.step() is None
+    scrape(metrics, 'stats', 20)
+    pool.wait_total += 1
+    assert controller.step() == 'increase'
+    assert (pool.limit, limiter.rate) == (3, 1.2)
+
+
+def test_multiplicative_decrease_on_fallbacks(logger):
+    metrics, pool = Metrics(), FakePool(8, 8)
+    limiter = RateLimiter(4)
+    controller = make_controller(pool, metrics, logger, limiter=limiter,
+                                 min_drivers=3)
+    scrape(metrics, 'stats', 20, failures=2)
+    pool.wait_total += 1
+    assert controller.step() == 'decrease'
+    assert (pool.limit, limiter.rate) == (4, 2)
+    scrape(metrics, 'stats', 20, failures=2)
+    controller.step()
+    assert pool.limit == 3
+
+
+def test_items_running_across_windows_are_not_errors(logger):
+    metrics, pool = Metrics(), FakePool(8, 6)
+    controller = make_controller(pool, metrics, logger)
+    # Collections slower than the control interval
+    start(metrics, 'content', 8)
+    assert controller.step() is None
+    finish(metrics, 'content', 8)
+    start(metrics, 'content', 8)
+    assert controller.step() is None
+    assert pool.limit == 6
+
+
+def test_decrease_on_timeouts(logger):
+    metrics, pool = Metrics(), FakePool(8, 6)
+    controller = make_controller(pool, metrics, logger)
+    start(metrics, 'stats', 20, timeouts=3)
+    finish(metrics, 'stats', 20)
+    assert controller.step() == 'decrease'
+    assert pool.limit == 3
+
+
+def test_decrease_when_latency_grows(logger):
+    metrics, pool = Metrics(), FakePool(8, 6)
+    controller = make_controller(pool, metrics, logger)
+    scrape(metrics, 'content', 10, seconds=2)
+    scrape(metrics, 'stats', 10, seconds=0.3)
+    controller.step()
+    scrape(metrics, 'stats', 10, seconds=3)
+    assert controller.step() == 'decrease'
+    assert pool.limit == 3
+
+
+def test_decrease_when_host_is_saturated(logger):
+    metrics, pool = Metrics(), FakePool(8, 6)
+    controller = make_controller(pool, metrics, logger, load=(97, 40))
+    pool.wait_total += 1
+    assert controller.step() == 'decrease'
+    assert pool.limit == 3
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.19
@@ -0,0 +1,104 @@
+import time
+
+import pandas as pd
+import pytest
+
+from coordinator import (LeaseQueue, RemoteQueue, serve_queue, LeaseKeeper,
+                         merge_outputs)
+from pipeline import OUTPUT_COLUMNS
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = LeaseQueue(tmp_path / 'queue.db', lease_time=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def test_collections_are_leased_before_artists(queue):
+    queue.seed_artists(['a1', 'a2', 'a1'])
+    kind, leased = queue.lease('n1', 5)
+    assert kind == 'artist'
+    assert sorted(url for url, _ in leased) == ['a1', 'a2']
+    assert queue.lease('n2', 5) == (None, [])
+    children = [('c1', {'artist url': 'a1', 'artist name': 'A'})]
+    assert queue.complete('n1', 'artist', ['a1', 'a2'], children) == 2
+    assert queue.lease('n2', 5) == (
+        'collection', [('c1', {'artist url': 'a1', 'artist name': 'A'})])
+
+
+def test_nodes_sharing_a_file_never_lease_the_same_url(tmp_path):
+    queues = [LeaseQueue(tmp_path / 'queue.db') for _ in range(2)]
+    queues[0].seed_artists([f'a{i}' for i in range(10)])
+    leased = [url for i in range(6)
+              for url, _ in queues[i % 2].lease(f'n{i % 2}', 2)[1]]
+    assert sorted(leased) == sorted(f'a{i}' for i in range(10))
+    for queue in queues:
+        queue.close()
+
+
+def test_expired_leases_go_back_to_the_queue(queue):
+    queue.lease_time = 0.05
+    queue.seed_artists(['a1'])
+    queue.lease('dead', 5)
+    time.sleep(0.1)
+    assert queue.lease('n2', 5) == ('artist', [('a1', None)])
+    # The late node's work is not recorded, n2 owns the URL now
+    assert queue.complete('dead', 'artist', ['a1']) == 0
+    assert queue.complete('n2', 'artist', ['a1']) == 1
+    assert not queue.has_work()
+
+
+def test_renewed_leases_do_not_expire(queue):
+    queue.lease_time = 0.2
+    queue.seed_artists(['a1'])
+    kind, leased = queue.lease('n1', 5)
+    with LeaseKeeper(queue, 'n1', kind, ['a1'], interval=0.05):
+        time.sleep(0.4)
+        assert queue.lease('n2', 5) == (None, [])
+    assert queue.complete('n1', kind, ['a1']) == 1
+
+
+def test_failed_attempts(queue):
+    queue.seed_artists(['a1'])
+    for _ in range(2):
+        queue.lease('n1', 5)
+        queue.fail('n1', 'artist', ['a1'])
+    assert queue.counts()['artist']['failed'] == 1
+    assert not queue.has_work()
+
+
+def test_remote_queue(queue):
+    server = serve_queue(queue, 0)
+    assert server.server_address[0] == '127.0.0.1'
+    try:
+        remote = RemoteQueue(f'http://127.0.0.1:{server.server_port}')
+        remote.seed_artists(['a1'])
+        kind, leased = remote.lease('n1', 5)
+        assert (kind, leased) == ('artist', [('a1', None)])
+        assert remote.renew('n1', kind, ['a1']) == 1
+        assert remote.complete('n1', kind, ['a1'], [('c1', {})]) == 1
+        assert remote.counts()['collection']['pending'] == 1
+        assert remote.has_work()
+        assert remote.settings() == {'lease_time': 60, 'max_attempts': 2}
+    finally:
+        server.shutdown()
+
+
+def node_output(rows):
+    return pd.DataFrame(
+        [(f'a{a}', f'A{a}', f'c{c}', f'C{c}', f'p{p}', f'P{p}', p, 1, 2,
+          '2021-03-14') for a, c, p in rows],
+        columns=OUTPUT_COLUMNS).set_index('artist url')
+
+
+def test_merge_outputs_drops_rows_written_twice(tmp_path):
+    node_output([(1, 1, 1), (1, 1, 2)]).to_csv(tmp_path / 'n1.csv')
+    node_output([(1, 1, 2), (2, 3, 1)]).to_csv(tmp_path / 'n2.csv')
+    n_rows = merge_outputs([tmp_path / 'n1.csv', tmp_path / 'n2.csv'],
+                           tmp_path / 'data.csv')
+    assert n_rows == 3
+    merged = pd.read_csv(tmp_path / 'data.csv')
+    assert list(merged.columns) == OUTPUT_COLUMNS
+    assert sorted(zip(merged['artist url'], merged['content url'])) == [
+        ('a1', 'p1'), ('a1', 'p2'), ('a2', 'p1')]
@@ -0,0 +1,244 @@
+import pytest
+import time
+import threading as t
+from concurrent.futures import ThreadPoolExecutor
+
+from driver_pool import DriverPool, renew_driver
+
+
+class FakeDriver:
+    def __init__(self, name):
+        self.name = name
+        self.alive = True
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def factory():
+    created = []
+    lock = t.Lock()
+
+    def create(logger):
+        with lock:
+            driver = FakeDriver(len(created))
+            created.append(driver)
+        return driver
+    create.created = created
+    return create
+
+
+def make_pool(factory, logger, n_drivers=2, **options):
+    options.setdefault('rss', lambda driver: 0)
+    return DriverPool(n_drivers, factory, [logger] * n_drivers, logger,
+                      is_alive=lambda driver: driver.alive, **options)
+
+
+def test_blocking_checkout_times_out(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=1, n_spares=0)
+    n = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.01)
+    pool.checkin(n)
+    assert pool.checkout(timeout=0.01) == n
+    pool.close()
+
+
+def test_recycles_after_max_pages(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=1, max_pages=3)
+    pool.wait_ready()
+    first = pool.drivers[0]
+    for _ in range(3):
+        with pool.driver():
+            pass
+    pool.close()
+    assert pool.drivers[0] is not first
+    assert first.quit_called
+    assert pool.stats()['recycles'] == {'pages': 1}
+
+
+def test_recycles_dead_and_bloated_drivers(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=1, max_pages=None,
+                     max_rss=100, rss_check_every=1,
+                     rss=lambda driver: 1000 if driver.name == 1 else 0,
+                     n_spares=0)
+    pool.wait_ready()
+    pool.drivers[0].alive = False
+    with pool.driver() as (driver, _):
+        assert driver.alive
+    assert pool.stats()['recycles'] == {'dead': 1, 'rss': 1}
+    pool.close()
+
+
+def test_concurrent_checkouts(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=3, max_pages=5)
+    in_use = set()
+    lock = t.Lock()
+
+    def work(i):
+        with pool.driver() as (driver, _):
+            with lock:
+                assert driver not in in_use
+                in_use.add(driver)
+            with lock:
+                in_use.remove(driver)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(work, range(60)))
+    stats = pool.stats()
+    pool.close()
+    assert stats['checkouts'] == 60
+    assert sum(pool.pages) + 5 * stats['recycles']['pages'] == 60
+    assert all(driver.quit_called for driver in factory.created)
+
+
+def test_parallel_startup_serves_first_ready_driver(logger):
+    release = t.Event()
+
+    def create(logger):
+        if t.current_thread().name.endswith('_1'):
+            release.wait()
+        return FakeDriver('ready')
+
+    pool = DriverPool(2, create, [logger] * 2, logger, n_spares=0,
+                      rss=lambda driver: 0)
+    with pool.driver(timeout=1) as (driver, _):
+        assert driver.name == 'ready'
+    assert pool.stats()['drivers ready'] == 1
+    release.set()
+    assert pool.wait_ready() == 2
+    pool.close()
+
+
+def test_startup_failures(logger):
+    def create(logger):
+        raise OSError('chrome not found')
+
+    pool = DriverPool(2, create, [logger] * 2, logger, n_spares=0,
+                      start_backoff=0)
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+    pool.close()
+
+
+def test_utilisation(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=2, n_spares=0)
+    pool.wait_ready()
+    pool.started_at = time.monotonic()
+    n = pool.checkout()
+    time.sleep(0.05)
+    assert pool.stats()['drivers busy'] == 1
+    pool.checkin(n)
+    assert pool.stats()['drivers busy'] == 0
+    assert 0.3 < pool.utilisation() <= 0.5
+    pool.close()
+
+
+def test_limit_caps_checked_out_drivers(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=3, n_spares=0)
+    pool.wait_ready()
+    assert pool.set_limit(10) == 3
+    pool.set_limit(1)
+    n = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.05)
+    pool.set_limit(2)
+    m = pool.checkout(timeout=0.05)
+    assert m != n
+    pool.checkin(n)
+    pool.checkin(m)
+    assert pool.in_use == 0
+    pool.close()
+
+
+def test_failed_startups_are_retried(logger):
+    attempts = []
+
+    def create(logger):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OSError('chrome crashed')
+        return FakeDriver('ready')
+
+    pool = DriverPool(1, create, [logger], logger, n_spares=0,
+                      rss=lambda driver: 0, start_backoff=0)
+    assert pool.wait_ready() == 1
+    with pool.driver(timeout=1) as (driver, _):
+        assert driver.name == 'ready'
+    pool.close()
+
+
+def test_failed_recreation_releases_the_slot(factory, logger):
+    broken = t.Event()
+
+    def create(logger):
+        if broken.is_set():
+            raise OSError('chrome crashed')
+        return factory(logger)
+
+    pool = make_pool(create, logger, n_drivers=1, n_spares=0, max_pages=1,
+                     start_backoff=0.05)
+    pool.wait_ready()
+    broken.set()
+    n = pool.checkout(timeout=1)
+    pool.checkin(n)
+    assert pool.in_use == 0
+    assert pool.drivers[0] is None
+    # The slot is back once the restart in the background succeeds
+    broken.clear()
+    with pool.driver(timeout=1) as (driver, _):
+        assert driver is not None
+    pool.drivers[0].alive = False
+    broken.set()
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.02)
+    broken.clear()
+    with pool.driver(timeout=1) as (driver, _):
+        assert driver.alive
+    assert pool.in_use == 0
+    pool.close()
+
+
+def test_spares_stay_bounded(factory, logger):
+    pool = make_pool(factory, logger, n_drivers=4, max_pages=1, n_spares=1)
+    pool.wait_ready()
+    for _ in range(80):
+        with pool.driver(timeout=1):
+            pass
+    # The warmer runs its tasks in order on a single thread
+    pool.warmer.submit(lambda: None).result()
+    assert pool.spares.qsize() <= 1
+    alive = [driver for driver in factory.created if not driver.quit_called]
+    assert len(alive) <= 4 + 1
+    pool.close()
+
+
+def test_crashed_drivers_are_renewed(factory, logger):
+    broken = t.Event()
+
+    def create(logger):
+        if broken.is_set():
+            raise OSError('chrome crashed')
+        return factory(logger)
+
+    pool = make_pool(create, logger, n_drivers=1, n_spares=0,
+                     start_backoff=0.05)
+    pool.wait_ready()
+    with pool.driver() as (driver, _):
+        new_driver = renew_driver(driver)
+        assert new_driver is not driver and driver.quit_called
+        # A second crash of the old driver keeps the new one
+        assert renew_driver(driver) is new_driver
+        broken.set()
+        with pytest.raises(RuntimeError):
+            renew_driver(new_driver)
+    assert pool.in_use == 0
+    broken.clear()
+    with pool.driver(timeout=1) as (driver, _):
+        assert driver is not None
+    assert pool.stats()['recycles'] == {'crashed': 3}
+    with pytest.raises(RuntimeError):
+        renew_driver(driver)
+    pool.close()
@@ -0,0 +1,106 @@
+import pytest
+
+from frontier import Frontier
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = Frontier(tmp_path / 'frontier.db', max_attempts=2)
+    yield frontier
+    frontier.close()
+
+
+def test_claim_and_complete(frontier):
+    frontier.seed_artists(['a1', 'a2', 'a1'])
+    claimed = frontier.claim('artist', 5)
+    assert sorted(url for url, _, _ in claimed) == ['a1', 'a2']
+    assert frontier.claim('artist', 5) == []
+    children = [('c1', 'a1', {'artist url': 'a1', 'artist name': 'A'})]
+    frontier.complete('artist', ['a1', 'a2'], 'collection', children)
+    assert frontier.counts()['artist']['done'] == 2
+    assert frontier.claim('collection', 5) == [
+        ('c1', 'a1', {'artist url': 'a1', 'artist name': 'A'})]
+
+
+def test_content_in_several_collections(frontier):
+    frontier.add('content', [('p1', 'c1', {'collection url': 'c1'}),
+                             ('p1', 'c2', {'collection url': 'c2'})])
+    claimed = frontier.claim('content', 1)
+    assert sorted(parent for _, parent, _ in claimed) == ['c1', 'c2']
+
+
+def test_failed_attempts(frontier):
+    frontier.seed_artists(['a1'])
+    frontier.claim('artist', 1)
+    frontier.fail('artist', ['a1'])
+    assert frontier.counts()['artist']['pending'] == 1
+    frontier.claim('artist', 1)
+    frontier.fail('artist', ['a1'])
+    assert frontier.counts()['artist']['failed'] == 1
+    assert not frontier.has_pending()
+
+
+def test_resume_after_crash(tmp_path):
+    frontier = Frontier(tmp_path / 'frontier.db')
+    frontier.seed_artists(['a1', 'a2'])
+    frontier.claim('artist', 1)
+    frontier.close()
+
+    frontier = Frontier(tmp_path / 'frontier.db')
+    frontier.seed_artists(['a1', 'a2'])
+    assert frontier.reset_in_flight() == 1
+    assert len(frontier.claim('artist', 5)) == 2
+    frontier.close()
+
+
+def test_claim_skips_rows_done_under_another_parent(frontier):
+    frontier.add('content', [('p1', 'c1', {'collection url': 'c1'})])
+    frontier.claim('content', 1)
+    frontier.complete('content', ['p1'])
+    frontier.add('content', [('p1', 'c2', {'collection url': 'c2'})])
+    assert frontier.claim('content', 1) == [
+        ('p1', 'c2', {'collection url': 'c2'})]
+    # Failing the new row leaves the done one alone
+    frontier.fail('content', ['p1'])
+    assert frontier.counts()['content'] == {
+        'pending': 1, 'in-flight': 0, 'done': 1, 'failed': 0}
+    assert 'frontier_state' in frontier.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT 1 FROM frontier "
+        "WHERE state = 'pending' LIMIT 1").fetchone()[-1]
+
+
+def test_urls_given_up_on_are_not_done(frontier, monkeypatch, logger):
+    import pexels_scraper2
+    from backends import ThreadBackend
+    from driver_pool import DriverPool
+    from records import (CollectionRecord, ContentRecord, StatsRecord,
+                         Failed)
+
+    def stage(record, results):
+        def function(driver, logger, urls):
+            return [results(url) for url in urls]
+        function.record = record
+        return function
+
+    monkeypatch.setattr(pexels_scraper2, 'get_collections_urls', stage(
+        CollectionRecord, lambda url: Failed() if url == 'a1' else
+        [CollectionRecord(url, 'A', f'{url}/c1')]))
+    monkeypatch.setattr(pexels_scraper2, 'get_content_urls', stage(
+        ContentRecord, lambda url: [ContentRecord(url, 'C', f'{url}/p1')]))
+    monkeypatch.setattr(pexels_scraper2, 'get_content_stats', stage(
+        StatsRecord, lambda url: [StatsRecord(url, 'T', '1', '2', '3',
+                                              'Uploaded at May 1, 2021')]))
+    written = []
+    output = type('Output', (), {'write': written.append})()
+    pool = DriverPool(1, lambda logger: object(), [logger], logger,
+                      rss=lambda driver: 0, n_spares=0)
+    backend = ThreadBackend(pool)
+    frontier.seed_artists(['a1', 'a2'])
+    pexels_scraper2.scrape_frontier(backend, frontier, output, 'selenium',
+                                    logger)
+    backend.close()
+    counts = frontier.counts()
+    assert counts['artist'] == {'pending': 0, 'in-flight': 0, 'done': 1,
+                                'failed': 1}
+    assert counts['content']['done'] == 1
+    assert len(written) == 1 and list(written[0].index) == ['a2']
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import http_stats
+from normalize import normalize_stats
+
+fixtures_dir = Path(__file__).parent / 'fixtures'
+
+
+def test_parse_static_html():
+    html = (fixtures_dir / 'content' / 'static.html').read_text()
+    assert http_stats.parse_content_stats(html) == {
+        'title': 'Waves on a sandy beach',
+        'views': '12.5K',
+        'downloads': '1024',
+        'likes': '87',
+        'upload date': 'Uploaded at March 14, 2021'
+    }
+
+
+def test_parse_embedded_data():
+    html = (fixtures_dir / 'content' / 'embedded.html').read_text()
+    assert http_stats.parse_content_stats(html) == {
+        'title': 'City lights at night',
+        'views': 2300000,
+        'downloads': 41200,
+        'likes': 312,
+        'upload date': '2020-06-02T10:15:00.000Z'
+    }
+
+
+def test_parse_dynamic_page_needs_browser():
+    html = (fixtures_dir / 'content' / 'dynamic.html').read_text()
+    assert http_stats.parse_content_stats(html) is None
+
+
+def test_fetch_content_stats(fixture_server, logger):
+    urls = [f'{fixture_server}/content/{name}.html'
+            for name in ('static', 'embedded', 'dynamic', 'missing')]
+    stats, failed = http_stats.fetch_content_stats(urls + urls[:1], logger,
+                                                   concurrency=2)
+    assert list(stats.columns) == http_stats.STATS_COLUMNS
+    assert sorted(stats.index) == sorted(urls[:2])
+    stats, errors = normalize_stats(stats)
+    assert len(errors) == 0
+    assert stats.loc[urls[0], 'views'] == 12500
+    assert stats.loc[urls[1], 'upload date'] == '2020-06-02'
+    assert failed == urls[2:]
@@ -0,0 +1,116 @@
+import pytest
+import logging
+import shutil
+
+from load_profiles import (parse_stage_profiles, page_load_strategy,
+                           apply_load_profile, needs_full_load,
+                           RESOURCE_PATTERNS)
+from records import as_columns
+
+
+class CDPDriver:
+    def __init__(self, stage_profiles):
+        self.stage_profiles = stage_profiles
+        self.commands = []
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+
+
+def test_parse_stage_profiles():
+    assert parse_stage_profiles('light') == {
+        'collections': 'light', 'content': 'light', 'stats': 'light'}
+    assert parse_stage_profiles('stats=light') == {
+        'collections': 'full', 'content': 'full', 'stats': 'light'}
+    with pytest.raises(ValueError):
+        parse_stage_profiles('heavy')
+    with pytest.raises(ValueError):
+        parse_stage_profiles('artists=light')
+
+
+def test_page_load_strategy():
+    assert page_load_strategy(parse_stage_profiles('full')) == 'normal'
+    assert page_load_strategy(parse_stage_profiles('stats=light')) == 'eager'
+
+
+def test_blocked_urls_switch_per_stage():
+    driver = CDPDriver(parse_stage_profiles('content=light'))
+    apply_load_profile(driver, 'content')
+    apply_load_profile(driver, 'content')
+    apply_load_profile(driver, 'stats')
+    blocked = [params['urls'] for command, params in driver.commands
+               if command == 'Network.setBlockedURLs']
+    assert len(blocked) == 2
+    assert set(RESOURCE_PATTERNS['images']) <= set(blocked[0])
+    assert blocked[1] == []
+
+
+def test_needs_full_load():
+    eager = CDPDriver(parse_stage_profiles('stats=light'))
+    assert needs_full_load(eager, 'collections')
+    assert needs_full_load(eager, 'content')
+    assert not needs_full_load(eager, 'stats')
+    assert not needs_full_load(CDPDriver(parse_stage_profiles('full')),
+                               'collections')
+    assert not needs_full_load(object(), 'collections')
+
+
+class EagerDriver(CDPDriver):
+    '''Returns from get() with the DOM parsed, and renders the collection
+    links two readyState polls later.'''
+
+    def __init__(self, stage_profiles):
+        super().__init__(stage_profiles)
+        self.polls = 0
+
+    def get(self, url):
+        self.polls = 0
+
+    def execute_script(self, script):
+        assert script == 'return document.readyState'
+        self.polls += 1
+        return 'complete' if self.polls >= 2 else 'interactive'
+
+    @property
+    def page_source(self):
+        if self.polls < 2:
+            return '<html><body></body></html>'
+        return ('<html><body><h1>Ann</h1><a class="discover__collections__'
+                'collection" href="/collections/c1/">C1</a></body></html>')
+
+    def find_element_by_tag_name(self, name):
+        return type('Element', (), {'text': 'Ann'})
+
+
+def test_eager_collections_wait_for_the_page():
+    import pexels_scraper2
+
+    driver = EagerDriver(parse_stage_profiles('stats=light'))
+    records, = pexels_scraper2.get_collections_urls(
+        driver, logging.getLogger(), ['https://www.pexels.com/@ann'])
+    assert [record.collection_url for record in records] == [
+        pexels_scraper2.BASE_URL + '/collections/c1/']
+
+
+@pytest.mark.skipif(shutil.which('chromedriver') is None,
+                    reason='chromedriver is not installed')
+@pytest.mark.parametrize('spec', ['full', 'light'])
+def test_light_profile_extracts_same_stats(fixture_server, spec):
+    import pexels_scraper2
+
+    logger = logging.getLogger()
+    driver = pexels_scraper2.create_driver(
+        logger, stage_profiles=parse_stage_profiles(spec))
+    try:
+        url = f'{fixture_server}/content/static.html'
+        record, = pexels_scraper2.get_content_stats(driver, logger, [url])[0]
+    finally:
+        pexels_scraper2.quit_driver(driver)
+    assert record.content_url == url
+    assert as_columns(record) == {
+        'title': 'Waves on a sandy beach',
+        'views': '12.5K',
+        'downloads': '1024',
+        'likes': '87',
+        'upload date': 'Uploaded at March 14, 2021'
+    }
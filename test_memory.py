@@ -0,0 +1,60 @@
+import pandas as pd
+
+from memory import MemoryBudget, SpillBuffer
+
+
+class FakeRSS:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __call__(self):
+        return self.values.pop(0) if len(self.values) > 1 else self.values[0]
+
+
+def budget(rss, **options):
+    return MemoryBudget(100, rss=FakeRSS(rss), host=lambda: 50, interval=0,
+                        **options)
+
+
+def frame(start, stop):
+    return pd.DataFrame({'content url': [f'p{i}' for i in range(start, stop)]},
+                        index=[f'c{i // 10}' for i in range(start, stop)])
+
+
+def test_watermarks():
+    memory = budget([80, 95, 80, 70, 80])
+    assert [memory.over() for _ in range(5)] == [False, True, True, False,
+                                                  False]
+
+
+def test_throttle_waits_until_under_low_watermark():
+    memory = budget([95, 95, 80, 70], max_wait=10)
+    assert memory.throttle() >= 0
+    assert not memory.over()
+
+
+def test_throttle_gives_up_after_max_wait():
+    memory = budget([95], max_wait=0.05)
+    assert memory.throttle() >= 0.05
+
+
+def test_spill_buffer_chunks_keep_order(tmp_path):
+    buffer = SpillBuffer(budget([0]), chunk_rows=7, directory=tmp_path)
+    for start in range(0, 30, 6):
+        buffer.append(frame(start, start + 6))
+    assert len(buffer) == 30
+    assert buffer.files
+    chunks = list(buffer.chunks())
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7, 7, 2]
+    assert pd.concat(chunks).equals(frame(0, 30))
+    buffer.close()
+    assert not any(tmp_path.iterdir())
+
+
+def test_spill_buffer_without_budget_keeps_one_chunk():
+    buffer = SpillBuffer()
+    buffer.append(frame(0, 6))
+    buffer.append(frame(6, 12))
+    chunk, = buffer.chunks()
+    assert chunk.equals(frame(0, 12))
+    assert not buffer.files
@@ -0,0 +1,92 @@
+import urllib.request
+import json
+import time
+
+import pytest
+
+from metrics import Histogram, Metrics, serve_metrics, SnapshotWriter
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram(buckets=(1, 2, 5, float('inf')))
+    for value in [0.5] * 50 + [1.5] * 40 + [4] * 9 + [30]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.9) == 2
+    assert histogram.quantile(0.99) == 5
+    assert histogram.quantile(1) == 30
+    assert Histogram().quantile(0.5) is None
+
+
+def test_trace_records_spans_and_outcomes():
+    metrics = Metrics()
+    with metrics.trace('stats', 'https://example.com/photo/1/'):
+        with metrics.span('navigate'):
+            time.sleep(0.01)
+        with metrics.span('parse'):
+            pass
+    with metrics.trace('stats', 'https://example.com/photo/2/') as trace:
+        metrics.inc('attempts_total', stage='stats')
+        trace.outcome = 'fallback'
+    metrics.inc('attempts_total', 2, stage='stats')
+    with pytest.raises(ValueError):
+        with metrics.trace('stats', 'https://example.com/photo/3/'):
+            raise ValueError
+    first, second, third = metrics.recent_traces()
+    assert [span['phase'] for span in first['spans']] == ['navigate', 'parse']
+    assert first['spans'][0]['duration'] >= 0.01
+    assert (second['outcome'], third['outcome']) == ('fallback', 'error')
+    rates = metrics.rates()['stats']
+    assert rates['fallback rate'] == pytest.approx(1 / 3)
+    assert rates['retries/item'] == 0
+    assert metrics.current_trace() is None
+
+
+def test_spans_outside_traces_are_only_counted():
+    metrics = Metrics()
+    with metrics.span('navigate'):
+        pass
+    histograms = metrics.snapshot()['histograms']
+    assert histograms[0]['labels'] == {'phase': 'navigate', 'stage': 'none'}
+    assert metrics.recent_traces() == []
+
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.inc('attempts_total', stage='content')
+    metrics.gauge('queue_depth', lambda: 7, queue='content')
+    metrics.gauge('broken', lambda: 1 / 0)
+    metrics.observe('item_seconds', 0.3, stage='content')
+    text = metrics.prometheus()
+    assert 'pexels_attempts_total{stage="content"} 1' in text
+    assert 'pexels_queue_depth{queue="content"} 7' in text
+    assert 'pexels_item_seconds_bucket{stage="content",le="0.25"} 0' in text
+    assert 'pexels_item_seconds_bucket{stage="content",le="0.5"} 1' in text
+    assert 'pexels_item_seconds_count{stage="content"} 1' in text
+    assert 'broken' not in text
+
+
+def test_endpoint_and_snapshots(tmp_path):
+    metrics = Metrics(trace_file=tmp_path / 'traces.jsonl')
+    with metrics.trace('collections', 'https://example.com/@artist'):
+        pass
+    server = serve_metrics(metrics, 0)
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert b'pexels_items_total' in response.read()
+        with urllib.request.urlopen(url + '/metrics.json') as response:
+            assert 'collections' in json.load(response)['rates']
+        with urllib.request.urlopen(url + '/traces') as response:
+            assert json.load(response)[0]['url'] == 'https://example.com/@artist'
+    finally:
+        server.shutdown()
+    snapshots = SnapshotWriter(metrics, tmp_path / 'metrics.jsonl', 0.01)
+    time.sleep(0.05)
+    snapshots.stop()
+    metrics.close()
+    lines = (tmp_path / 'metrics.jsonl').read_text().splitlines()
+    assert len(lines) >= 2
+    assert json.loads(lines[-1])['counters'][0]['name'] == 'items_total'
+    traces = (tmp_path / 'traces.jsonl').read_text().splitlines()
+    assert json.loads(traces[0])['stage'] == 'collections'
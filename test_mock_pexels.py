@@ -0,0 +1,97 @@
+import pytest
+import json
+import urllib.request
+from bs4 import BeautifulSoup
+
+import pandas as pd
+
+import http_stats
+from normalize import parse_counts, normalize_stats
+from mock_pexels import MockPexels, base_url, format_count
+from bench_e2e import stage_report
+
+
+@pytest.fixture(scope='module')
+def site():
+    return MockPexels(n_artists=2, collection_size=(40, 70), page_size=30)
+
+
+@pytest.fixture(scope='module')
+def server(site):
+    server = site.serve()
+    yield base_url(server)
+    server.shutdown()
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read().decode()
+
+
+def test_format_count():
+    assert format_count(999) == '999'
+    assert format_count(12500) == '12.5K'
+    assert parse_counts(pd.Series([format_count(2300000)]))[0] == 2300000
+
+
+def test_artist_collections_page(site, server):
+    soup = BeautifulSoup(get(f'{server}/@artist-0/collections/'),
+                         'html.parser')
+    links = [a.get('href') for a in soup.find_all(
+        'a', {'class': 'discover__collections__collection'})]
+    collections = site.artist('artist-0')['collections']
+    assert links[:len(collections)] == [f'/collections/{c}/'
+                                        for c in collections]
+    assert soup.find('h1').get_text() == 'Artist 0'
+
+
+def test_collection_pages_cover_every_item(site, server):
+    slug = site.artist('artist-1')['collections'][0]
+    soup = BeautifulSoup(get(f'{server}/collections/{slug}/'), 'html.parser')
+    photo_class = 'js-photo-link photo-item__link'
+    video_class = 'js-photo-link js-photo-item__link photo-item__link'
+    hrefs = [a.get('href') for a in soup.find_all('a', {'class': photo_class})]
+    hrefs += [a.get('href') for a in soup.find_all('a', {'class': video_class})]
+    page = 2
+    while True:
+        data = json.loads(get(f'{server}/collections/{slug}/page/{page}'))
+        items = BeautifulSoup(''.join(data['items']), 'html.parser')
+        hrefs += [a.get('href') for a in items.find_all('a')]
+        if not data['more']:
+            break
+        page += 1
+    expected = [site.content_path(c) for c in site.collection(slug)['items']]
+    assert sorted(hrefs) == sorted(expected)
+
+
+def test_content_page_matches_both_stats_engines(site, server):
+    slug = site.collection('artist-0-collection-0')['items'][0]
+    html = get(server + site.content_path(slug))
+    stats = site.content(slug)
+    expected = {
+        'title': stats['title'],
+        'views': parse_counts(pd.Series([stats['views']]))[0],
+        'downloads': parse_counts(pd.Series([stats['downloads']]))[0],
+        'likes': parse_counts(pd.Series([stats['likes']]))[0],
+        'upload date': stats['upload date'].isoformat()
+    }
+    soup = BeautifulSoup(html, 'html.parser')
+    for parse in (http_stats.parse_embedded_data,
+                  http_stats.parse_static_html):
+        raw = pd.DataFrame([parse(soup)], index=[slug])
+        assert normalize_stats(raw)[0].loc[slug].to_dict() == expected
+
+
+def test_stage_report():
+    log = [
+        (0.0, 0.1, '/@a/collections/', None, 200),
+        (1.0, 1.1, '/collections/c/', None, 200),
+        (1.5, 2.0, '/collections/c/page/2', 'http://h/collections/c/', 200),
+        (3.0, 3.2, '/photo/p-1/', None, 200),
+        (3.2, 3.4, '/api/info/p-1', 'http://h/photo/p-1/', 200),
+        (3.5, 3.6, '/photo/p-2/', None, 200),
+    ]
+    report = stage_report(log)
+    assert report['content urls']['p50'] == pytest.approx(1.0)
+    assert report['stats']['pages'] == 2
+    assert report['stats']['pages/s'] == pytest.approx(2 / 0.6)
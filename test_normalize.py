@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from normalize import parse_counts, parse_dates, normalize_stats, \
+    normalize_file
+
+
+def raw_stats():
+    return pd.DataFrame({
+        'title': ['a', 'b', 'c', np.nan],
+        'views': ['12.5K', '1,024', '1.2 k', np.nan],
+        'downloads': ['987', '12..5', '2.3M', np.nan],
+        'likes': [87, '1B', '', np.nan],
+        'upload date': ['Uploaded at March 14, 2021', '2020-06-02T10:15:00Z',
+                        'Hochgeladen am 14. März 2021', np.nan]
+    }, index=['p1', 'p2', 'p3', 'p4'])
+
+
+def test_parse_counts():
+    counts = parse_counts(pd.Series(['999', '12.5K', '2.3M', '1.15K', 1024,
+                                     'many', np.nan]))
+    assert counts[:5].tolist() == [999, 12500, 2300000, 1150, 1024]
+    assert counts[5:].isna().all()
+
+
+def test_parse_counts_separators():
+    counts = parse_counts(pd.Series(['1,024', '1,2K', '1,200K', '1,234.5K',
+                                     '1.024', '1,234,5K', '12,5']))
+    assert counts[:4].tolist() == [1024, 1200, 1200000, 1234500]
+    # Ambiguous strings are left empty rather than guessed
+    assert counts[4:].isna().all()
+
+
+def test_parse_dates():
+    dates = parse_dates(pd.Series(['Uploaded at March 4, 2021', '2021-03-14',
+                                   '2020-06-02T10:15:00.000Z', 'yesterday']))
+    assert dates[:3].tolist() == ['2021-03-04', '2021-03-14', '2020-06-02']
+    assert pd.isna(dates[3])
+
+
+def test_malformed_values_are_reported_per_row():
+    stats, errors = normalize_stats(raw_stats())
+    assert stats.loc['p1'].tolist() == ['a', 12500, 987, 87, '2021-03-14']
+    # Only the malformed fields of a row are lost
+    assert stats.loc['p2', 'views'] == 1024
+    assert pd.isna(stats.loc['p2', 'downloads'])
+    assert stats.loc['p3', 'downloads'] == 2300000
+    assert sorted(zip(errors.index, errors['field'])) == [
+        ('p2', 'downloads'), ('p3', 'likes'), ('p3', 'upload date')]
+    # Missing values are not malformed
+    assert 'p4' not in errors.index
+
+
+def test_normalize_is_idempotent():
+    stats, _ = normalize_stats(raw_stats())
+    again, errors = normalize_stats(stats)
+    assert again.equals(stats)
+    assert len(errors) == 0
+
+
+def test_normalize_file(tmp_path):
+    raw_stats().to_csv(tmp_path / 'raw.csv')
+    n_rows, n_errors = normalize_file(tmp_path / 'raw.csv',
+                                      tmp_path / 'stats.csv',
+                                      tmp_path / 'errors.csv')
+    # The empty likes of p3 are read back as missing
+    assert (n_rows, n_errors) == (4, 2)
+    stats = pd.read_csv(tmp_path / 'stats.csv', index_col=0)
+    assert stats.loc['p1', 'views'] == 12500
+    assert len(pd.read_csv(tmp_path / 'errors.csv')) == 2
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from output import CsvOutput, ParquetOutput, convert_csv, completion_log
+
+
+def split_df(artists, nan_stats=False):
+    rows = []
+    for artist in artists:
+        for i in range(3):
+            rows.append({
+                'artist url': f'https://www.pexels.com/@{artist}',
+                'artist name': artist.title(),
+                'collection url': f'https://www.pexels.com/collections/{artist}-c/',
+                'collection name': f'{artist} collection',
+                'content url': f'https://www.pexels.com/photo/{artist}-{i}/',
+                'title': f'{artist} {i}',
+                'views': np.nan if nan_stats else 1000 * i,
+                'downloads': np.nan if nan_stats else 10 * i,
+                'likes': np.nan if nan_stats else i,
+                'upload date': np.nan if nan_stats else '2021-03-14'
+            })
+    return pd.DataFrame(rows).set_index('artist url')
+
+
+@pytest.mark.parametrize('partition_by', ['artist', 'date'])
+def test_parquet_round_trip(tmp_path, partition_by):
+    output = ParquetOutput(tmp_path / 'data', partition_by=partition_by)
+    assert len(output.completed()) == 0
+    # The directory alone does not make a resumed run
+    assert output.path.is_dir() and not output.has_rows()
+    output.write(split_df(['ana', 'bob']))
+    assert output.has_rows()
+    output.write(split_df(['cid'], nan_stats=True))
+    assert sorted(output.completed()) == [
+        'https://www.pexels.com/@ana', 'https://www.pexels.com/@bob',
+        'https://www.pexels.com/@cid']
+    df = output.read()
+    assert len(df) == 9
+    assert df.loc['https://www.pexels.com/@bob', 'views'].tolist() == [0, 1000, 2000]
+    assert df.loc['https://www.pexels.com/@cid', 'views'].isna().all()
+    assert not list(tmp_path.glob('data/*/.*'))
+
+
+def test_convert_csv(tmp_path):
+    csv = CsvOutput(tmp_path / 'data.csv')
+    assert not csv.has_rows()
+    csv.write(split_df(['ana']))
+    assert csv.has_rows()
+    csv.write(split_df(['bob']))
+    assert convert_csv(csv.path, tmp_path / 'data', chunksize=2) == 6
+    parquet = ParquetOutput(tmp_path / 'data')
+    assert sorted(parquet.completed()) == sorted(csv.completed())
+    pd.testing.assert_frame_equal(
+        parquet.read().sort_values('content url'),
+        pd.read_csv(csv.path, index_col='artist url').sort_values('content url'),
+        check_dtype=False, check_index_type=False)
+
+
+def test_completion_log(tmp_path):
+    log = completion_log(tmp_path / 'data.csv')
+    assert log.path == tmp_path / 'data.csv.done'
+    assert not log.exists() and len(log.completed()) == 0
+    log.add([])
+    assert log.exists() and len(log.completed()) == 0
+    log.add(['https://www.pexels.com/@ana', 'https://www.pexels.com/@bob'])
+    log.add(['https://www.pexels.com/@ana'])
+    assert sorted(log.completed()) == [
+        'https://www.pexels.com/@ana', 'https://www.pexels.com/@bob']
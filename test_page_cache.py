@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from page_cache import PageCache, parse_ttls
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PageCache(tmp_path / 'cache', evict_every=1)
+    yield cache
+    cache.close()
+
+
+def test_put_and_get(cache):
+    payload = [['p1', 'Title', '12.5K', '1024', '87', 'Uploaded at ...']]
+    cache.put('stats', 'p1', payload)
+    assert cache.get('stats', 'p1') == payload
+    assert cache.get('content', 'p1') is None
+    assert cache.get('stats', 'p2') is None
+
+
+def test_identical_payloads_are_stored_once(cache):
+    cache.put('collections', 'a1', [])
+    cache.put('collections', 'a2', [])
+    assert len(cache) == 2
+    assert len(list(cache.objects.glob('*/*'))) == 1
+    cache.put('collections', 'a1', [['a1', 'A', 'c1']])
+    cache.put('collections', 'a2', [['a2', 'B', 'c2']])
+    assert len(list(cache.objects.glob('*/*'))) == 2
+
+
+def test_ttl_per_stage(tmp_path):
+    cache = PageCache(tmp_path / 'cache', ttls={'stats': 0.05})
+    cache.put('stats', 'p1', [])
+    cache.put('content', 'c1', [])
+    time.sleep(0.1)
+    assert cache.get('stats', 'p1') is None
+    assert cache.get('content', 'c1') == []
+    cache.close()
+
+
+def test_least_recently_used_pages_are_evicted(cache):
+    for i in range(3):
+        cache.put('content', f'c{i}', [['c', 'name', f'p{i}' * 100]])
+    size = cache.size()
+    cache.get('content', 'c0')
+    cache.max_bytes = size
+    cache.put('content', 'c3', [['c', 'name', 'p3' * 100]])
+    assert cache.get('content', 'c1') is None
+    assert cache.get('content', 'c0') is not None
+    assert cache.size() <= size
+
+
+def test_parse_ttls():
+    assert parse_ttls('2') == {'collections': 7200, 'content': 7200,
+                               'stats': 7200}
+    assert parse_ttls('stats=0.5') == {'stats': 1800}
+    with pytest.raises(ValueError):
+        parse_ttls('pages=1')
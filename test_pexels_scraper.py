@@ -41,3 +41,20 @@ def test_get_content_stats(bad_url, nan_stats_df, driver, logger):
     # with pytest.raises(NoSuchElementException):
     df = pexels_scraper.get_content_stats(driver, bad_url)
     assert_frame_equal(df, test_df)
+
+def test_get_content_stats_are_normalised(monkeypatch, logger):
+    from records import StatsRecord
+    import pexels_scraper2
+
+    def get_content_stats(driver, logger, urls):
+        return [[StatsRecord(urls[0], 'Title', '12.5K', '1,024', '3',
+                             'Uploaded at March 14, 2021')]]
+    get_content_stats.record = StatsRecord
+    monkeypatch.setattr(pexels_scraper2, 'get_content_stats',
+                        get_content_stats)
+    pexels_scraper.logger = logger
+    df = pexels_scraper.get_content_stats(None, 'p1')
+    test_df = pd.DataFrame({'title': ['Title'], 'views': [12500],
+                            'downloads': [1024], 'likes': [3],
+                            'upload date': ['2021-03-14']}, index=['p1'])
+    assert_frame_equal(df, test_df)
@@ -0,0 +1,119 @@
+import pytest
+import threading as t
+import pandas as pd
+
+from pipeline import StagePipeline, OUTPUT_COLUMNS
+from driver_pool import DriverPool
+from records import CollectionRecord, ContentRecord, StatsRecord, Failed
+from normalize import normalize_stats
+from memory import MemoryBudget
+
+
+@pytest.fixture
+def drivers(logger):
+    pool = DriverPool(3, lambda logger: object(), [logger] * 3, logger,
+                      rss=lambda driver: 0, n_spares=0)
+    yield pool
+    pool.close()
+
+
+def get_collections_urls(driver, logger, array):
+    return [[CollectionRecord(url, f'{url} name', f'{url}/c{i}')
+             for i in range(2)] for url in array]
+
+
+def get_content_urls(driver, logger, array):
+    return [[ContentRecord(url, f'{url} name', f'{url}/p{i}')
+             for i in range(3)] for url in array]
+
+
+def get_content_stats(driver, logger, array):
+    return [[StatsRecord(url, url, f'{len(url) / 10}K', '1', '2',
+                         'Uploaded at January 1, 2021')]
+            for url in array]
+
+
+def test_pipeline_streams_all_rows(drivers, logger):
+    written = []
+    lock = t.Lock()
+
+    def write(df):
+        with lock:
+            written.append(df)
+
+    completed = []
+
+    def complete(artists_urls):
+        # Every row of the artist is written by then
+        with lock:
+            written_rows = pd.concat(written)
+            for artist_url in artists_urls:
+                assert (written_rows.index == artist_url).sum() == 6
+            completed.extend(artists_urls)
+
+    stages = (get_collections_urls, get_content_urls, get_content_stats)
+    pipeline = StagePipeline(drivers, stages, write, logger, queue_size=2,
+                             batch_size=4,
+                             normalize=lambda df: normalize_stats(df)[0],
+                             complete=complete)
+    assert pipeline.run(['a1', 'a2', 'a3']) == 18
+    assert sorted(completed) == ['a1', 'a2', 'a3']
+    df = pd.concat(written)
+    assert [df.index.name] + list(df.columns) == OUTPUT_COLUMNS
+    assert len(df) == 18
+    assert df['content url'].is_unique
+    row = df[df['content url'] == 'a2/c1/p2'].iloc[0]
+    assert row.name == 'a2'
+    assert row['artist name'] == 'a2 name'
+    assert row['collection url'] == 'a2/c1'
+    assert row['title'] == 'a2/c1/p2'
+    assert row['views'] == 800
+    assert row['upload date'] == '2021-01-01'
+
+
+def test_pipeline_propagates_errors(drivers, logger):
+    def broken_stats(driver, logger, array):
+        raise RuntimeError('broken page')
+
+    stages = (get_collections_urls, get_content_urls, broken_stats)
+    pipeline = StagePipeline(drivers, stages, lambda df: None, logger,
+                             queue_size=1)
+    with pytest.raises(RuntimeError):
+        pipeline.run(['a1', 'a2'])
+
+
+def test_pipeline_finishes_over_memory_budget(drivers, logger):
+    memory = MemoryBudget(100, rss=lambda: 95, host=lambda: 50, interval=0,
+                          max_wait=0.2)
+    written = []
+    stages = (get_collections_urls, get_content_urls, get_content_stats)
+    pipeline = StagePipeline(drivers, stages, written.append, logger,
+                             queue_size=2, memory=memory)
+    assert pipeline.run(['a1', 'a2']) == 12
+    assert sum(len(df) for df in written) == 12
+
+
+def test_pipeline_propagates_writer_errors(drivers, logger):
+    def broken_write(df):
+        raise OSError('disk full')
+
+    stages = (get_collections_urls, get_content_urls, get_content_stats)
+    pipeline = StagePipeline(drivers, stages, broken_write, logger,
+                             queue_size=1, batch_size=1)
+    with pytest.raises(OSError):
+        pipeline.run(['a1', 'a2', 'a3'])
+
+
+def test_pipeline_does_not_complete_failed_artists(drivers, logger):
+    def flaky_content(driver, logger, array):
+        # a2/c1 gave up after a few items
+        return [Failed(records) if url == 'a2/c1' else records
+                for url, records in zip(array, get_content_urls(
+                    driver, logger, array))]
+
+    completed = []
+    stages = (get_collections_urls, flaky_content, get_content_stats)
+    pipeline = StagePipeline(drivers, stages, lambda df: None, logger,
+                             complete=completed.extend)
+    assert pipeline.run(['a1', 'a2', 'a3']) == 18
+    assert sorted(completed) == ['a1', 'a3']
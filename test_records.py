@@ -0,0 +1,25 @@
+import numpy as np
+
+from records import (CollectionRecord, StatsRecord, nan_record, as_columns,
+                     to_frame, from_frame)
+
+
+def test_to_frame_matches_stage_dataframes():
+    records = [CollectionRecord('a1', 'Artist', f'a1/c{i}') for i in range(2)]
+    df = to_frame(CollectionRecord, records)
+    assert df.index.tolist() == ['a1', 'a1']
+    assert df.columns.tolist() == ['artist name', 'collection url']
+    assert from_frame(CollectionRecord, df) == records
+
+
+def test_to_frame_of_no_records_has_the_columns():
+    df = to_frame(StatsRecord, [])
+    assert len(df) == 0
+    assert df.columns.tolist() == ['title', 'views', 'downloads', 'likes',
+                                   'upload date']
+
+
+def test_nan_record():
+    record, = nan_record('p1')
+    assert record.content_url == 'p1'
+    assert all(np.isnan(value) for value in as_columns(record).values())
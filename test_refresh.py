@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from records import StatsRecord, nan_record, to_frame
+from output import CsvOutput, open_snapshots
+from refresh import DAY, known_content, schedule, to_snapshot
+
+
+NOW = 1_700_000_000
+
+
+def crawl(tmp_path, views):
+    output = CsvOutput(tmp_path / 'data.csv')
+    df = pd.DataFrame({
+        'artist url': 'https://www.pexels.com/@jane',
+        'content url': [f'p{i}' for i in range(len(views))],
+        'views': views
+    }).set_index('artist url')
+    output.write(df)
+    return output
+
+
+def stats(urls, views):
+    return pd.DataFrame({'title': 't', 'views': views, 'downloads': 1,
+                         'likes': 1, 'upload date': '2021-03-14'},
+                        index=urls)
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_snapshots_override_the_crawl(tmp_path, output_format):
+    output = crawl(tmp_path, [10, 20, np.nan])
+    snapshots = open_snapshots(tmp_path / 'snapshots', output_format)
+    snapshots.write(to_snapshot(stats(['p0'], [15]), NOW - 2 * DAY))
+    snapshots.write(to_snapshot(
+        pd.concat([stats(['p0'], [50]), to_frame(StatsRecord, nan_record('p1'))]), NOW - DAY))
+    content = known_content(output, snapshots,
+                            lambda urls: pd.Series(NOW - 5 * DAY, index=urls))
+    assert content['views'].fillna(0).tolist() == [50, 20, 0]
+    assert (content['last scraped'] == [NOW - DAY, NOW - 5 * DAY,
+                                         NOW - 5 * DAY]).all()
+
+
+def test_schedule_prefers_stale_and_popular_content():
+    content = pd.DataFrame({
+        'views': [10, 10**6, 10, 10**6, 10],
+        'last scraped': [NOW - 10 * DAY, NOW - 10 * DAY, NOW - 30 * DAY,
+                         NOW - 3600, np.nan]
+    }, index=['old', 'popular', 'older', 'fresh', 'never'])
+    assert schedule(content, 10, NOW) == ['never', 'popular', 'older', 'old']
+    assert schedule(content, 2, NOW) == ['never', 'popular']
+    assert schedule(content, 10, NOW, popularity_weight=0)[:3] == [
+        'never', 'older', 'old']
@@ -0,0 +1,140 @@
+import pytest
+
+from retry import RetryPolicy, CircuitBreaker, retry_call
+
+
+@pytest.fixture
+def policy():
+    return RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01)
+
+
+class Flaky:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, item):
+        self.calls.append(item)
+        if self.calls.count(item) <= self.failures.get(item, 0):
+            raise TimeoutError(item)
+        return item.upper()
+
+
+def test_retries_only_the_failed_item(policy, logger):
+    f = Flaky({'b': 2})
+    results = [retry_call(f, item, policy, CircuitBreaker(), logger, None)
+               for item in 'abc']
+    assert results == ['A', 'B', 'C']
+    assert f.calls == ['a', 'b', 'b', 'b', 'c']
+
+
+def test_gives_up_after_max_attempts(policy, logger):
+    f = Flaky({'b': 10})
+    result = retry_call(f, 'b', policy, CircuitBreaker(), logger,
+                        failed=lambda item, error: f'{item} failed: {error}')
+    assert result == 'b failed: b'
+    assert len(f.calls) == 3
+
+
+def test_unexpected_exceptions_propagate(policy, logger):
+    with pytest.raises(TimeoutError):
+        retry_call(Flaky({'a': 1}), 'a', policy, CircuitBreaker(), logger,
+                   None, exceptions=(KeyError,))
+
+
+def test_backoff_is_exponential_and_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=0.5)
+    assert 0.5 <= policy.delay(1) <= 1
+    assert 2 <= policy.delay(3) <= 4
+    assert 2.5 <= policy.delay(10) <= 5
+
+
+def test_circuit_breaker_opens_and_recovers(logger):
+    breaker = CircuitBreaker(window=4, threshold=0.5, min_calls=4,
+                             cooldown=0.05)
+    for success in (True, False, True, False):
+        breaker.record(success, logger)
+    assert breaker.is_open
+    assert breaker.times_opened == 1
+    breaker.wait()
+    assert not breaker.is_open
+
+
+def test_stats_timeouts_reach_the_shared_retry(monkeypatch, logger):
+    import pexels_scraper2
+    from selenium.common.exceptions import TimeoutException
+
+    waits = []
+
+    class SlowWait:
+        def __init__(self, driver, timeout):
+            pass
+
+        def until(self, condition):
+            waits.append(condition)
+            raise TimeoutException('info button never showed up')
+
+    class Driver:
+        def get(self, url):
+            pass
+
+    breaker = CircuitBreaker(window=4, min_calls=4, cooldown=60)
+    monkeypatch.setattr(pexels_scraper2, 'WebDriverWait', SlowWait)
+    monkeypatch.setattr(pexels_scraper2, 'retry_policy',
+                        RetryPolicy(max_attempts=4, base_delay=0))
+    monkeypatch.setattr(pexels_scraper2, 'circuit_breaker', breaker)
+    record, = pexels_scraper2.get_content_stats(Driver(), logger, ['p1'])[0]
+    # One wait per attempt, no retries nested in the stage function
+    assert len(waits) == 4
+    assert breaker.is_open
+    assert record.content_url == 'p1' and record.views != record.views
+
+
+def test_crashed_drivers_are_replaced_and_the_url_retried(monkeypatch,
+                                                           logger):
+    import pexels_scraper2
+    from selenium.common.exceptions import WebDriverException
+    from backends import ThreadBackend
+    from driver_pool import DriverPool
+    from records import StatsRecord, nan_record
+
+    class Driver:
+        def __init__(self, name):
+            self.name = name
+            self.crashed = False
+
+        def get(self, url):
+            if self.name == 0:
+                self.crashed = True
+            if self.crashed:
+                raise WebDriverException('tab crashed')
+
+        def execute_script(self, script):
+            if self.crashed:
+                raise WebDriverException('chrome not reachable')
+            return 1
+
+    created = []
+
+    def create(logger):
+        created.append(Driver(len(created)))
+        return created[-1]
+
+    @pexels_scraper2.vectorize(stage='stats', record=StatsRecord,
+                               failed=nan_record)
+    def visit(driver, logger, url):
+        driver.get(url)
+        return [StatsRecord(url, driver.name, 1, 2, 3, '2021-03-14')]
+
+    monkeypatch.setattr(pexels_scraper2, 'retry_policy',
+                        RetryPolicy(max_attempts=2, base_delay=0))
+    monkeypatch.setattr(pexels_scraper2, 'circuit_breaker', CircuitBreaker())
+    pool = DriverPool(1, create, [logger], logger, n_spares=0,
+                      is_alive=pexels_scraper2.driver_is_alive,
+                      rss=lambda driver: 0, quit=lambda driver: None)
+    backend = ThreadBackend(pool)
+    record, = backend.map(visit, ['p1'])
+    assert (record.content_url, record.title) == ('p1', 1)
+    assert pool.drivers[0] is created[1]
+    assert pool.stats()['recycles'] == {'crashed': 1}
+    backend.close()
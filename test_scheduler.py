@@ -0,0 +1,101 @@
+import threading as t
+import time
+
+import pytest
+
+from scheduler import Scheduler, CostModel, batches_by_cost
+
+
+def test_results_keep_input_order_and_costly_items_start_first():
+    started = []
+    lock = t.Lock()
+
+    def function(item):
+        with lock:
+            started.append(item)
+        return item * 2
+    sizes = {'a': 5, 'b': 500, 'c': 50}
+    scheduler = Scheduler(1, cost=CostModel(sizes))
+    assert scheduler.map(function, ['a', 'b', 'c', 'd']) == [
+        'aa', 'bb', 'cc', 'dd']
+    assert started == ['b', 'c', 'd', 'a']
+
+
+def test_cost_model_defaults_to_the_median_size():
+    assert CostModel()('x') == 1
+    cost = CostModel({'a': 2, 'b': 10, 'c': 40})
+    assert cost('new') == 10
+    cost.update({'new': 0})
+    assert cost('new') == 1
+    # The cached median follows the sizes
+    assert cost('other') == 6
+    cost.update({'d': 50})
+    assert cost('other') == 10
+
+
+def test_cost_model_loads_known_sizes_on_first_lookup():
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {'a': 2, 'b': 10}
+    cost = CostModel(load=load)
+    cost.update({'b': 30})
+    assert loads == []
+    assert (cost('a'), cost('b'), cost('c')) == (2, 30, 16)
+    assert loads == [1]
+
+
+def test_stragglers_are_reissued():
+    calls = []
+    lock = t.Lock()
+
+    def function(item):
+        with lock:
+            calls.append(item)
+            first_call = calls.count(item) == 1
+        if item == 'slow' and first_call:
+            time.sleep(2)
+            return 'late'
+        time.sleep(0.01)
+        return item
+    scheduler = Scheduler(2, min_straggler_time=0.1)
+    start = time.monotonic()
+    items = ['slow'] + [f'fast-{i}' for i in range(10)]
+    assert scheduler.map(function, items) == items
+    assert time.monotonic() - start < 1
+    assert scheduler.n_speculative == 1
+    assert calls.count('slow') == 2
+
+
+def test_no_speculation():
+    scheduler = Scheduler(2, speculate=False, min_straggler_time=0)
+    assert scheduler.map(lambda item: item, range(5)) == list(range(5))
+    assert scheduler.n_speculative == 0
+
+
+def test_errors_cancel_the_remaining_items():
+    done = []
+
+    def function(item):
+        if item == 3:
+            raise ValueError(item)
+        time.sleep(0.05)
+        done.append(item)
+        return item
+    with pytest.raises(ValueError):
+        Scheduler(2, speculate=False).map(function, range(20))
+    # The item running next to the failed one finishes, nothing else starts
+    n_done = len(done)
+    assert 3 <= n_done <= 5
+    time.sleep(0.2)
+    assert len(done) == n_done
+
+
+def test_batches_by_cost():
+    sizes = {'a': 5, 'b': 500, 'c': 50, 'd': 40, 'e': 10}
+    batches = list(batches_by_cost('abcde', CostModel(sizes), 100))
+    assert batches == [['a'], ['b'], ['c', 'd', 'e']]
+    batches = list(batches_by_cost('abcde', CostModel(sizes), 100,
+                                   min_items=2))
+    assert batches == [['a', 'b'], ['c', 'd', 'e']]
@@ -0,0 +1,88 @@
+import time
+
+from scroll import (ScrollSettings, scroll_to_end, INSTALL_OBSERVER_SCRIPT,
+                    ACTIVITY_SCRIPT, SCROLL_SCRIPT, NUDGE_SCRIPT)
+
+
+class InfiniteList:
+    '''Fake driver for a list that loads `page` items `delay` seconds
+    after each scroll until `total` items are shown. With `stall_after`
+    the list stops loading but keeps a request in flight forever.'''
+
+    def __init__(self, total, page=10, delay=0.05, stall_after=None):
+        self.total = total
+        self.page = page
+        self.delay = delay
+        self.stall_after = stall_after
+        self.items = page
+        self.requested_at = None
+        self.scrolls = 0
+
+    def _load(self):
+        if self.requested_at is None:
+            return 0
+        if self.stall_after is not None and self.items >= self.stall_after:
+            return 1
+        if time.monotonic() - self.requested_at >= self.delay:
+            self.items = min(self.items + self.page, self.total)
+            self.requested_at = None
+            return 0
+        return 1
+
+    def execute_script(self, script):
+        if script == INSTALL_OBSERVER_SCRIPT:
+            return None
+        if script == ACTIVITY_SCRIPT:
+            pending = self._load()
+            return [self.items * 100, pending, self.items, self.items]
+        if script in (SCROLL_SCRIPT, NUDGE_SCRIPT):
+            self.scrolls += 1
+            if self.items < self.total and self.requested_at is None:
+                self.requested_at = time.monotonic()
+            return None
+        raise ValueError(script)
+
+
+def counter(driver):
+    seen = [driver.items]
+
+    def collect():
+        new = driver.items - seen[0]
+        seen[0] = driver.items
+        return new
+    return collect
+
+
+settings = ScrollSettings(poll=0.01, idle=0.1, min_timeout=0.2,
+                          max_timeout=0.5, initial_timeout=0.3)
+
+
+def test_scrolls_until_the_list_is_complete():
+    driver = InfiniteList(total=55)
+    result = scroll_to_end(driver, counter(driver), settings)
+    assert driver.items == 55
+    assert result.complete
+    assert result.reason == 'idle'
+
+
+def test_does_not_wait_a_fixed_second_per_step():
+    driver = InfiniteList(total=200, delay=0.02)
+    result = scroll_to_end(driver, counter(driver), settings)
+    assert result.complete
+    assert result.elapsed < result.steps * 0.5
+
+
+def test_reports_truncated_lists():
+    driver = InfiniteList(total=100, stall_after=30)
+    result = scroll_to_end(driver, counter(driver), settings)
+    assert driver.items == 30
+    assert not result.complete
+    assert result.reason == 'timeout'
+
+
+def test_max_steps():
+    driver = InfiniteList(total=1000, delay=0)
+    result = scroll_to_end(driver, counter(driver),
+                           ScrollSettings(poll=0.01, idle=0.1, max_steps=3))
+    assert not result.complete
+    assert result.reason == 'max steps'